@@ -0,0 +1,41 @@
+-- Migration: Indexes for SQL-side list filters
+-- Date: 2025-11-04
+-- Description: Supports the WHERE clauses built by shared/query_filters.py from
+--              filter_sidebar selections (date range, status, project, role)
+
+-- Work entries: project + date range is the most common combination
+CREATE INDEX IF NOT EXISTS idx_work_entries_project_date
+ON work_entries(project_id, date DESC);
+
+-- Work entries: date range across all projects
+CREATE INDEX IF NOT EXISTS idx_work_entries_date
+ON work_entries(date DESC);
+
+-- Work entries: pending approvals (status filter maps to the approved flag)
+CREATE INDEX IF NOT EXISTS idx_work_entries_pending
+ON work_entries(date DESC)
+WHERE approved IS NOT TRUE;
+
+-- Work entries -> users join for the role filter
+CREATE INDEX IF NOT EXISTS idx_work_entries_user_id
+ON work_entries(user_id);
+
+-- Users: role filter
+CREATE INDEX IF NOT EXISTS idx_users_role
+ON users(role);
+
+-- Projects: status filter, ordered by start date
+CREATE INDEX IF NOT EXISTS idx_projects_status_start_date
+ON projects(status, start_date);
+
+-- Verification
+SELECT indexname, tablename
+FROM pg_indexes
+WHERE indexname IN (
+  'idx_work_entries_project_date',
+  'idx_work_entries_date',
+  'idx_work_entries_pending',
+  'idx_work_entries_user_id',
+  'idx_users_role',
+  'idx_projects_status_start_date'
+);
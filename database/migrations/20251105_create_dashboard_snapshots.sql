@@ -0,0 +1,29 @@
+-- Migration: Create dashboard_snapshots table
+-- Date: 2025-11-05
+-- Description: Precomputed portfolio KPIs for the dashboard. One row per scope
+--              is refreshed by shared/dashboard_snapshot.py so dashboard renders
+--              read a single row instead of running the aggregates each time.
+
+CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+  scope TEXT PRIMARY KEY DEFAULT 'portfolio',
+  metrics JSONB NOT NULL DEFAULT '{}'::jsonb,
+  -- n_tup_ins + n_tup_upd + n_tup_del per source table at refresh time
+  source_versions JSONB NOT NULL DEFAULT '{}'::jsonb,
+  snapshot_date DATE NOT NULL,
+  -- Last full recompute of every KPI / last incremental refresh
+  computed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  refreshed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Supporting indexes for the KPI aggregates
+CREATE INDEX IF NOT EXISTS idx_projects_status
+ON projects(status);
+
+CREATE INDEX IF NOT EXISTS idx_constraints_open
+ON constraints(status)
+WHERE status IN ('identified', 'in_progress');
+
+-- work_entries(date) and the pending-approval index come from
+-- 20251104_add_list_filter_indexes.sql
+
+COMMENT ON TABLE dashboard_snapshots IS 'Precomputed dashboard KPIs, refreshed incrementally from table change counters';
@@ -0,0 +1,20 @@
+-- Migration: Unique (stage_name, material_id) on material_stage_mapping
+-- Date: 2025-11-06
+-- Description: Lets shared/seeds.py insert default mappings with
+--              ON CONFLICT DO NOTHING, so seeding is idempotent
+
+-- Remove duplicates left by earlier seeding, keeping one row per pair
+DELETE FROM material_stage_mapping a
+USING material_stage_mapping b
+WHERE a.stage_name = b.stage_name
+  AND a.material_id = b.material_id
+  AND a.id > b.id;
+
+ALTER TABLE material_stage_mapping
+  DROP CONSTRAINT IF EXISTS uq_material_stage_mapping_stage_material;
+
+ALTER TABLE material_stage_mapping
+  ADD CONSTRAINT uq_material_stage_mapping_stage_material UNIQUE (stage_name, material_id);
+
+-- Seeding also relies on these existing unique keys:
+--   stage_defs(code), users(email)
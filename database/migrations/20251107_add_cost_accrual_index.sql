@@ -0,0 +1,20 @@
+-- Migration: Unique key for accrued daily costs
+-- Date: 2025-11-07
+-- Description: shared/cost_accrual.py writes one costs row per source record
+--              and day. This index makes re-runs and backfills idempotent
+--              (INSERT ... ON CONFLICT DO NOTHING) and serves the watermark
+--              lookup (max(date) over the accrual reference types).
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_costs_accrual_reference_day
+ON costs(reference_type, reference_id, date)
+WHERE reference_type IN (
+  'equipment_assignment',
+  'vehicle_assignment',
+  'facility',
+  'facility_rental',
+  'housing_unit'
+);
+
+-- Per-project cost reports by date
+CREATE INDEX IF NOT EXISTS idx_costs_project_date
+ON costs(project_id, date);
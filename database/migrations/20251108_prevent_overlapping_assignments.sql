@@ -0,0 +1,103 @@
+-- Migration: Prevent overlapping equipment / vehicle assignments
+-- Date: 2025-11-08
+-- Description: Exclusion constraints so an asset cannot be booked twice for
+--              the same time. Windows are half-open [from_ts, to_ts); a NULL
+--              to_ts is an open-ended booking. Columns are timestamp without
+--              time zone, hence tsrange (as in equipment_reservations).
+--              equipment_assignments and asset_assignments are checked per
+--              table; shared/booking_intervals.py checks them together.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+-- Empty or inverted windows fail the CHECK constraints below, and inverted
+-- ones cannot even be turned into ranges for the overlap check, so report
+-- them before building any tsrange
+DO $$
+DECLARE
+  equipment_invalid INTEGER;
+  vehicle_invalid INTEGER;
+  asset_invalid INTEGER;
+BEGIN
+  SELECT COUNT(*) INTO equipment_invalid FROM equipment_assignments WHERE to_ts <= from_ts;
+  SELECT COUNT(*) INTO vehicle_invalid FROM vehicle_assignments WHERE to_ts <= from_ts;
+  SELECT COUNT(*) INTO asset_invalid FROM asset_assignments WHERE to_ts <= from_ts;
+
+  IF equipment_invalid + vehicle_invalid + asset_invalid > 0 THEN
+    RAISE EXCEPTION 'Fix assignments ending at or before their start first (equipment: %, vehicle: %, asset: %)',
+      equipment_invalid, vehicle_invalid, asset_invalid
+      USING HINT = 'Find them with: SELECT id, from_ts, to_ts FROM <table> WHERE to_ts <= from_ts';
+  END IF;
+END $$;
+
+-- Exclusion constraints cannot be added NOT VALID, so stop with a clear
+-- message if existing data already overlaps
+DO $$
+DECLARE
+  equipment_overlaps INTEGER;
+  vehicle_overlaps INTEGER;
+  asset_overlaps INTEGER;
+BEGIN
+  SELECT COUNT(*) INTO equipment_overlaps
+  FROM equipment_assignments a
+  JOIN equipment_assignments b
+    ON a.equipment_id = b.equipment_id AND a.id < b.id
+   AND tsrange(a.from_ts, a.to_ts, '[)') && tsrange(b.from_ts, b.to_ts, '[)');
+
+  SELECT COUNT(*) INTO vehicle_overlaps
+  FROM vehicle_assignments a
+  JOIN vehicle_assignments b
+    ON a.vehicle_id = b.vehicle_id AND a.id < b.id
+   AND tsrange(a.from_ts, a.to_ts, '[)') && tsrange(b.from_ts, b.to_ts, '[)');
+
+  SELECT COUNT(*) INTO asset_overlaps
+  FROM asset_assignments a
+  JOIN asset_assignments b
+    ON a.equipment_id = b.equipment_id AND a.id < b.id
+   AND tsrange(a.from_ts, a.to_ts, '[)') && tsrange(b.from_ts, b.to_ts, '[)');
+
+  IF equipment_overlaps + vehicle_overlaps + asset_overlaps > 0 THEN
+    RAISE EXCEPTION 'Resolve overlapping assignments first (equipment: %, vehicle: %, asset: %)',
+      equipment_overlaps, vehicle_overlaps, asset_overlaps;
+  END IF;
+END $$;
+
+-- Empty or inverted windows would make the ranges invalid
+ALTER TABLE equipment_assignments
+  DROP CONSTRAINT IF EXISTS check_equipment_assignment_window,
+  ADD CONSTRAINT check_equipment_assignment_window CHECK (to_ts IS NULL OR to_ts > from_ts);
+
+ALTER TABLE vehicle_assignments
+  DROP CONSTRAINT IF EXISTS check_vehicle_assignment_window,
+  ADD CONSTRAINT check_vehicle_assignment_window CHECK (to_ts IS NULL OR to_ts > from_ts);
+
+ALTER TABLE asset_assignments
+  DROP CONSTRAINT IF EXISTS check_asset_assignment_window,
+  ADD CONSTRAINT check_asset_assignment_window CHECK (to_ts IS NULL OR to_ts > from_ts);
+
+ALTER TABLE equipment_assignments
+  DROP CONSTRAINT IF EXISTS excl_equipment_assignments_overlap,
+  ADD CONSTRAINT excl_equipment_assignments_overlap EXCLUDE USING gist (
+    equipment_id WITH =,
+    tsrange(from_ts, to_ts, '[)') WITH &&
+  );
+
+ALTER TABLE vehicle_assignments
+  DROP CONSTRAINT IF EXISTS excl_vehicle_assignments_overlap,
+  ADD CONSTRAINT excl_vehicle_assignments_overlap EXCLUDE USING gist (
+    vehicle_id WITH =,
+    tsrange(from_ts, to_ts, '[)') WITH &&
+  );
+
+ALTER TABLE asset_assignments
+  DROP CONSTRAINT IF EXISTS excl_asset_assignments_overlap,
+  ADD CONSTRAINT excl_asset_assignments_overlap EXCLUDE USING gist (
+    equipment_id WITH =,
+    tsrange(from_ts, to_ts, '[)') WITH &&
+  );
+
+-- The constraints' GiST indexes also serve "who is booked between X and Y"
+-- queries of the form: tsrange(from_ts, to_ts, '[)') && tsrange(:x, :y, '[)')
+
+COMMENT ON CONSTRAINT excl_equipment_assignments_overlap ON equipment_assignments IS 'Equipment cannot have overlapping assignments';
+COMMENT ON CONSTRAINT excl_vehicle_assignments_overlap ON vehicle_assignments IS 'Vehicles cannot have overlapping assignments';
+COMMENT ON CONSTRAINT excl_asset_assignments_overlap ON asset_assignments IS 'Equipment cannot have overlapping asset assignments';
@@ -0,0 +1,100 @@
+-- Migration: Partition vehicle_tracking and add latest vehicle positions
+-- Date: 2025-11-09
+-- Description: GPS fixes are bulk-loaded by shared/gps_ingest.py (COPY into a
+--              staging table, then one INSERT ... SELECT). vehicle_tracking is
+--              rebuilt as a table range-partitioned by month on "timestamp"
+--              with a unique (vehicle_id, timestamp) index; re-sent fixes
+--              are dropped by ON CONFLICT and old months can be detached
+--              or dropped whole. vehicle_positions keeps the latest fix
+--              per vehicle.
+
+-- Move the unpartitioned table aside (skipped if already partitioned)
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'public.vehicle_tracking'::regclass
+  ) THEN
+    ALTER TABLE vehicle_tracking RENAME TO vehicle_tracking_legacy;
+    ALTER TABLE vehicle_tracking_legacy RENAME CONSTRAINT vehicle_tracking_pkey TO vehicle_tracking_legacy_pkey;
+    DROP INDEX IF EXISTS idx_vehicle_tracking_vehicle_id;
+  END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS vehicle_tracking (
+  id UUID NOT NULL DEFAULT gen_random_uuid(),
+  vehicle_id UUID NOT NULL REFERENCES vehicles(id),
+  "timestamp" TIMESTAMP NOT NULL,
+  lat NUMERIC(10,7),
+  lon NUMERIC(10,7),
+  -- Keys of a partitioned table must include the partition column
+  CONSTRAINT vehicle_tracking_pkey PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+
+-- Track of a vehicle over a time window; also the ON CONFLICT target
+CREATE UNIQUE INDEX IF NOT EXISTS uq_vehicle_tracking_vehicle_timestamp
+ON vehicle_tracking(vehicle_id, "timestamp");
+
+-- Monthly partitions (vehicle_tracking_YYYY_MM) covering [from_ts, to_ts].
+-- Called by the ingestion job for the months of each batch.
+CREATE OR REPLACE FUNCTION ensure_vehicle_tracking_partitions(from_ts TIMESTAMP, to_ts TIMESTAMP)
+RETURNS void AS $$
+DECLARE
+  month_start TIMESTAMP := date_trunc('month', from_ts);
+BEGIN
+  WHILE month_start <= to_ts LOOP
+    BEGIN
+      EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF vehicle_tracking FOR VALUES FROM (%L) TO (%L)',
+        'vehicle_tracking_' || to_char(month_start, 'YYYY_MM'),
+        month_start,
+        month_start + INTERVAL '1 month'
+      );
+    EXCEPTION WHEN duplicate_table THEN
+      -- Created concurrently by another ingestion run
+      NULL;
+    END;
+    month_start := month_start + INTERVAL '1 month';
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Partitions for the current and next month, then carry over the old fixes
+SELECT ensure_vehicle_tracking_partitions(date_trunc('month', NOW())::timestamp, (NOW() + INTERVAL '1 month')::timestamp);
+
+DO $$
+DECLARE
+  first_fix TIMESTAMP;
+  last_fix TIMESTAMP;
+BEGIN
+  IF to_regclass('public.vehicle_tracking_legacy') IS NOT NULL THEN
+    SELECT MIN("timestamp"), MAX("timestamp") INTO first_fix, last_fix FROM vehicle_tracking_legacy;
+    IF first_fix IS NOT NULL THEN
+      PERFORM ensure_vehicle_tracking_partitions(first_fix, last_fix);
+    END IF;
+
+    INSERT INTO vehicle_tracking (id, vehicle_id, "timestamp", lat, lon)
+    SELECT id, vehicle_id, "timestamp", lat, lon FROM vehicle_tracking_legacy
+    ON CONFLICT DO NOTHING;
+
+    DROP TABLE vehicle_tracking_legacy;
+  END IF;
+END $$;
+
+-- Latest fix per vehicle, upserted by every ingestion batch
+CREATE TABLE IF NOT EXISTS vehicle_positions (
+  vehicle_id UUID PRIMARY KEY REFERENCES vehicles(id) ON DELETE CASCADE,
+  "timestamp" TIMESTAMP NOT NULL,
+  lat NUMERIC(10,7) NOT NULL,
+  lon NUMERIC(10,7) NOT NULL,
+  updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO vehicle_positions (vehicle_id, "timestamp", lat, lon)
+SELECT DISTINCT ON (vehicle_id) vehicle_id, "timestamp", lat, lon
+FROM vehicle_tracking
+WHERE lat IS NOT NULL AND lon IS NOT NULL
+ORDER BY vehicle_id, "timestamp" DESC
+ON CONFLICT (vehicle_id) DO NOTHING;
+
+COMMENT ON TABLE vehicle_tracking IS 'GPS fixes, range-partitioned by month on timestamp';
+COMMENT ON TABLE vehicle_positions IS 'Latest GPS fix per vehicle, maintained by the ingestion job';
@@ -0,0 +1,27 @@
+-- Migration: Create vehicle_trips table
+-- Date: 2025-11-10
+-- Description: Trips segmented from vehicle_tracking by shared/trajectories.py.
+--              Each row has the trip's haversine distance and a
+--              Douglas-Peucker simplified polyline, so map views and mileage
+--              reports read a few hundred points instead of every raw fix.
+
+CREATE TABLE IF NOT EXISTS vehicle_trips (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  vehicle_id UUID NOT NULL REFERENCES vehicles(id) ON DELETE CASCADE,
+  started_at TIMESTAMP NOT NULL,
+  ended_at TIMESTAMP NOT NULL,
+  distance_km NUMERIC(10,3) NOT NULL,
+  fix_count INTEGER NOT NULL,
+  -- [[lat, lon], ...]
+  polyline JSONB NOT NULL DEFAULT '[]'::jsonb,
+  created_at TIMESTAMP DEFAULT NOW(),
+  CONSTRAINT uq_vehicle_trips_vehicle_started_at UNIQUE (vehicle_id, started_at),
+  CONSTRAINT check_vehicle_trip_window CHECK (ended_at >= started_at)
+);
+
+-- The unique constraint's (vehicle_id, started_at) index serves per-vehicle
+-- day views; this one the processing watermark (max ended_at per vehicle)
+CREATE INDEX IF NOT EXISTS idx_vehicle_trips_vehicle_ended_at
+ON vehicle_trips(vehicle_id, ended_at);
+
+COMMENT ON TABLE vehicle_trips IS 'Vehicle trips with simplified polylines, derived from vehicle_tracking';
@@ -0,0 +1,84 @@
+-- Migration: Spatial columns for houses, cabinets, facilities, segments, constraints
+-- Date: 2025-11-11
+-- Description: The JSONB geometries (geom_point, geom_line, geom) get a
+--              generated PostGIS geography column "geog" with a GiST index,
+--              so shared/spatial.py can answer nearest / within-radius /
+--              intersects queries in the database. Skipped with a notice
+--              where PostGIS is not available; shared/spatial.py then falls
+--              back to an in-process grid index.
+--
+-- Accepted JSONB shapes (same as shared/spatial.py parse_geometry):
+--   {"lat": .., "lng": ..} (or "lon")        point
+--   GeoJSON geometry or Feature               [lon, lat] order
+--   {"coordinates": [[lon, lat], ...]}        line (segments)
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'postgis') THEN
+    RAISE NOTICE 'PostGIS is not available; spatial columns not created';
+    RETURN;
+  END IF;
+
+  CREATE EXTENSION IF NOT EXISTS postgis;
+
+  -- PostGIS may live in the "extensions" schema (Supabase); resolve its types
+  -- for the rest of this block
+  PERFORM set_config('search_path', 'public, extensions', true);
+
+  -- Generated columns need an immutable expression; malformed JSON yields NULL
+  -- instead of failing the application's write. The search_path is pinned so
+  -- ST_* resolve under any caller (pg_restore runs with an empty one), and
+  -- only data errors are caught: a missing function must fail loudly rather
+  -- than silently turn every geog into NULL.
+  EXECUTE $fn$
+    CREATE OR REPLACE FUNCTION cometa_jsonb_to_geography(value JSONB)
+    RETURNS geography AS $body$
+    BEGIN
+      IF value IS NULL OR jsonb_typeof(value) <> 'object' THEN
+        RETURN NULL;
+      END IF;
+      IF value ? 'lat' THEN
+        RETURN ST_SetSRID(ST_MakePoint(
+          COALESCE(value->>'lng', value->>'lon')::float8,
+          (value->>'lat')::float8
+        ), 4326)::geography;
+      END IF;
+      IF value->>'type' = 'Feature' THEN
+        value := value->'geometry';
+      END IF;
+      IF value ? 'type' THEN
+        RETURN ST_SetSRID(ST_GeomFromGeoJSON(value::text), 4326)::geography;
+      END IF;
+      IF value ? 'coordinates' THEN
+        RETURN ST_SetSRID(ST_GeomFromGeoJSON(
+          jsonb_build_object('type', 'LineString', 'coordinates', value->'coordinates')::text
+        ), 4326)::geography;
+      END IF;
+      RETURN NULL;
+    EXCEPTION
+      -- Bad numbers and coordinates (class 22); PostGIS reports malformed
+      -- GeoJSON as internal_error
+      WHEN data_exception OR internal_error THEN
+        RETURN NULL;
+    END;
+    $body$ LANGUAGE plpgsql IMMUTABLE
+    SET search_path = public, extensions
+  $fn$;
+
+  ALTER TABLE houses ADD COLUMN IF NOT EXISTS geog geography
+    GENERATED ALWAYS AS (cometa_jsonb_to_geography(geom_point)) STORED;
+  ALTER TABLE cabinets ADD COLUMN IF NOT EXISTS geog geography
+    GENERATED ALWAYS AS (cometa_jsonb_to_geography(geom_point)) STORED;
+  ALTER TABLE facilities ADD COLUMN IF NOT EXISTS geog geography
+    GENERATED ALWAYS AS (cometa_jsonb_to_geography(geom_point)) STORED;
+  ALTER TABLE segments ADD COLUMN IF NOT EXISTS geog geography
+    GENERATED ALWAYS AS (cometa_jsonb_to_geography(geom_line)) STORED;
+  ALTER TABLE constraints ADD COLUMN IF NOT EXISTS geog geography
+    GENERATED ALWAYS AS (cometa_jsonb_to_geography(geom)) STORED;
+
+  CREATE INDEX IF NOT EXISTS idx_houses_geog ON houses USING gist (geog);
+  CREATE INDEX IF NOT EXISTS idx_cabinets_geog ON cabinets USING gist (geog);
+  CREATE INDEX IF NOT EXISTS idx_facilities_geog ON facilities USING gist (geog);
+  CREATE INDEX IF NOT EXISTS idx_segments_geog ON segments USING gist (geog);
+  CREATE INDEX IF NOT EXISTS idx_constraints_geog ON constraints USING gist (geog);
+END $$;
@@ -0,0 +1,26 @@
+-- Migration: Create photo_location_checks table
+-- Date: 2025-11-12
+-- Description: Precomputed GPS plausibility per photo, written by the batch
+--              job in shared/photo_location.py. Distance is measured from the
+--              photo's GPS fix to its work entry's house point, segment line
+--              (directly or via the cut) or cabinet point. Approval screens
+--              read the status instead of computing geometry on each render.
+
+CREATE TABLE IF NOT EXISTS photo_location_checks (
+  photo_id UUID PRIMARY KEY REFERENCES photos(id) ON DELETE CASCADE,
+  status TEXT NOT NULL,
+  reference_type TEXT,
+  reference_id UUID,
+  distance_m NUMERIC(10,1),
+  threshold_m NUMERIC(10,1) NOT NULL,
+  checked_at TIMESTAMP NOT NULL DEFAULT NOW(),
+  CONSTRAINT check_photo_location_status CHECK (status IN ('ok','outlier','no_gps','no_reference')),
+  CONSTRAINT check_photo_location_reference CHECK (reference_type IS NULL OR reference_type IN ('house','segment','cabinet'))
+);
+
+-- Approval queue: flagged photos
+CREATE INDEX IF NOT EXISTS idx_photo_location_checks_outlier
+ON photo_location_checks(checked_at)
+WHERE status = 'outlier';
+
+COMMENT ON TABLE photo_location_checks IS 'Precomputed photo GPS plausibility against the work entry location';
@@ -0,0 +1,47 @@
+-- Migration: Document expiry scanning
+-- Date: 2025-11-13
+-- Description: Support for the incremental expiry scanner in
+--              shared/document_expiry.py. Each daily run reads only
+--              documents whose reminder dates fall between the last scanned
+--              day and today (range scans on expiry_date), plus documents
+--              changed since the last run. Unique keys make reminders and
+--              notifications idempotent.
+
+CREATE INDEX IF NOT EXISTS idx_worker_documents_expiry_date
+ON worker_documents(expiry_date)
+WHERE expiry_date IS NOT NULL;
+
+-- Documents uploaded or renewed since the last run
+CREATE INDEX IF NOT EXISTS idx_worker_documents_changed_at
+ON worker_documents((COALESCE(updated_at, created_at)));
+
+-- High-water mark per scanner
+CREATE TABLE IF NOT EXISTS document_expiry_scans (
+  scanner TEXT PRIMARY KEY DEFAULT 'worker_documents',
+  scanned_through DATE NOT NULL,
+  -- NULL until the first run, which checks every document once
+  last_run_at TIMESTAMP
+);
+
+-- One reminder per document, milestone and expiry date
+DELETE FROM document_reminders a
+USING document_reminders b
+WHERE a.document_id = b.document_id
+  AND a.reminder_type IS NOT DISTINCT FROM b.reminder_type
+  AND a.days_before_expiry IS NOT DISTINCT FROM b.days_before_expiry
+  AND a.reminder_date = b.reminder_date
+  AND a.id > b.id;
+
+ALTER TABLE document_reminders
+  DROP CONSTRAINT IF EXISTS uq_document_reminders_dedup,
+  ADD CONSTRAINT uq_document_reminders_dedup
+  UNIQUE (document_id, reminder_type, days_before_expiry, reminder_date);
+
+-- Generated notifications carry a dedup key
+ALTER TABLE in_app_notifications ADD COLUMN IF NOT EXISTS dedup_key TEXT;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_in_app_notifications_dedup_key
+ON in_app_notifications(dedup_key)
+WHERE dedup_key IS NOT NULL;
+
+COMMENT ON TABLE document_expiry_scans IS 'High-water mark of the document expiry scanner';
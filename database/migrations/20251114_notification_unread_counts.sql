@@ -0,0 +1,125 @@
+-- Migration: Notification unread counters
+-- Date: 2025-11-14
+-- Description: Per-user unread counters for in_app_notifications, used by
+--              shared/notifications.py for the notification bell instead of
+--              a COUNT(*) per page view. Statement-level triggers with
+--              transition tables apply one aggregated delta per user and
+--              statement, so bulk fan-out, mark-all-read and purges update
+--              each counter once.
+
+-- is_read is two-valued from here on
+UPDATE in_app_notifications SET is_read = false WHERE is_read IS NULL;
+ALTER TABLE in_app_notifications ALTER COLUMN is_read SET DEFAULT false;
+ALTER TABLE in_app_notifications ALTER COLUMN is_read SET NOT NULL;
+
+-- Mark-all-read and counter rebuilds touch only unread rows
+CREATE INDEX IF NOT EXISTS idx_in_app_notifications_unread
+ON in_app_notifications(user_id)
+WHERE NOT is_read;
+
+-- Batched purge of expired notifications
+CREATE INDEX IF NOT EXISTS idx_in_app_notifications_expires_at
+ON in_app_notifications(expires_at)
+WHERE expires_at IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS notification_unread_counts (
+  user_id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+  unread_count INTEGER NOT NULL DEFAULT 0,
+  updated_at TIMESTAMP DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION update_notification_unread_counts()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO notification_unread_counts (user_id, unread_count, updated_at)
+    SELECT user_id, count(*), now()
+    FROM new_rows
+    WHERE NOT is_read
+    GROUP BY user_id
+    ORDER BY user_id
+    ON CONFLICT (user_id) DO UPDATE
+    SET unread_count = notification_unread_counts.unread_count + EXCLUDED.unread_count,
+        updated_at = EXCLUDED.updated_at;
+
+  ELSIF TG_OP = 'DELETE' THEN
+    UPDATE notification_unread_counts c
+    SET unread_count = GREATEST(c.unread_count - d.removed, 0),
+        updated_at = now()
+    FROM (
+      SELECT user_id, count(*) AS removed
+      FROM old_rows
+      WHERE NOT is_read
+      GROUP BY user_id
+    ) d
+    WHERE c.user_id = d.user_id;
+
+  ELSE
+    -- Net change per user (rows marked read or unread, or moved between users)
+    WITH delta AS (
+      SELECT user_id, sum(delta) AS delta
+      FROM (
+        SELECT user_id, 1 AS delta FROM new_rows WHERE NOT is_read
+        UNION ALL
+        SELECT user_id, -1 AS delta FROM old_rows WHERE NOT is_read
+      ) changes
+      GROUP BY user_id
+      HAVING sum(delta) <> 0
+    ), increased AS (
+      INSERT INTO notification_unread_counts (user_id, unread_count, updated_at)
+      SELECT user_id, delta, now()
+      FROM delta
+      WHERE delta > 0
+      ORDER BY user_id
+      ON CONFLICT (user_id) DO UPDATE
+      SET unread_count = notification_unread_counts.unread_count + EXCLUDED.unread_count,
+          updated_at = EXCLUDED.updated_at
+    )
+    UPDATE notification_unread_counts c
+    SET unread_count = GREATEST(c.unread_count + d.delta, 0),
+        updated_at = now()
+    FROM delta d
+    WHERE c.user_id = d.user_id AND d.delta < 0;
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow one event per trigger
+DROP TRIGGER IF EXISTS in_app_notifications_unread_insert ON in_app_notifications;
+CREATE TRIGGER in_app_notifications_unread_insert
+  AFTER INSERT ON in_app_notifications
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION update_notification_unread_counts();
+
+DROP TRIGGER IF EXISTS in_app_notifications_unread_update ON in_app_notifications;
+CREATE TRIGGER in_app_notifications_unread_update
+  AFTER UPDATE ON in_app_notifications
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION update_notification_unread_counts();
+
+DROP TRIGGER IF EXISTS in_app_notifications_unread_delete ON in_app_notifications;
+CREATE TRIGGER in_app_notifications_unread_delete
+  AFTER DELETE ON in_app_notifications
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION update_notification_unread_counts();
+
+-- Initial counts; writes are blocked until the counters match the table
+DO $$
+BEGIN
+  LOCK TABLE in_app_notifications IN SHARE ROW EXCLUSIVE MODE;
+
+  INSERT INTO notification_unread_counts (user_id, unread_count, updated_at)
+  SELECT user_id, count(*) FILTER (WHERE NOT is_read), now()
+  FROM in_app_notifications
+  GROUP BY user_id
+  ON CONFLICT (user_id) DO UPDATE
+  SET unread_count = EXCLUDED.unread_count,
+      updated_at = EXCLUDED.updated_at;
+END $$;
+
+COMMENT ON TABLE notification_unread_counts IS 'Unread in_app_notifications per user, maintained by triggers';
@@ -0,0 +1,29 @@
+-- Migration: Ingestion watermark for trip processing
+-- Date: 2025-11-15
+-- Description: GPS batches may carry fixes older than trips already built
+--              (trackers buffering while offline). vehicle_tracking records
+--              when each fix was ingested, and shared/trajectories.py keeps a
+--              per-vehicle ingestion high-water mark, so late fixes are found
+--              and the trips they fall into are rebuilt with the mileage
+--              corrected.
+
+-- Existing fixes count as ingested now; they are already covered by trips
+ALTER TABLE vehicle_tracking
+  ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT (now() AT TIME ZONE 'utc');
+
+CREATE INDEX IF NOT EXISTS idx_vehicle_tracking_vehicle_created_at
+ON vehicle_tracking(vehicle_id, created_at);
+
+CREATE TABLE IF NOT EXISTS vehicle_trip_scans (
+  vehicle_id UUID PRIMARY KEY REFERENCES vehicles(id) ON DELETE CASCADE,
+  -- NULL until the first run, which segments all of the vehicle's fixes
+  ingested_through TIMESTAMP
+);
+
+-- Vehicles with trips start from the migration time instead of rescanning
+INSERT INTO vehicle_trip_scans (vehicle_id, ingested_through)
+SELECT DISTINCT vehicle_id, now() AT TIME ZONE 'utc'
+FROM vehicle_trips
+ON CONFLICT (vehicle_id) DO NOTHING;
+
+COMMENT ON TABLE vehicle_trip_scans IS 'Latest vehicle_tracking.created_at already segmented into trips, per vehicle';
@@ -0,0 +1,52 @@
+-- Migration: Dashboard source table versions
+-- Date: 2025-11-16
+-- Description: shared/dashboard_snapshot.py decided which KPIs to recompute
+--              from pg_stat_user_tables counters, which are collected
+--              asynchronously and can trail a commit. Statement-level
+--              triggers on the KPI source tables now bump a per-table
+--              version in the writing transaction, so a change is visible
+--              to the refresher exactly when it commits.
+
+CREATE TABLE IF NOT EXISTS dashboard_source_versions (
+  table_name TEXT PRIMARY KEY,
+  version BIGINT NOT NULL DEFAULT 0,
+  changed_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+);
+
+CREATE OR REPLACE FUNCTION bump_dashboard_source_version()
+RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO dashboard_source_versions (table_name, version, changed_at)
+  VALUES (TG_TABLE_NAME, 1, now() AT TIME ZONE 'utc')
+  ON CONFLICT (table_name) DO UPDATE
+  SET version = dashboard_source_versions.version + 1,
+      changed_at = EXCLUDED.changed_at;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Source tables of the KPIs in shared/dashboard_snapshot.py; once per
+-- statement, so bulk writes bump the version once
+DO $$
+DECLARE
+  source_table TEXT;
+BEGIN
+  FOREACH source_table IN ARRAY ARRAY['projects', 'work_entries', 'company_warehouse', 'constraints']
+  LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', source_table || '_dashboard_version', source_table);
+    EXECUTE format(
+      'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+      'FOR EACH STATEMENT EXECUTE FUNCTION bump_dashboard_source_version()',
+      source_table || '_dashboard_version', source_table
+    );
+    INSERT INTO dashboard_source_versions (table_name)
+    VALUES (source_table)
+    ON CONFLICT (table_name) DO NOTHING;
+  END LOOP;
+END $$;
+
+-- Snapshots stored pg_stat counters; clearing them forces one full recompute
+UPDATE dashboard_snapshots SET source_versions = '{}'::jsonb;
+
+COMMENT ON COLUMN dashboard_snapshots.source_versions IS 'dashboard_source_versions.version per source table at refresh time';
+COMMENT ON TABLE dashboard_source_versions IS 'Per-table write version of the dashboard KPI sources, bumped by triggers';
@@ -0,0 +1,176 @@
+"""
+Booking interval index for COMETA
+In-memory centered interval tree over equipment and vehicle assignments for
+batch planning: overlap and "which assets are free between X and Y" queries in
+O(log n + k). The database enforces the same rule with exclusion constraints.
+"""
+
+import logging
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+try:
+    from .models import EquipmentAssignment, VehicleAssignment, AssetAssignment
+except ImportError:
+    from models import EquipmentAssignment, VehicleAssignment, AssetAssignment
+
+logger = logging.getLogger(__name__)
+
+# Open-ended assignments (to_ts NULL) run until this
+OPEN_END = datetime.max
+
+
+@dataclass(frozen=True)
+class Booking:
+    """Half-open booking window [start, end) of one asset"""
+    asset_id: Hashable
+    start: datetime
+    end: datetime
+    ref: Any = None  # Source record (e.g. assignment id)
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        return self.start < end and start < self.end
+
+
+class _Node:
+    __slots__ = ('center', 'by_start', 'starts', 'by_end', 'left', 'right')
+
+    def __init__(self, center, bookings: List[Booking], left, right):
+        self.center = center
+        self.by_start = sorted(bookings, key=lambda b: b.start)
+        self.starts = [b.start for b in self.by_start]
+        self.by_end = sorted(bookings, key=lambda b: b.end, reverse=True)
+        self.left = left
+        self.right = right
+
+
+def _build(bookings: List[Booking]) -> Optional[_Node]:
+    if not bookings:
+        return None
+    # The median start lies inside at least one booking, so no node is empty
+    starts = sorted(b.start for b in bookings)
+    center = starts[len(starts) // 2]
+
+    left, here, right = [], [], []
+    for booking in bookings:
+        if booking.end <= center:
+            left.append(booking)
+        elif booking.start > center:
+            right.append(booking)
+        else:
+            here.append(booking)
+    return _Node(center, here, _build(left), _build(right))
+
+
+class IntervalTree:
+    """Static centered interval tree of bookings"""
+
+    def __init__(self, bookings: Iterable[Booking] = ()):
+        bookings = [b for b in bookings if b.start < b.end]
+        self.size = len(bookings)
+        self._root = _build(bookings)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Booking]:
+        """All bookings overlapping [start, end)"""
+        found: List[Booking] = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if end <= node.center:
+                # Query lies left of the center: node bookings match if they start before `end`
+                found.extend(node.by_start[:bisect_left(node.starts, end)])
+                stack.append(node.left)
+            elif start > node.center:
+                # Query lies right of the center: node bookings match if they end after `start`
+                for booking in node.by_end:
+                    if booking.end <= start:
+                        break
+                    found.append(booking)
+                stack.append(node.right)
+            else:
+                # Query contains the center: every node booking matches
+                found.extend(node.by_start)
+                stack.append(node.left)
+                stack.append(node.right)
+        return found
+
+    def busy_assets(self, start: datetime, end: datetime) -> set:
+        return {booking.asset_id for booking in self.overlapping(start, end)}
+
+    def free_assets(self, asset_ids: Iterable[Hashable], start: datetime, end: datetime) -> List[Hashable]:
+        """Assets from asset_ids without a booking overlapping [start, end)"""
+        busy = self.busy_assets(start, end)
+        return [asset_id for asset_id in asset_ids if asset_id not in busy]
+
+
+def find_conflicts(existing: IntervalTree, proposed: Sequence[Booking]) -> List[Tuple[Booking, Booking]]:
+    """
+    Conflicts of a batch plan: proposed vs. existing bookings and proposed
+    bookings among themselves (sort-and-sweep per asset)
+    """
+    conflicts = []
+    for booking in proposed:
+        for other in existing.overlapping(booking.start, booking.end):
+            if other.asset_id == booking.asset_id:
+                conflicts.append((booking, other))
+
+    by_asset: Dict[Hashable, List[Booking]] = {}
+    for booking in proposed:
+        by_asset.setdefault(booking.asset_id, []).append(booking)
+    for bookings in by_asset.values():
+        bookings.sort(key=lambda b: b.start)
+        active: List[Booking] = []
+        for booking in bookings:
+            active = [b for b in active if b.end > booking.start]
+            conflicts.extend((booking, other) for other in active)
+            active.append(booking)
+    return conflicts
+
+
+def _bookings(session: Session, asset_column, model, start: Optional[datetime], end: Optional[datetime]) -> List[Booking]:
+    stmt = select(asset_column, model.from_ts, model.to_ts, model.id)
+    if end is not None:
+        stmt = stmt.where(model.from_ts < end)
+    if start is not None:
+        stmt = stmt.where(or_(model.to_ts.is_(None), model.to_ts > start))
+    return [
+        Booking(asset_id, from_ts, to_ts or OPEN_END, ref)
+        for asset_id, from_ts, to_ts, ref in session.execute(stmt)
+    ]
+
+
+def load_equipment_bookings(session: Session, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> IntervalTree:
+    """
+    Equipment bookings from both equipment_assignments and asset_assignments
+    (which the per-table database constraints cannot check against each other)
+    """
+    bookings = _bookings(session, EquipmentAssignment.equipment_id, EquipmentAssignment, start, end)
+    bookings += _bookings(session, AssetAssignment.equipment_id, AssetAssignment, start, end)
+    return IntervalTree(bookings)
+
+
+def load_vehicle_bookings(session: Session, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None) -> IntervalTree:
+    """Vehicle bookings, optionally restricted to a planning horizon"""
+    return IntervalTree(_bookings(session, VehicleAssignment.vehicle_id, VehicleAssignment, start, end))
+
+
+__all__ = [
+    'Booking',
+    'IntervalTree',
+    'find_conflicts',
+    'load_equipment_bookings',
+    'load_vehicle_bookings',
+    'OPEN_END'
+]
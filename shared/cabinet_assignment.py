@@ -0,0 +1,262 @@
+"""
+Bulk house to cabinet assignment for COMETA
+Plans cabinet assignments for all unassigned houses of a project in one
+nearest-neighbour pass (KD-tree over the project's cabinets), optionally
+respecting per-cabinet capacities. The plan can be reviewed before it is
+written with a single UPDATE.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import column, func, select, update, values
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session
+
+# Optional SciPy KD-tree; a chunked NumPy search is used without it
+try:
+    from scipy.spatial import cKDTree
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+try:
+    from .models import House, Cabinet
+    from .spatial import parse_geometry, project_to_meters
+except ImportError:
+    from models import House, Cabinet
+    from spatial import parse_geometry, project_to_meters
+
+logger = logging.getLogger(__name__)
+
+# Nearest cabinets considered per house when capacities apply
+CANDIDATES_PER_HOUSE = 8
+# Houses per block in the NumPy fallback (bounds the distance matrix size)
+NUMPY_CHUNK_SIZE = 2048
+
+ASSIGNMENT_COLUMNS = ['house_id', 'address', 'house_number', 'cabinet_id', 'cabinet_code', 'distance_m']
+UNASSIGNED_COLUMNS = ['house_id', 'address', 'house_number', 'reason']
+
+
+@dataclass
+class AssignmentPlan:
+    """Proposed assignments of one project, not yet written"""
+    project_id: Any
+    assignments: pd.DataFrame
+    unassigned: pd.DataFrame
+
+    @property
+    def is_empty(self) -> bool:
+        return self.assignments.empty
+
+    def summary(self) -> pd.DataFrame:
+        """Houses and distance statistics per cabinet"""
+        return self.assignments.groupby(['cabinet_id', 'cabinet_code'], dropna=False).agg(
+            houses=('house_id', 'size'),
+            mean_distance_m=('distance_m', 'mean'),
+            max_distance_m=('distance_m', 'max')
+        ).reset_index()
+
+
+def k_nearest(cabinet_xy: np.ndarray, house_xy: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    k nearest cabinets per house
+
+    Returns (distances, indices), both shaped (houses, k) and ordered nearest
+    first.
+    """
+    k = min(k, len(cabinet_xy))
+    if HAS_SCIPY:
+        distances, indices = cKDTree(cabinet_xy).query(house_xy, k=k)
+        return distances.reshape(len(house_xy), k), indices.reshape(len(house_xy), k)
+
+    distances = np.empty((len(house_xy), k))
+    indices = np.empty((len(house_xy), k), dtype='int64')
+    for start in range(0, len(house_xy), NUMPY_CHUNK_SIZE):
+        block = house_xy[start:start + NUMPY_CHUNK_SIZE]
+        matrix = np.hypot(block[:, None, 0] - cabinet_xy[None, :, 0], block[:, None, 1] - cabinet_xy[None, :, 1])
+        nearest = np.argpartition(matrix, k - 1, axis=1)[:, :k] if k < len(cabinet_xy) else np.tile(
+            np.arange(len(cabinet_xy)), (len(block), 1))
+        nearest_distances = np.take_along_axis(matrix, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        indices[start:start + len(block)] = np.take_along_axis(nearest, order, axis=1)
+        distances[start:start + len(block)] = np.take_along_axis(nearest_distances, order, axis=1)
+    return distances, indices
+
+
+def greedy_assign(distances: np.ndarray, indices: np.ndarray, remaining: np.ndarray) -> np.ndarray:
+    """
+    Capacity-constrained assignment from k-nearest candidates
+
+    Candidate pairs are taken shortest first; a house gets the first cabinet
+    that still has room; infinite distances (out of range) are never taken.
+    Returns the cabinet index per house (-1 if none of its candidates had
+    room). `remaining` is updated in place.
+    """
+    assigned = np.full(len(distances), -1, dtype='int64')
+    houses, ranks = np.unravel_index(np.argsort(distances, axis=None, kind='stable'), distances.shape)
+    for house, rank in zip(houses, ranks):
+        if not np.isfinite(distances[house, rank]):
+            break
+        cabinet = indices[house, rank]
+        if assigned[house] < 0 and remaining[cabinet] > 0:
+            assigned[house] = cabinet
+            remaining[cabinet] -= 1
+    return assigned
+
+
+def _points(rows) -> Tuple[list, np.ndarray]:
+    """Rows of (id, geometry, ...) with a parseable geometry, and their (lat, lon)"""
+    kept, coords = [], []
+    for row in rows:
+        geometry = parse_geometry(row[1])
+        if geometry is not None:
+            kept.append(row)
+            coords.append(geometry[1].mean(axis=0))
+    return kept, np.array(coords).reshape(-1, 2)
+
+
+def plan_cabinet_assignment(session: Session, project_id,
+                            capacities: Optional[Dict[Any, int]] = None,
+                            max_distance_m: Optional[float] = None) -> AssignmentPlan:
+    """
+    Plan the nearest cabinet for every unassigned house of a project
+
+    Args:
+        session: Database session
+        project_id: Project whose houses to assign
+        capacities: Optional maximum number of houses per cabinet id;
+            houses already assigned count against it. Cabinets missing from
+            the mapping are unlimited.
+        max_distance_m: Leave houses farther than this from every cabinet
+            (with room) unassigned
+
+    Returns:
+        AssignmentPlan with the proposed and the unassignable houses
+    """
+    cabinets, cabinet_coords = _points(session.execute(
+        select(Cabinet.id, Cabinet.geom_point, Cabinet.code).where(Cabinet.project_id == project_id)
+    ).all())
+    house_rows = session.execute(
+        select(House.id, House.geom_point, House.address, House.house_number).where(
+            House.project_id == project_id,
+            House.cabinet_id.is_(None)
+        )
+    ).all()
+    houses, house_coords = _points(house_rows)
+
+    located = {row[0] for row in houses}
+    unassigned = [
+        {'house_id': row[0], 'address': row[2], 'house_number': row[3], 'reason': 'no location'}
+        for row in house_rows if row[0] not in located
+    ]
+    if not houses or not cabinets:
+        reason = 'no cabinet with location' if houses else 'no location'
+        unassigned += [
+            {'house_id': row[0], 'address': row[2], 'house_number': row[3], 'reason': reason}
+            for row in houses
+        ]
+        return AssignmentPlan(project_id, pd.DataFrame(columns=ASSIGNMENT_COLUMNS),
+                              pd.DataFrame(unassigned, columns=UNASSIGNED_COLUMNS))
+
+    ref_lat = float(np.concatenate([cabinet_coords[:, 0], house_coords[:, 0]]).mean())
+    cabinet_xy = project_to_meters(cabinet_coords, ref_lat)
+    house_xy = project_to_meters(house_coords, ref_lat)
+
+    if capacities:
+        used = dict(session.execute(
+            select(House.cabinet_id, func.count()).where(
+                House.project_id == project_id,
+                House.cabinet_id.isnot(None)
+            ).group_by(House.cabinet_id)
+        ).all())
+        remaining = np.array([
+            capacities[row[0]] - used.get(row[0], 0) if row[0] in capacities else len(houses)
+            for row in cabinets
+        ], dtype='int64')
+        distances, indices = k_nearest(cabinet_xy, house_xy, CANDIDATES_PER_HOUSE)
+        if max_distance_m is not None:
+            distances = np.where(distances <= max_distance_m, distances, np.inf)
+        assigned = greedy_assign(distances, indices, remaining)
+
+        # Houses whose nearest candidates were all full: retry against every cabinet
+        retry = np.flatnonzero(assigned < 0)
+        if len(retry) and len(cabinets) > CANDIDATES_PER_HOUSE and remaining.sum() > 0:
+            retry_distances, retry_indices = k_nearest(cabinet_xy, house_xy[retry], len(cabinets))
+            if max_distance_m is not None:
+                retry_distances = np.where(retry_distances <= max_distance_m, retry_distances, np.inf)
+            assigned[retry] = greedy_assign(retry_distances, retry_indices, remaining)
+
+        rows = np.arange(len(houses))
+        chosen = np.where(assigned >= 0, assigned, 0)
+        distance = np.hypot(*(house_xy[rows] - cabinet_xy[chosen]).T)
+    else:
+        distance, nearest = (a[:, 0] for a in k_nearest(cabinet_xy, house_xy, 1))
+        assigned = nearest if max_distance_m is None else np.where(distance <= max_distance_m, nearest, -1)
+
+    if capacities:
+        reason = 'no cabinet with room in range' if max_distance_m is not None else 'cabinets full'
+    else:
+        reason = 'too far from any cabinet'
+
+    assignments = []
+    for i, row in enumerate(houses):
+        if assigned[i] < 0:
+            unassigned.append({'house_id': row[0], 'address': row[2], 'house_number': row[3], 'reason': reason})
+            continue
+        cabinet = cabinets[assigned[i]]
+        assignments.append({
+            'house_id': row[0],
+            'address': row[2],
+            'house_number': row[3],
+            'cabinet_id': cabinet[0],
+            'cabinet_code': cabinet[2],
+            'distance_m': round(float(distance[i]), 1)
+        })
+
+    plan = AssignmentPlan(
+        project_id,
+        pd.DataFrame(assignments, columns=ASSIGNMENT_COLUMNS).sort_values(['cabinet_code', 'distance_m'], ignore_index=True),
+        pd.DataFrame(unassigned, columns=UNASSIGNED_COLUMNS)
+    )
+    logger.info(f"Cabinet assignment plan for project {project_id}: "
+                f"{len(plan.assignments)} assigned, {len(plan.unassigned)} unassigned")
+    return plan
+
+
+def apply_cabinet_assignment(session: Session, plan: AssignmentPlan) -> int:
+    """
+    Write a reviewed plan with one UPDATE ... FROM (VALUES ...)
+
+    Houses assigned by someone else since the plan was made are left alone.
+    The caller commits. Returns the number of houses updated.
+    """
+    if plan.is_empty:
+        return 0
+    pairs = values(
+        column('house_id', UUID(as_uuid=True)),
+        column('cabinet_id', UUID(as_uuid=True)),
+        name='plan'
+    ).data(list(zip(plan.assignments['house_id'], plan.assignments['cabinet_id'])))
+
+    result = session.execute(
+        update(House)
+        .where(House.id == pairs.c.house_id, House.cabinet_id.is_(None), House.project_id == plan.project_id)
+        .values(cabinet_id=pairs.c.cabinet_id)
+        .execution_options(synchronize_session=False)
+    )
+    logger.info(f"Assigned {result.rowcount} houses to cabinets in project {plan.project_id}")
+    return result.rowcount
+
+
+__all__ = [
+    'HAS_SCIPY',
+    'AssignmentPlan',
+    'k_nearest',
+    'greedy_assign',
+    'plan_cabinet_assignment',
+    'apply_cabinet_assignment'
+]
@@ -0,0 +1,296 @@
+"""
+Cost accrual engine for COMETA
+Turns interval-based daily rates (equipment/vehicle assignments, facilities,
+housing, facility rentals) into per-day, per-project rows in `costs`. Intervals
+are expanded to days with NumPy and written in bulk, incrementally from the
+last accrued day.
+"""
+
+import uuid
+import logging
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+
+try:
+    from .database import get_database_engine
+    from .models import (Cost, EquipmentAssignment, VehicleAssignment, Facility, HousingUnit,
+                         HousingAllocation, Rental, RentalExpense)
+except ImportError:
+    from database import get_database_engine
+    from models import (Cost, EquipmentAssignment, VehicleAssignment, Facility, HousingUnit,
+                        HousingAllocation, Rental, RentalExpense)
+
+logger = logging.getLogger(__name__)
+
+INSERT_BATCH_SIZE = 1000
+
+INTERVAL_COLUMNS = ['project_id', 'reference_id', 'start', 'end', 'daily_amount']
+
+# reference_type -> (cost_type, description)
+ACCRUAL_SOURCES = {
+    'equipment_assignment': ('equipment_rental', 'Equipment rental (daily accrual)'),
+    'vehicle_assignment': ('transport', 'Vehicle rental (daily accrual)'),
+    'facility': ('facility', 'Facility rent (daily accrual)'),
+    'facility_rental': ('facility', 'Facility rental (daily accrual)'),
+    'housing_unit': ('housing', 'Housing rent (daily accrual)'),
+}
+ACCRUAL_REFERENCE_TYPES = list(ACCRUAL_SOURCES)
+
+
+def expand_intervals(intervals: pd.DataFrame, since: date, through: date) -> pd.DataFrame:
+    """
+    Expand [start, end] intervals into one row per day within [since, through]
+
+    Open intervals (end missing) run through `through`. The expansion is a
+    repeat/offset over NumPy arrays; no Python loop per interval or day.
+    """
+    if intervals.empty:
+        return intervals.drop(columns=['start', 'end'], errors='ignore').assign(day=pd.Series(dtype='datetime64[ns]'))
+
+    lo = np.datetime64(since, 'D')
+    hi = np.datetime64(through, 'D')
+    start = pd.to_datetime(intervals['start']).to_numpy().astype('datetime64[D]')
+    end = pd.to_datetime(intervals['end']).fillna(pd.Timestamp(through)).to_numpy().astype('datetime64[D]')
+    start = np.maximum(start, lo)
+    end = np.minimum(end, hi)
+
+    lengths = (end - start).astype('int64') + 1
+    lengths = np.where(lengths > 0, lengths, 0)
+    row_index = np.repeat(np.arange(len(intervals)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    days = intervals.drop(columns=['start', 'end']).iloc[row_index].reset_index(drop=True)
+    days['day'] = start[row_index] + offsets.astype('timedelta64[D]')
+    return days
+
+
+def _frame(conn: Connection, stmt) -> pd.DataFrame:
+    return pd.DataFrame.from_records(conn.execute(stmt).all(), columns=INTERVAL_COLUMNS)
+
+
+def _overlaps(start_col, end_col, since: date, through: date):
+    return and_(start_col <= through, or_(end_col.is_(None), end_col >= since))
+
+
+def _overlaps_ts(start_col, end_col, since: date, through: date):
+    # Timestamp columns: anything starting during `through` counts (comparing
+    # with the date alone would mean midnight); kept as ranges for the indexes
+    return and_(
+        start_col < through + timedelta(days=1),
+        or_(end_col.is_(None), end_col >= since)
+    )
+
+
+def _assignment_days(conn: Connection, model, since: date, through: date) -> pd.DataFrame:
+    intervals = _frame(conn, select(
+        model.project_id,
+        model.id,
+        func.date(model.from_ts),
+        func.date(model.to_ts),
+        model.rental_cost_per_day
+    ).where(
+        model.rental_cost_per_day > 0,
+        _overlaps_ts(model.from_ts, model.to_ts, since, through)
+    ))
+    return expand_intervals(intervals, since, through)
+
+
+def equipment_assignment_days(conn: Connection, since: date, through: date) -> pd.DataFrame:
+    return _assignment_days(conn, EquipmentAssignment, since, through)
+
+
+def vehicle_assignment_days(conn: Connection, since: date, through: date) -> pd.DataFrame:
+    return _assignment_days(conn, VehicleAssignment, since, through)
+
+
+def facility_rental_days(conn: Connection, since: date, through: date) -> pd.DataFrame:
+    """
+    Facility rentals: days invoiced through RentalExpense use the expense amount
+    spread over its days, the remaining days the rental's daily rate
+    """
+    rentals = _frame(conn, select(
+        Facility.project_id,
+        Rental.id,
+        Rental.start_date,
+        Rental.end_date_plan,
+        Rental.daily_rate_eur
+    ).join(Facility, Facility.id == Rental.object_id).where(
+        Rental.type == 'facility',
+        Rental.status.in_(['active', 'finished']),
+        _overlaps(Rental.start_date, Rental.end_date_plan, since, through)
+    ))
+
+    expenses = pd.DataFrame.from_records(conn.execute(select(
+        Facility.project_id,
+        Rental.id,
+        RentalExpense.date,
+        RentalExpense.days,
+        RentalExpense.amount_eur
+    ).join(Rental, Rental.id == RentalExpense.rental_id).join(
+        Facility, Facility.id == Rental.object_id
+    ).where(
+        Rental.type == 'facility',
+        RentalExpense.date <= through
+    )).all(), columns=['project_id', 'reference_id', 'start', 'days', 'amount'])
+
+    if not expenses.empty:
+        days = expenses['days'].fillna(1).clip(lower=1).astype('int64')
+        expenses['end'] = pd.to_datetime(expenses['start']) + pd.to_timedelta(days - 1, unit='D')
+        expenses['daily_amount'] = expenses['amount'].astype('float64') / days
+        expenses = expenses[INTERVAL_COLUMNS]
+
+    # Expense days first, so they win over the flat rate for the same day
+    combined = pd.concat(
+        [expand_intervals(expenses, since, through), expand_intervals(rentals, since, through)],
+        ignore_index=True
+    )
+    return combined.drop_duplicates(subset=['reference_id', 'day'], keep='first')
+
+
+def facility_days(conn: Connection, since: date, through: date) -> pd.DataFrame:
+    """Facility rent, for facilities not billed through a facility Rental"""
+    rented = select(Rental.object_id).where(Rental.type == 'facility')
+    intervals = _frame(conn, select(
+        Facility.project_id,
+        Facility.id,
+        Facility.start_date,
+        Facility.end_date,
+        Facility.rent_daily_eur
+    ).where(
+        Facility.rent_daily_eur > 0,
+        Facility.start_date.isnot(None),
+        Facility.status != 'planned',
+        Facility.id.notin_(rented),
+        _overlaps(Facility.start_date, Facility.end_date, since, through)
+    ))
+    return expand_intervals(intervals, since, through)
+
+
+def housing_days(conn: Connection, since: date, through: date) -> pd.DataFrame:
+    """Housing unit rent for every day the unit has at least one allocation"""
+    intervals = _frame(conn, select(
+        HousingUnit.project_id,
+        HousingUnit.id,
+        HousingAllocation.from_date,
+        HousingAllocation.to_date,
+        HousingUnit.rent_daily_eur
+    ).join(HousingUnit, HousingUnit.id == HousingAllocation.housing_id).where(
+        HousingUnit.rent_daily_eur > 0,
+        _overlaps(HousingAllocation.from_date, HousingAllocation.to_date, since, through)
+    ))
+    # Several occupants share one unit's rent
+    return expand_intervals(intervals, since, through).drop_duplicates(subset=['reference_id', 'day'])
+
+
+DAY_SOURCES: Dict[str, Callable[[Connection, date, date], pd.DataFrame]] = {
+    'equipment_assignment': equipment_assignment_days,
+    'vehicle_assignment': vehicle_assignment_days,
+    'facility': facility_days,
+    'facility_rental': facility_rental_days,
+    'housing_unit': housing_days,
+}
+
+
+def accrual_watermark(conn: Connection) -> Optional[date]:
+    """Last day already accrued into costs"""
+    return conn.execute(
+        select(func.max(Cost.date)).where(Cost.reference_type.in_(ACCRUAL_REFERENCE_TYPES))
+    ).scalar()
+
+
+def _earliest_start(conn: Connection) -> Optional[date]:
+    candidates = [
+        conn.execute(select(func.min(func.date(EquipmentAssignment.from_ts)))).scalar(),
+        conn.execute(select(func.min(func.date(VehicleAssignment.from_ts)))).scalar(),
+        conn.execute(select(func.min(Facility.start_date))).scalar(),
+        conn.execute(select(func.min(Rental.start_date)).where(Rental.type == 'facility')).scalar(),
+        conn.execute(select(func.min(HousingAllocation.from_date))).scalar(),
+    ]
+    candidates = [value for value in candidates if value is not None]
+    return min(candidates) if candidates else None
+
+
+def _cost_rows(days: pd.DataFrame, reference_type: str) -> Iterator[Dict[str, Any]]:
+    cost_type, description = ACCRUAL_SOURCES[reference_type]
+    amounts = days['daily_amount'].astype('float64').round(2)
+    for project_id, reference_id, day, amount in zip(
+        days['project_id'], days['reference_id'], days['day'].dt.date, amounts
+    ):
+        yield {
+            'id': uuid.uuid4(),
+            'project_id': project_id,
+            'cost_type': cost_type,
+            'ref_id': reference_id,
+            'reference_id': reference_id,
+            'reference_type': reference_type,
+            'date': day,
+            'amount_eur': amount,
+            'description': description
+        }
+
+
+def _insert_costs(conn: Connection, rows: Iterator[Dict[str, Any]]) -> int:
+    stmt = insert(Cost).on_conflict_do_nothing(
+        index_elements=['reference_type', 'reference_id', 'date'],
+        index_where=Cost.reference_type.in_(ACCRUAL_REFERENCE_TYPES)
+    )
+    inserted = 0
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            inserted += conn.execute(stmt, batch).rowcount
+            batch = []
+    if batch:
+        inserted += conn.execute(stmt, batch).rowcount
+    return inserted
+
+
+def accrue_costs(since: Optional[date] = None, through: Optional[date] = None) -> Dict[str, int]:
+    """
+    Accrue daily costs into the costs table
+
+    Args:
+        since: First day to accrue; defaults to the day after the last accrued
+            day (or the earliest interval start on the first run). Pass an
+            earlier date to backfill retroactive changes - already accrued days
+            are skipped by the unique index.
+        through: Last day to accrue; defaults to yesterday (complete days only)
+
+    Returns:
+        Rows inserted per reference type
+    """
+    through = through or date.today() - timedelta(days=1)
+    result = {reference_type: 0 for reference_type in DAY_SOURCES}
+
+    with get_database_engine().begin() as conn:
+        if since is None:
+            watermark = accrual_watermark(conn)
+            since = watermark + timedelta(days=1) if watermark else _earliest_start(conn)
+        if since is None or since > through:
+            logger.info("Cost accrual: nothing to accrue")
+            return result
+
+        for reference_type, source in DAY_SOURCES.items():
+            days = source(conn, since, through)
+            if days.empty:
+                continue
+            result[reference_type] = _insert_costs(conn, _cost_rows(days, reference_type))
+
+    logger.info(f"Cost accrual {since} - {through}: {result}")
+    return result
+
+
+__all__ = [
+    'ACCRUAL_SOURCES',
+    'ACCRUAL_REFERENCE_TYPES',
+    'expand_intervals',
+    'accrual_watermark',
+    'accrue_costs'
+]
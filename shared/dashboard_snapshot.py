@@ -0,0 +1,258 @@
+"""
+Dashboard KPI snapshots for COMETA
+Computes portfolio KPIs into the dashboard_snapshots table so dashboard renders
+read one row. Refreshes are incremental: a KPI is only recomputed when one of
+its source tables changed (per-table versions bumped by triggers, see the
+20251116 migration) or its date window rolled over. Dates and timestamps are
+UTC.
+"""
+
+import time
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+try:
+    from .database import get_session
+    from .models import DashboardSnapshot, DashboardSourceVersion, Project, WorkEntry, CompanyWarehouse, Constraint
+    from .query_filters import work_entry_pending
+except ImportError:
+    from database import get_session
+    from models import DashboardSnapshot, DashboardSourceVersion, Project, WorkEntry, CompanyWarehouse, Constraint
+    from query_filters import work_entry_pending
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCOPE = 'portfolio'
+
+# Safety net for writes that bypass the triggers (e.g. session_replication_role)
+FULL_REFRESH_INTERVAL = timedelta(minutes=15)
+
+# Snapshots older than this are refreshed on read
+DEFAULT_MAX_AGE = timedelta(seconds=60)
+
+
+@dataclass(frozen=True)
+class KPI:
+    """One dashboard figure and the tables it is derived from"""
+    key: str
+    title: str
+    tables: Tuple[str, ...]
+    compute: Callable[[Session, date], Any]
+    date_sensitive: bool = False
+
+
+def _active_projects(session: Session, today: date) -> int:
+    return session.query(func.count(Project.id)).filter(Project.status == 'active').scalar() or 0
+
+
+def _meters_done_between(session: Session, start: date, end: date) -> float:
+    total = session.query(func.coalesce(func.sum(WorkEntry.meters_done_m), 0)).filter(
+        WorkEntry.date.between(start, end)
+    ).scalar()
+    return float(total or 0)
+
+
+def _meters_today(session: Session, today: date) -> float:
+    return _meters_done_between(session, today, today)
+
+
+def _meters_this_week(session: Session, today: date) -> float:
+    return _meters_done_between(session, today - timedelta(days=today.weekday()), today)
+
+
+def _pending_approvals(session: Session, today: date) -> int:
+    return session.query(func.count(WorkEntry.id)).filter(
+        work_entry_pending()
+    ).scalar() or 0
+
+
+def _low_stock_materials(session: Session, today: date) -> int:
+    return session.query(func.count(CompanyWarehouse.id)).filter(
+        CompanyWarehouse.min_stock_level > 0,
+        CompanyWarehouse.total_qty - CompanyWarehouse.reserved_qty < CompanyWarehouse.min_stock_level
+    ).scalar() or 0
+
+
+def _open_constraints(session: Session, today: date) -> int:
+    return session.query(func.count(Constraint.id)).filter(
+        Constraint.status.in_(['identified', 'in_progress'])
+    ).scalar() or 0
+
+
+KPIS: List[KPI] = [
+    KPI('active_projects', 'Active Projects', ('projects',), _active_projects),
+    KPI('meters_today', 'Meters Today', ('work_entries',), _meters_today, date_sensitive=True),
+    KPI('meters_this_week', 'Meters This Week', ('work_entries',), _meters_this_week, date_sensitive=True),
+    KPI('pending_approvals', 'Pending Approvals', ('work_entries',), _pending_approvals),
+    KPI('low_stock_materials', 'Low Stock Materials', ('company_warehouse',), _low_stock_materials),
+    KPI('open_constraints', 'Open Constraints', ('constraints',), _open_constraints),
+]
+
+
+def source_table_versions(session: Session, tables: Sequence[str]) -> Dict[str, int]:
+    """
+    Write versions of the given tables from dashboard_source_versions
+
+    A version is bumped inside the writing transaction, so it changes exactly
+    when the write commits. A version that differs from the one stored with the
+    snapshot means the table changed since. Returns {} where the versions are
+    unavailable, which makes every KPI count as changed.
+    """
+    try:
+        rows = session.execute(
+            select(DashboardSourceVersion.table_name, DashboardSourceVersion.version)
+            .where(DashboardSourceVersion.table_name.in_(list(tables)))
+        ).all()
+    except SQLAlchemyError as e:
+        logger.warning(f"Could not read dashboard source versions: {e}")
+        session.rollback()
+        return {}
+    return {name: int(version) for name, version in rows}
+
+
+def _stale_kpis(snapshot: Optional[DashboardSnapshot], versions: Dict[str, int],
+                today: date, now: datetime, force: bool) -> List[KPI]:
+    if force or snapshot is None or now - snapshot.computed_at >= FULL_REFRESH_INTERVAL:
+        return list(KPIS)
+
+    previous = snapshot.source_versions or {}
+    stale = []
+    for kpi in KPIS:
+        if kpi.key not in (snapshot.metrics or {}):
+            stale.append(kpi)
+        elif kpi.date_sensitive and snapshot.snapshot_date != today:
+            stale.append(kpi)
+        elif any(versions.get(table) is None or versions[table] != previous.get(table) for table in kpi.tables):
+            stale.append(kpi)
+    return stale
+
+
+def _snapshot_dict(snapshot: DashboardSnapshot) -> Dict[str, Any]:
+    return {
+        'scope': snapshot.scope,
+        'metrics': dict(snapshot.metrics or {}),
+        'snapshot_date': snapshot.snapshot_date,
+        'computed_at': snapshot.computed_at,
+        'refreshed_at': snapshot.refreshed_at
+    }
+
+
+def refresh_dashboard_snapshot(scope: str = DEFAULT_SCOPE, force: bool = False,
+                               today: Optional[date] = None, _retry: bool = True) -> Dict[str, Any]:
+    """
+    Bring the snapshot up to date, recomputing only KPIs whose inputs changed
+
+    The snapshot row is locked for the refresh, so concurrent refreshers
+    (several Streamlit sessions, the periodic job) queue instead of all
+    running the aggregates.
+
+    Args:
+        scope: Snapshot row to refresh
+        force: Recompute every KPI
+        today: Reference date (defaults to the current UTC date)
+
+    Returns:
+        Dict with scope, metrics, snapshot_date, computed_at and refreshed_at
+    """
+    now = datetime.utcnow()
+    today = today or now.date()
+    tables = sorted({table for kpi in KPIS for table in kpi.tables})
+
+    session = get_session()
+    try:
+        snapshot = session.get(DashboardSnapshot, scope, with_for_update=True)
+        versions = source_table_versions(session, tables)
+        stale = _stale_kpis(snapshot, versions, today, now, force)
+
+        if snapshot is None:
+            snapshot = DashboardSnapshot(scope=scope, metrics={}, source_versions={}, computed_at=now)
+            session.add(snapshot)
+
+        if stale:
+            metrics = dict(snapshot.metrics or {})
+            for kpi in stale:
+                metrics[kpi.key] = kpi.compute(session, today)
+            # Assign new objects so the JSONB columns are flagged as modified
+            snapshot.metrics = metrics
+            if len(stale) == len(KPIS):
+                snapshot.computed_at = now
+            logger.info(f"Dashboard snapshot '{scope}' recomputed: {', '.join(kpi.key for kpi in stale)}")
+
+        snapshot.source_versions = dict(versions)
+        snapshot.snapshot_date = today
+        snapshot.refreshed_at = now
+        session.commit()
+        return _snapshot_dict(snapshot)
+    except IntegrityError:
+        # Another process created the row first; its snapshot is just as fresh
+        session.rollback()
+        if _retry:
+            return refresh_dashboard_snapshot(scope, force, today, _retry=False)
+        raise
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_dashboard_snapshot(scope: str = DEFAULT_SCOPE,
+                           max_age: timedelta = DEFAULT_MAX_AGE) -> Dict[str, Any]:
+    """
+    Read the snapshot, refreshing it first if it is missing or older than max_age
+
+    This is what dashboard pages call on every rerun; in the common case it is
+    a single primary-key lookup.
+    """
+    session = get_session()
+    try:
+        snapshot = session.get(DashboardSnapshot, scope)
+        now = datetime.utcnow()
+        if (snapshot is not None
+                and snapshot.snapshot_date == now.date()
+                and now - snapshot.refreshed_at < max_age):
+            return _snapshot_dict(snapshot)
+    finally:
+        session.close()
+
+    return refresh_dashboard_snapshot(scope)
+
+
+def dashboard_snapshot_metrics(snapshot: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Snapshot values in the format UIComponents.dashboard_metrics expects"""
+    metrics = snapshot.get('metrics', {})
+    result = []
+    for kpi in KPIS:
+        value = metrics.get(kpi.key, 0)
+        if isinstance(value, float):
+            value = f"{value:,.1f}"
+        result.append({'title': kpi.title, 'value': value})
+    return result
+
+
+def run_periodic_refresh(interval_seconds: float = 60, scope: str = DEFAULT_SCOPE) -> None:
+    """Keep the snapshot warm from a background worker"""
+    while True:
+        try:
+            refresh_dashboard_snapshot(scope)
+        except Exception as e:
+            logger.error(f"Dashboard snapshot refresh failed: {e}")
+        time.sleep(interval_seconds)
+
+
+__all__ = [
+    'KPI',
+    'KPIS',
+    'source_table_versions',
+    'refresh_dashboard_snapshot',
+    'get_dashboard_snapshot',
+    'dashboard_snapshot_metrics',
+    'run_periodic_refresh'
+]
@@ -67,93 +67,13 @@ def init_database():
         logging.error(f"Database initialization error: {str(e)}")
 
 def init_basic_data():
-    """Initialize basic data like stage definitions and admin user"""
-    session = get_session()
-    
+    """Initialize basic data like stage definitions and admin user (idempotent)"""
     try:
-        from models import StageDef, User
-        
-        # Check if stage definitions exist
-        stage_count = session.query(StageDef).count()
-        if stage_count == 0:
-            # Add basic stage definitions matching the constraint
-            stages = [
-                StageDef(
-                    code="stage_1_marking",
-                    name_ru="Разметка",
-                    name_de="Markierung",
-                    requires_photos_min=2,
-                    requires_measurements=True,
-                    requires_density=False
-                ),
-                StageDef(
-                    code="stage_2_excavation",
-                    name_ru="Выемка грунта",
-                    name_de="Aushub",
-                    requires_photos_min=3,
-                    requires_measurements=True,
-                    requires_density=False
-                ),
-                StageDef(
-                    code="stage_3_conduit",
-                    name_ru="Укладка труб",
-                    name_de="Rohrverlegung",
-                    requires_photos_min=3,
-                    requires_measurements=True,
-                    requires_density=False
-                ),
-                StageDef(
-                    code="stage_4_cable",
-                    name_ru="Прокладка кабеля",
-                    name_de="Kabelverlegung",
-                    requires_photos_min=3,
-                    requires_measurements=True,
-                    requires_density=False
-                ),
-                StageDef(
-                    code="stage_5_splice",
-                    name_ru="Сварка",
-                    name_de="Spleißen",
-                    requires_photos_min=3,
-                    requires_measurements=True,
-                    requires_density=False
-                ),
-                StageDef(
-                    code="stage_6_test",
-                    name_ru="Тестирование",
-                    name_de="Testen",
-                    requires_photos_min=2,
-                    requires_measurements=True,
-                    requires_density=False
-                )
-            ]
-            
-            for stage in stages:
-                session.add(stage)
-        
-        # Check if admin user exists
-        admin_count = session.query(User).filter(User.role == 'admin').count()
-        if admin_count == 0:
-            # Create default admin user
-            admin_user = User(
-                first_name="Admin",
-                last_name="User",
-                email="admin@example.com",
-                phone="+1234567890",
-                role="admin",
-                lang_pref="en",
-                is_active=True
-            )
-            session.add(admin_user)
-        
-        session.commit()
-        
+        from seeds import run_seeds
+        run_seeds(include_mappings=False)
     except Exception as e:
-        session.rollback()
         logging.error(f"Error initializing basic data: {str(e)}")
         raise e
-    finally:
-        session.close()
 
 def execute_raw_sql(query: str, params: dict = None):
     """Execute raw SQL query"""
@@ -5,6 +5,8 @@ Eliminates 731+ repeated database access patterns across the codebase
 
 import functools
 from typing import Any, Callable, Optional, List, Dict, Union
+import pandas as pd
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from contextlib import contextmanager
@@ -179,6 +181,38 @@ class MaterialService:
         """Get all materials allocated to project (found duplicated 5+ times)"""
         return session.query(MaterialAllocation).filter_by(project_id=project_id).all()
 
+    @staticmethod
+    @DatabaseService.with_session
+    def get_material_usage_summary(session: Session, project_id: Optional[Any] = None,
+                                   crew_id: Optional[Any] = None) -> pd.DataFrame:
+        """
+        Allocated/used/remaining quantities per material in one grouped query
+
+        Returns one row per material (Material, Unit, Allocated, Used, Remaining,
+        Usage %), ready for ChartComponents.material_usage_chart.
+        """
+        allocated = func.coalesce(func.sum(MaterialAllocation.allocated_qty), 0)
+        used = func.coalesce(func.sum(MaterialAllocation.used_qty), 0)
+        stmt = (
+            select(Material.name, Material.unit, allocated.label('allocated'), used.label('used'))
+            .join(Material, Material.id == MaterialAllocation.material_id)
+            .group_by(Material.id, Material.name, Material.unit)
+            .order_by(used.desc())
+        )
+        if project_id is not None:
+            stmt = stmt.where(MaterialAllocation.project_id == project_id)
+        if crew_id is not None:
+            stmt = stmt.where(MaterialAllocation.crew_id == crew_id)
+
+        df = pd.DataFrame.from_records(
+            session.execute(stmt).all(), columns=['Material', 'Unit', 'Allocated', 'Used']
+        )
+        df['Allocated'] = df['Allocated'].astype('float64')
+        df['Used'] = df['Used'].astype('float64')
+        df['Remaining'] = df['Allocated'] - df['Used']
+        df['Usage %'] = (df['Used'] / df['Allocated'].where(df['Allocated'] > 0) * 100).fillna(0)
+        return df
+
     @staticmethod
     @DatabaseService.with_session
     def update_material_usage(session: Session, allocation_id: int, used_qty: float) -> Optional[MaterialAllocation]:
@@ -0,0 +1,170 @@
+"""
+Direct SQL-to-DataFrame loading for COMETA
+Streams select() results from a server-side cursor into typed, columnar DataFrames
+without hydrating ORM objects or building per-row dicts
+"""
+
+import logging
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+from sqlalchemy import types as sqltypes
+from sqlalchemy.engine import Engine
+
+try:
+    from .database import get_database_engine
+except ImportError:
+    from database import get_database_engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+
+ColumnConverter = Callable[[tuple], pd.Series]
+
+
+def _to_strings(values: tuple) -> pd.Series:
+    series = pd.Series(values, dtype=object)
+    missing = series.isna()
+    series = series.astype(str).astype(object)
+    series[missing] = None
+    return series
+
+
+def _to_float(values: tuple) -> pd.Series:
+    return pd.Series(values, dtype=object).astype('float64')
+
+
+def _to_int(values: tuple) -> pd.Series:
+    return pd.Series(values, dtype=object).astype('Int64')
+
+
+def _to_bool(values: tuple) -> pd.Series:
+    return pd.Series(values, dtype=object).astype('boolean')
+
+
+def _to_datetime(values: tuple) -> pd.Series:
+    try:
+        return pd.Series(pd.to_datetime(pd.Series(values, dtype=object)))
+    except (ValueError, TypeError, OverflowError, pd.errors.OutOfBoundsDatetime):
+        # Values outside the datetime64 range stay as Python objects
+        return pd.Series(values, dtype=object)
+
+
+def _to_object(values: tuple) -> pd.Series:
+    return pd.Series(values, dtype=object)
+
+
+def column_converter(sql_type, decimal_as_float: bool = True) -> ColumnConverter:
+    """
+    Pick the vectorized converter for a SQL column type
+
+    UUIDs become strings, Numeric float64 (or Decimal objects when
+    decimal_as_float=False), integers nullable Int64, booleans nullable boolean
+    and Date/DateTime datetime64. Anything else is kept as objects.
+    """
+    if isinstance(sql_type, getattr(sqltypes, 'Uuid', ())) or type(sql_type).__name__ == 'UUID':
+        return _to_strings
+    if isinstance(sql_type, sqltypes.Float):
+        return _to_float
+    if isinstance(sql_type, sqltypes.Numeric):
+        return _to_float if decimal_as_float else _to_object
+    if isinstance(sql_type, sqltypes.Integer):
+        return _to_int
+    if isinstance(sql_type, sqltypes.Boolean):
+        return _to_bool
+    if isinstance(sql_type, (sqltypes.Date, sqltypes.DateTime)):
+        return _to_datetime
+    return _to_object
+
+
+def _converters_for(stmt, keys: List[str], decimal_as_float: bool) -> List[ColumnConverter]:
+    selected = list(getattr(stmt, 'selected_columns', []))
+    if len(selected) != len(keys):
+        # Could not line up result columns with the statement - keep raw values
+        return [_to_object] * len(keys)
+    return [column_converter(column.type, decimal_as_float) for column in selected]
+
+
+def _frame_from_rows(keys: List[str], converters: List[ColumnConverter], rows) -> pd.DataFrame:
+    if not rows:
+        return pd.DataFrame(columns=keys)
+    columns = zip(*rows)
+    return pd.DataFrame({
+        key: convert(values).reset_index(drop=True)
+        for key, convert, values in zip(keys, converters, columns)
+    })
+
+
+def rows_to_dataframe(stmt, keys: List[str], rows, decimal_as_float: bool = True) -> pd.DataFrame:
+    """Convert rows already fetched for `stmt` into a typed DataFrame"""
+    return _frame_from_rows(keys, _converters_for(stmt, keys, decimal_as_float), rows)
+
+
+def iter_dataframe_chunks(stmt, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                          decimal_as_float: bool = True,
+                          engine: Optional[Engine] = None) -> Iterator[pd.DataFrame]:
+    """
+    Execute a select() on a server-side cursor and yield typed DataFrame chunks
+
+    Only `chunk_size` raw rows are held at a time, which makes this the building
+    block for exports and other consumers that never need the whole result.
+
+    Args:
+        stmt: SQLAlchemy select() of columns or entities (entities are read as
+            plain columns, no ORM objects are created)
+        chunk_size: Rows fetched per round trip
+        decimal_as_float: Convert Numeric columns to float64 instead of Decimal
+        engine: Engine to use (defaults to the application engine)
+    """
+    engine = engine or get_database_engine()
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, max_row_buffer=chunk_size).execute(stmt)
+        keys = list(result.keys())
+        converters = _converters_for(stmt, keys, decimal_as_float)
+
+        for rows in result.partitions(chunk_size):
+            yield _frame_from_rows(keys, converters, rows)
+
+
+def read_dataframe(stmt, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   decimal_as_float: bool = True,
+                   engine: Optional[Engine] = None) -> pd.DataFrame:
+    """
+    Load a select() straight into a typed DataFrame
+
+    Replaces the load-ORM-objects -> dicts -> safe_dataframe pipeline for table
+    views. Chunks are combined column by column, so peak memory is the final
+    frame plus one chunk of raw rows.
+
+    Example:
+        stmt = select(WorkEntry.id, WorkEntry.date, WorkEntry.meters_done_m).where(...)
+        df = read_dataframe(stmt)
+    """
+    column_chunks: Dict[str, List[pd.Series]] = {}
+    keys: List[str] = []
+
+    for chunk in iter_dataframe_chunks(stmt, chunk_size, decimal_as_float, engine):
+        if not keys:
+            keys = list(chunk.columns)
+            column_chunks = {key: [] for key in keys}
+        for key in keys:
+            column_chunks[key].append(chunk[key])
+
+    if not keys:
+        # No rows: still return the selected columns
+        return pd.DataFrame(columns=[column.key for column in getattr(stmt, 'selected_columns', [])])
+
+    return pd.DataFrame({
+        key: pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        for key, parts in column_chunks.items()
+    })
+
+
+__all__ = [
+    'read_dataframe',
+    'iter_dataframe_chunks',
+    'rows_to_dataframe',
+    'column_converter',
+    'DEFAULT_CHUNK_SIZE'
+]
@@ -0,0 +1,252 @@
+"""
+Document expiry scanner for COMETA
+Generates DocumentReminder and InAppNotification rows for worker documents
+reaching a reminder milestone (the category's renewal notice period, 7 days
+before expiry, expiry day). Each run only reads documents whose milestone
+dates fall after the stored high-water mark, plus documents changed since the
+previous run, so daily runs cost O(new events).
+"""
+
+import uuid
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+
+try:
+    from .database import get_database_engine
+    from .models import (WorkerDocument, DocumentCategory, DocumentReminder, DocumentExpiryScan,
+                         InAppNotification)
+except ImportError:
+    from database import get_database_engine
+    from models import (WorkerDocument, DocumentCategory, DocumentReminder, DocumentExpiryScan,
+                        InAppNotification)
+
+logger = logging.getLogger(__name__)
+
+SCANNER = 'worker_documents'
+ACTIVE_DOCUMENT_STATUSES = ('active', 'pending_verification')
+DEFAULT_NOTICE_DAYS = 30
+# Milestones besides the category's notice period, in days before expiry
+FIXED_MILESTONES = (7, 0)
+INSERT_BATCH_SIZE = 1000
+# Generated notifications are purged this long after the document's expiry
+NOTIFICATION_RETENTION_DAYS = 30
+
+DOCUMENT_COLUMNS = ['document_id', 'user_id', 'document_number', 'expiry_date', 'notice_days', 'category']
+EVENT_COLUMNS = DOCUMENT_COLUMNS + ['days_before_expiry', 'reminder_date']
+
+
+def _documents(conn: Connection, *conditions) -> pd.DataFrame:
+    notice_days = func.coalesce(DocumentCategory.renewal_notice_days, DEFAULT_NOTICE_DAYS)
+    rows = conn.execute(
+        select(
+            WorkerDocument.id,
+            WorkerDocument.user_id,
+            WorkerDocument.document_number,
+            WorkerDocument.expiry_date,
+            notice_days,
+            func.coalesce(DocumentCategory.name_en, DocumentCategory.name_de)
+        ).join(DocumentCategory, DocumentCategory.id == WorkerDocument.category_id).where(
+            WorkerDocument.status.in_(ACTIVE_DOCUMENT_STATUSES),
+            WorkerDocument.expiry_date.isnot(None),
+            *conditions
+        )
+    ).all()
+    return pd.DataFrame.from_records(rows, columns=DOCUMENT_COLUMNS)
+
+
+def milestone_events(documents: pd.DataFrame) -> pd.DataFrame:
+    """One row per document and milestone, with the milestone's reminder date"""
+    if documents.empty:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+    frames = [documents.assign(days_before_expiry=documents['notice_days'].astype('int64'))]
+    frames += [documents.assign(days_before_expiry=days) for days in FIXED_MILESTONES]
+    events = pd.concat(frames, ignore_index=True).drop_duplicates(['document_id', 'days_before_expiry'])
+    events['reminder_date'] = (
+        pd.to_datetime(events['expiry_date']) - pd.to_timedelta(events['days_before_expiry'], unit='D')
+    ).dt.date
+    return events[EVENT_COLUMNS]
+
+
+def due_events(conn: Connection, since: date, today: date) -> pd.DataFrame:
+    """
+    Milestones with a reminder date in (since, today]
+
+    Each milestone is an expiry_date range; the category notice period adds
+    one range per category, all served by the expiry_date index.
+    """
+    if since >= today:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+    def expiry_range(days: int):
+        return WorkerDocument.expiry_date.between(since + timedelta(days=days + 1), today + timedelta(days=days))
+
+    ranges = [expiry_range(days) for days in FIXED_MILESTONES]
+    for category_id, notice_days in conn.execute(
+        select(DocumentCategory.id, func.coalesce(DocumentCategory.renewal_notice_days, DEFAULT_NOTICE_DAYS))
+    ):
+        ranges.append(and_(WorkerDocument.category_id == category_id, expiry_range(int(notice_days))))
+
+    events = milestone_events(_documents(conn, or_(*ranges)))
+    in_window = (events['reminder_date'] > since) & (events['reminder_date'] <= today)
+    return events[in_window]
+
+
+def catch_up_events(conn: Connection, changed_since: Optional[datetime], today: date) -> pd.DataFrame:
+    """
+    Latest milestone already reached by documents changed since the last run
+    (uploaded inside their notice window or renewed); every document on the
+    first run. Milestones older than NOTIFICATION_RETENTION_DAYS are left out,
+    so long-expired documents do not produce notifications that are already
+    past their expiry.
+    """
+    oldest = today - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    # A milestone is never after the expiry date
+    conditions = [WorkerDocument.expiry_date >= oldest]
+    if changed_since is not None:
+        conditions.append(func.coalesce(WorkerDocument.updated_at, WorkerDocument.created_at) > changed_since)
+    events = milestone_events(_documents(conn, *conditions))
+    reached = events[(events['reminder_date'] <= today) & (events['reminder_date'] >= oldest)]
+    return reached.sort_values('reminder_date').drop_duplicates('document_id', keep='last')
+
+
+def _message(event, today: date) -> Dict[str, str]:
+    label = event.category if pd.notna(event.category) else 'Document'
+    if pd.notna(event.document_number) and event.document_number:
+        label = f"{label} {event.document_number}"
+    expiry = event.expiry_date.strftime('%Y-%m-%d')
+    # Catch-up reminders are sent after their milestone, so count from today
+    days_left = (event.expiry_date - today).days
+    if days_left <= 0:
+        return {'title': 'Document expired', 'message': f"{label} expired on {expiry}."}
+    return {'title': 'Document expires soon',
+            'message': f"{label} expires on {expiry} ({days_left} days)."}
+
+
+def _insert_batches(conn: Connection, stmt, rows: List[Dict[str, Any]], returning: bool = False) -> List[Any]:
+    returned = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        result = conn.execute(stmt.values(rows[start:start + INSERT_BATCH_SIZE]))
+        if returning:
+            returned.extend(result.all())
+    return returned
+
+
+def write_reminders(conn: Connection, events: pd.DataFrame, today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Bulk-insert reminders and their notifications
+
+    Reminders already generated (same document, milestone and date) are
+    skipped; notifications are only created for newly inserted reminders and
+    are deduplicated by their dedup_key as well.
+    """
+    if events.empty:
+        return {'reminders': 0, 'notifications': 0}
+
+    today = today or date.today()
+    now = datetime.utcnow()
+    by_key = {}
+    reminders = []
+    for event in events.itertuples(index=False):
+        text = _message(event, today)
+        key = (event.document_id, int(event.days_before_expiry), event.reminder_date)
+        by_key[key] = (event, text)
+        reminders.append({
+            'id': uuid.uuid4(),
+            'document_id': event.document_id,
+            'reminder_date': event.reminder_date,
+            'reminder_type': 'expiry',
+            'days_before_expiry': int(event.days_before_expiry),
+            'sent_at': now,
+            'notification_method': 'system',
+            'message': text['message'],
+            'status': 'sent'
+        })
+
+    inserted = _insert_batches(conn, insert(DocumentReminder).on_conflict_do_nothing(
+        constraint='uq_document_reminders_dedup'
+    ).returning(
+        DocumentReminder.document_id, DocumentReminder.days_before_expiry, DocumentReminder.reminder_date
+    ), reminders, returning=True)
+
+    notifications = []
+    for key in inserted:
+        event, text = by_key[tuple(key)]
+        notifications.append({
+            'id': uuid.uuid4(),
+            'user_id': event.user_id,
+            'title': text['title'],
+            'message': text['message'],
+            'notification_type': 'error' if event.expiry_date <= today else 'warning',
+            'priority': 'high' if (event.expiry_date - today).days <= 7 else 'medium',
+            'is_read': False,
+            'created_at': now,
+            'expires_at': datetime.combine(event.expiry_date, datetime.min.time())
+                          + timedelta(days=NOTIFICATION_RETENTION_DAYS),
+            'metadata_json': {
+                'document_id': str(event.document_id),
+                'days_before_expiry': int(event.days_before_expiry),
+                'expiry_date': event.expiry_date.isoformat()
+            },
+            'dedup_key': f"document_expiry:{event.document_id}:{event.days_before_expiry}:{event.reminder_date.isoformat()}"
+        })
+
+    if notifications:
+        _insert_batches(conn, insert(InAppNotification).on_conflict_do_nothing(
+            index_elements=['dedup_key'],
+            index_where=InAppNotification.dedup_key.isnot(None)
+        ), notifications)
+    return {'reminders': len(inserted), 'notifications': len(notifications)}
+
+
+def scan_document_expiry(today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Generate due reminders and advance the high-water mark
+
+    Runs in one transaction with the scanner row locked, so overlapping runs
+    wait instead of generating the same events twice.
+    """
+    today = today or date.today()
+    started_at = datetime.now()  # Local time, like WorkerDocument.updated_at
+
+    with get_database_engine().begin() as conn:
+        conn.execute(
+            insert(DocumentExpiryScan).values(
+                scanner=SCANNER, scanned_through=today - timedelta(days=1), last_run_at=None
+            ).on_conflict_do_nothing(index_elements=['scanner'])
+        )
+        scanned_through, last_run_at = conn.execute(
+            select(DocumentExpiryScan.scanned_through, DocumentExpiryScan.last_run_at)
+            .where(DocumentExpiryScan.scanner == SCANNER)
+            .with_for_update()
+        ).one()
+
+        events = pd.concat([
+            due_events(conn, scanned_through, today),
+            catch_up_events(conn, last_run_at, today)
+        ], ignore_index=True).drop_duplicates(['document_id', 'days_before_expiry', 'reminder_date'])
+        result = write_reminders(conn, events, today)
+
+        conn.execute(
+            DocumentExpiryScan.__table__.update()
+            .where(DocumentExpiryScan.scanner == SCANNER)
+            .values(scanned_through=func.greatest(DocumentExpiryScan.scanned_through, today), last_run_at=started_at)
+        )
+
+    logger.info(f"Document expiry scan through {today}: {result}")
+    return result
+
+
+__all__ = [
+    'FIXED_MILESTONES',
+    'milestone_events',
+    'due_events',
+    'catch_up_events',
+    'write_reminders',
+    'scan_document_expiry'
+]
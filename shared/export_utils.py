@@ -0,0 +1,219 @@
+"""
+Streaming data export for COMETA
+Writes query results or DataFrames to CSV, gzip-compressed CSV or Parquet in
+fixed-size chunks, so an export never holds the whole encoded file in memory
+"""
+
+import os
+import zlib
+import logging
+import tempfile
+from typing import Iterable, Iterator, Optional, Union
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    from .dataframe_loader import DEFAULT_CHUNK_SIZE, iter_dataframe_chunks
+except ImportError:
+    from dataframe_loader import DEFAULT_CHUNK_SIZE, iter_dataframe_chunks
+
+logger = logging.getLogger(__name__)
+
+# format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+# Default download button labels per format
+EXPORT_LABELS = {
+    'csv': 'Download CSV',
+    'csv.gz': 'Download CSV (gzip)',
+    'parquet': 'Download Parquet',
+}
+
+ExportSource = Union[pd.DataFrame, Iterable[pd.DataFrame], object]
+
+
+def iter_source_chunks(source: ExportSource, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Normalize an export source into DataFrame chunks
+
+    Args:
+        source: SQLAlchemy select() (streamed from a server-side cursor), a
+            DataFrame (sliced without copying) or an iterable of DataFrames
+        chunk_size: Rows per chunk
+    """
+    if isinstance(source, pd.DataFrame):
+        if source.empty:
+            # Still export the header / schema
+            yield source
+        for start in range(0, len(source), chunk_size):
+            yield source.iloc[start:start + chunk_size]
+        return
+
+    if hasattr(source, 'selected_columns'):
+        yield from iter_dataframe_chunks(source, chunk_size)
+        return
+
+    yield from source
+
+
+def iter_csv_bytes(source: ExportSource, compress: bool = False,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Encode an export source as CSV, yielding bytes chunk by chunk
+
+    The header is written once; with compress=True the output is a single gzip
+    stream. Suitable for HTTP streaming responses as well as file writes.
+    """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+    header = True
+
+    for chunk in iter_source_chunks(source, chunk_size):
+        data = chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def _parquet_schema(table: "pa.Table") -> "pa.Schema":
+    # A column that is all-null in the first chunk would otherwise be typed null
+    # and reject values from later chunks
+    return pa.schema([
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in table.schema
+    ])
+
+
+def _write_parquet(source: ExportSource, path: str, chunk_size: int) -> None:
+    if not HAS_PYARROW:
+        raise ImportError("pyarrow is required for Parquet export (pip install pyarrow)")
+
+    writer = None
+    try:
+        for chunk in iter_source_chunks(source, chunk_size):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                schema = _parquet_schema(table)
+                writer = pq.ParquetWriter(path, schema)
+            table = table.cast(writer.schema)
+            writer.write_table(table, row_group_size=chunk_size)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # No chunks at all: still produce a valid (empty) file
+        pq.write_table(pa.table({}), path)
+
+
+def write_export(source: ExportSource, fmt: str = 'csv', path: Optional[str] = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> str:
+    """
+    Stream an export source to a file
+
+    Args:
+        source: select() statement, DataFrame or iterable of DataFrames
+        fmt: 'csv', 'csv.gz' or 'parquet'
+        path: Target file (a temporary file is created when omitted; the caller
+            removes it)
+        chunk_size: Rows encoded per chunk
+
+    Returns:
+        Path of the written file
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix='cometa_export_', suffix=EXPORT_FORMATS[fmt][0])
+        os.close(fd)
+
+    try:
+        if fmt == 'parquet':
+            _write_parquet(source, path, chunk_size)
+        else:
+            with open(path, 'wb') as f:
+                for data in iter_csv_bytes(source, compress=(fmt == 'csv.gz'), chunk_size=chunk_size):
+                    f.write(data)
+    except Exception:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        raise
+
+    return path
+
+
+def export_file_name(prefix: str, fmt: str, stamp: str) -> str:
+    """File name for a download, e.g. export_20240101.csv.gz"""
+    return f"{prefix}_{stamp}{EXPORT_FORMATS[fmt][0]}"
+
+
+def export_download_button(source: ExportSource, label: Optional[str], file_name: str,
+                           fmt: str = 'csv', key: Optional[str] = None,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE) -> bool:
+    """
+    Streamlit download button for an export file
+
+    The export is encoded chunk by chunk into a temporary file, so no DataFrame
+    plus full CSV string pair is held. st.download_button still reads the
+    finished file into memory to serve it, so peak memory is the encoded size;
+    for very large exports use 'csv.gz' or 'parquet', or upload the output of
+    write_export to storage and link to it instead.
+
+    Args:
+        label: Button label; derived from fmt when None
+        file_name: Download name; its extension is corrected to match fmt
+    """
+    import streamlit as st
+
+    extension, mime = EXPORT_FORMATS[fmt]
+    label = label or EXPORT_LABELS[fmt]
+    if not file_name.endswith(extension):
+        stem = file_name
+        for other_extension, _ in EXPORT_FORMATS.values():
+            if stem.endswith(other_extension):
+                stem = stem[:-len(other_extension)]
+                break
+        file_name = f"{stem}{extension}"
+
+    path = write_export(source, fmt, chunk_size=chunk_size)
+    try:
+        with open(path, 'rb') as f:
+            return st.download_button(
+                label=label,
+                data=f,
+                file_name=file_name,
+                mime=mime,
+                key=key
+            )
+    finally:
+        os.remove(path)
+
+
+__all__ = [
+    'EXPORT_FORMATS',
+    'EXPORT_LABELS',
+    'HAS_PYARROW',
+    'iter_source_chunks',
+    'iter_csv_bytes',
+    'write_export',
+    'export_file_name',
+    'export_download_button'
+]
@@ -0,0 +1,282 @@
+"""
+GPS ingestion for COMETA
+Loads batches of vehicle GPS fixes (NDJSON or CSV) into the partitioned
+vehicle_tracking table: coordinates are validated column-wise, the batch is
+streamed with COPY into a staging table and moved over with one
+INSERT ... SELECT, and vehicle_positions is upserted with each vehicle's
+latest fix
+"""
+
+import io
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import IO, Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+try:
+    from .database import get_database_engine
+    from .models import Vehicle, VehiclePosition
+    from .gps_validation import validate_gps_coordinates_bulk
+except ImportError:
+    from database import get_database_engine
+    from models import Vehicle, VehiclePosition
+    from gps_validation import validate_gps_coordinates_bulk
+
+logger = logging.getLogger(__name__)
+
+GPS_COLUMNS = ['vehicle_id', 'timestamp', 'lat', 'lon']
+GPS_FORMATS = ('ndjson', 'csv')
+
+_FILE_FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'ndjson'}
+
+_UUID_HEX_PATTERN = r'[0-9a-f]{32}'
+
+# Numeric timestamps above this are epoch milliseconds, below epoch seconds
+_EPOCH_MS_THRESHOLD = 1e11
+
+# Accepted fix times relative to ingestion: older fixes (e.g. a tracker
+# reporting epoch 0) would create a partition per month back to 1970
+MAX_FIX_AGE = timedelta(days=90)
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+_CREATE_STAGING = text("""
+    CREATE TEMP TABLE gps_staging (
+        vehicle_id UUID NOT NULL,
+        "timestamp" TIMESTAMP NOT NULL,
+        lat NUMERIC(10,7) NOT NULL,
+        lon NUMERIC(10,7) NOT NULL
+    ) ON COMMIT DROP
+""")
+
+_COPY_STAGING = 'COPY gps_staging (vehicle_id, "timestamp", lat, lon) FROM STDIN WITH (FORMAT csv)'
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+_ENSURE_PARTITIONS = text("SELECT ensure_vehicle_tracking_partitions(:from_ts, :to_ts)")
+
+# Fixes of unknown vehicles are skipped instead of failing the whole batch on the FK
+_INSERT_TRACKING = text("""
+    INSERT INTO vehicle_tracking (vehicle_id, "timestamp", lat, lon)
+    SELECT s.vehicle_id, s."timestamp", s.lat, s.lon
+    FROM gps_staging s
+    JOIN vehicles v ON v.id = s.vehicle_id
+    ON CONFLICT (vehicle_id, "timestamp") DO NOTHING
+""")
+
+_UPSERT_POSITIONS = text("""
+    INSERT INTO vehicle_positions (vehicle_id, "timestamp", lat, lon, updated_at)
+    SELECT DISTINCT ON (s.vehicle_id) s.vehicle_id, s."timestamp", s.lat, s.lon, NOW()
+    FROM gps_staging s
+    JOIN vehicles v ON v.id = s.vehicle_id
+    ORDER BY s.vehicle_id, s."timestamp" DESC
+    ON CONFLICT (vehicle_id) DO UPDATE SET
+        "timestamp" = EXCLUDED."timestamp",
+        lat = EXCLUDED.lat,
+        lon = EXCLUDED.lon,
+        updated_at = EXCLUDED.updated_at
+    WHERE vehicle_positions."timestamp" < EXCLUDED."timestamp"
+""")
+
+
+def detect_gps_format(sample: Union[str, bytes]) -> str:
+    """'ndjson' if the payload starts with a JSON object, else 'csv'"""
+    if isinstance(sample, bytes):
+        sample = sample[:64].decode('utf-8', errors='ignore')
+    return 'ndjson' if sample.lstrip('\ufeff \t\r\n').startswith('{') else 'csv'
+
+
+def read_gps_batch(data: Union[str, bytes, IO], fmt: Optional[str] = None) -> pd.DataFrame:
+    """
+    Parse a batch of fixes into a frame of raw (unvalidated) values
+
+    Args:
+        data: NDJSON or CSV payload, as text, bytes or a readable file
+        fmt: 'ndjson' or 'csv'; detected from the payload when omitted
+    """
+    if isinstance(data, (str, bytes)):
+        fmt = fmt or detect_gps_format(data)
+        data = io.BytesIO(data) if isinstance(data, bytes) else io.StringIO(data)
+    elif fmt is None:
+        raise ValueError("fmt is required when reading from a file")
+
+    if fmt not in GPS_FORMATS:
+        raise ValueError(f"Unsupported GPS format '{fmt}'. Use one of: {', '.join(GPS_FORMATS)}")
+
+    if fmt == 'csv':
+        frame = pd.read_csv(data, dtype=str)
+    else:
+        frame = pd.read_json(data, lines=True, dtype=False, convert_dates=False, keep_default_dates=False)
+
+    missing = [column for column in GPS_COLUMNS if column not in frame.columns]
+    if missing:
+        raise ValueError(f"GPS batch is missing columns: {', '.join(missing)}")
+    return frame[GPS_COLUMNS]
+
+
+def parse_timestamps(values: pd.Series) -> pd.Series:
+    """
+    ISO-8601 strings or epoch seconds/milliseconds to naive UTC timestamps
+    (vehicle_tracking.timestamp has no time zone); NaT where unparseable
+    """
+    numeric = pd.to_numeric(values, errors='coerce')
+    is_epoch = numeric.notna().to_numpy()
+
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    if is_epoch.any():
+        epoch = numeric[is_epoch].astype('float64')
+        millis = epoch.to_numpy() > _EPOCH_MS_THRESHOLD
+        seconds = np.where(millis, epoch.to_numpy() / 1000, epoch.to_numpy())
+        parsed[is_epoch] = pd.to_datetime(seconds, unit='s', errors='coerce')
+    if not is_epoch.all():
+        iso = pd.to_datetime(values[~is_epoch].astype(str), utc=True, errors='coerce', format='ISO8601')
+        parsed[~is_epoch] = iso.dt.tz_convert(None)
+    return parsed
+
+
+def clean_gps_batch(frame: pd.DataFrame, now: Optional[datetime] = None) -> Tuple[pd.DataFrame, int]:
+    """
+    Validate and normalize a batch column-wise
+
+    Drops fixes with invalid vehicle ids, timestamps or coordinates, fixes
+    older than MAX_FIX_AGE or in the future (beyond MAX_CLOCK_SKEW) relative
+    to now (UTC), and duplicate (vehicle_id, timestamp) fixes within the batch
+    (last one wins).
+
+    Returns:
+        (clean frame, number of rejected fixes)
+    """
+    # Canonical hyphenated form, so '0b3c...' and '0B3C-...' dedupe as one vehicle
+    hex_ids = frame['vehicle_id'].astype(str).str.strip().str.lower().str.replace('-', '', regex=False)
+    vehicle_ids = (hex_ids.str[:8] + '-' + hex_ids.str[8:12] + '-' + hex_ids.str[12:16] + '-'
+                   + hex_ids.str[16:20] + '-' + hex_ids.str[20:])
+    timestamps = parse_timestamps(frame['timestamp'])
+    lat = pd.to_numeric(frame['lat'], errors='coerce')
+    lon = pd.to_numeric(frame['lon'], errors='coerce')
+    now = pd.Timestamp(now or datetime.utcnow())
+
+    valid = (
+        hex_ids.str.fullmatch(_UUID_HEX_PATTERN).fillna(False).to_numpy(dtype=bool)
+        & timestamps.between(now - MAX_FIX_AGE, now + MAX_CLOCK_SKEW).to_numpy()
+        & validate_gps_coordinates_bulk(lat, lon)
+    )
+
+    clean = pd.DataFrame({
+        'vehicle_id': vehicle_ids[valid],
+        'timestamp': timestamps[valid],
+        'lat': lat[valid].round(7),
+        'lon': lon[valid].round(7),
+    })
+    clean = clean.drop_duplicates(subset=['vehicle_id', 'timestamp'], keep='last').reset_index(drop=True)
+    return clean, len(frame) - int(valid.sum())
+
+
+def copy_to_staging(conn: Connection, frame: pd.DataFrame) -> None:
+    """
+    Stream a clean batch into the gps_staging temp table with COPY
+
+    Supports the psycopg2 and psycopg (3) drivers; their COPY APIs differ.
+    """
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d %H:%M:%S.%f')
+    buffer.seek(0)
+
+    driver = conn.dialect.driver
+    if driver not in ('psycopg2', 'psycopg'):
+        raise RuntimeError(
+            f"GPS ingestion needs COPY support from psycopg2 or psycopg, not '{driver}' "
+            f"(use a postgresql+psycopg2:// or postgresql+psycopg:// database URL)"
+        )
+
+    cursor = conn.connection.cursor()
+    try:
+        if driver == 'psycopg2':
+            cursor.copy_expert(_COPY_STAGING, buffer)
+        else:
+            with cursor.copy(_COPY_STAGING) as copy:
+                while True:
+                    data = buffer.read(_COPY_CHUNK_SIZE)
+                    if not data:
+                        break
+                    copy.write(data)
+    finally:
+        cursor.close()
+
+
+def ingest_gps_batch(data: Union[str, bytes, IO], fmt: Optional[str] = None) -> Dict[str, int]:
+    """
+    Ingest one batch of GPS fixes in a single transaction
+
+    Re-sending a batch is safe: fixes already stored are skipped.
+
+    Returns:
+        Counts of received, rejected (invalid), inserted and skipped
+        (duplicate or unknown vehicle) fixes
+    """
+    frame = read_gps_batch(data, fmt)
+    clean, rejected = clean_gps_batch(frame)
+    result = {'received': len(frame), 'rejected': rejected, 'inserted': 0, 'skipped': 0}
+    if clean.empty:
+        return result
+
+    # Only the months present in the batch, not every month between its extremes
+    months = clean['timestamp'].dt.to_period('M').dt.start_time.drop_duplicates()
+    with get_database_engine().begin() as conn:
+        conn.execute(_ENSURE_PARTITIONS, [
+            {'from_ts': month.to_pydatetime(), 'to_ts': month.to_pydatetime()} for month in months
+        ])
+        conn.execute(_CREATE_STAGING)
+        copy_to_staging(conn, clean)
+        result['inserted'] = conn.execute(_INSERT_TRACKING).rowcount
+        conn.execute(_UPSERT_POSITIONS)
+
+    result['skipped'] = len(clean) - result['inserted']
+    if rejected:
+        logger.warning(f"GPS ingestion rejected {rejected} of {len(frame)} fixes")
+    logger.info(f"GPS ingestion: {result}")
+    return result
+
+
+def ingest_gps_file(path: str, fmt: Optional[str] = None) -> Dict[str, int]:
+    """Ingest a batch file; the format is taken from the extension when omitted"""
+    fmt = fmt or _FILE_FORMATS.get(os.path.splitext(path)[1].lower())
+    with open(path, 'rb') as handle:
+        if fmt is None:
+            fmt = detect_gps_format(handle.read(64))
+            handle.seek(0)
+        return ingest_gps_batch(handle, fmt)
+
+
+def latest_positions(session: Session) -> pd.DataFrame:
+    """Last known position of every tracked vehicle"""
+    rows = session.execute(
+        select(
+            Vehicle.id,
+            Vehicle.plate_number,
+            VehiclePosition.timestamp,
+            VehiclePosition.lat,
+            VehiclePosition.lon
+        ).join(VehiclePosition, VehiclePosition.vehicle_id == Vehicle.id)
+        .order_by(Vehicle.plate_number)
+    ).all()
+    frame = pd.DataFrame.from_records(rows, columns=['vehicle_id', 'plate_number', 'timestamp', 'lat', 'lon'])
+    frame[['lat', 'lon']] = frame[['lat', 'lon']].astype('float64')
+    return frame
+
+
+__all__ = [
+    'GPS_COLUMNS',
+    'GPS_FORMATS',
+    'MAX_FIX_AGE',
+    'detect_gps_format',
+    'read_gps_batch',
+    'parse_timestamps',
+    'clean_gps_batch',
+    'ingest_gps_batch',
+    'ingest_gps_file',
+    'latest_positions'
+]
@@ -0,0 +1,26 @@
+"""
+GPS coordinate validation for COMETA
+Vectorized range checks for whole coordinate columns. Depends only on NumPy
+and pandas, so headless jobs (GPS ingestion) can use it without pulling in the
+Streamlit helpers in utils.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def validate_gps_coordinates_bulk(lat, lon) -> np.ndarray:
+    """
+    Vectorized validate_gps_coordinates over whole columns
+
+    Returns a boolean NumPy mask; non-numeric or missing values are invalid.
+    """
+    lat = pd.to_numeric(pd.Series(lat), errors='coerce').to_numpy(dtype='float64')
+    lon = pd.to_numeric(pd.Series(lon), errors='coerce').to_numpy(dtype='float64')
+    # NaN compares False, so missing values fail the range checks
+    return (np.abs(lat) <= 90) & (np.abs(lon) <= 180)
+
+
+__all__ = [
+    'validate_gps_coordinates_bulk'
+]
@@ -0,0 +1,189 @@
+"""
+Stage material catalog for COMETA
+Caches the stage -> suggested materials mapping for all stages (loaded in one
+query) together with warehouse stock, so switching stages in the work entry
+form does not query the database
+"""
+
+import time
+import threading
+import logging
+from typing import Any, Dict, Iterable, List
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+try:
+    from .database import get_session
+    from .models import MaterialStageMapping, Material, CompanyWarehouse
+except ImportError:
+    from database import get_session
+    from models import MaterialStageMapping, Material, CompanyWarehouse
+
+logger = logging.getLogger(__name__)
+
+# ORM events only see changes made by this process; other writers (the Next.js
+# app, SQL scripts) are picked up after these intervals
+CATALOG_TTL_SECONDS = 600
+STOCK_TTL_SECONDS = 60
+
+_DIRTY_KEY = 'material_catalog_dirty'
+
+_lock = threading.Lock()
+_catalog: Dict[str, List[Dict[str, Any]]] = {}
+_catalog_loaded_at = 0.0
+_stock: Dict[Any, float] = {}
+_stock_loaded_at = 0.0
+
+
+def load_stage_catalog(session: Session) -> Dict[str, List[Dict[str, Any]]]:
+    """All stage suggestions in one query, required materials first"""
+    rows = session.execute(
+        select(
+            MaterialStageMapping.stage_name,
+            MaterialStageMapping.typical_quantity,
+            MaterialStageMapping.is_required,
+            MaterialStageMapping.notes,
+            Material.id,
+            Material.name,
+            Material.unit
+        ).join(
+            Material, MaterialStageMapping.material_id == Material.id
+        ).order_by(
+            MaterialStageMapping.stage_name,
+            MaterialStageMapping.is_required.desc(),
+            Material.name
+        )
+    ).all()
+
+    catalog: Dict[str, List[Dict[str, Any]]] = {}
+    for stage_name, typical_quantity, is_required, notes, material_id, name, unit in rows:
+        catalog.setdefault(stage_name, []).append({
+            'material_id': material_id,
+            'material_name': name,
+            'unit': unit,
+            'typical_quantity': float(typical_quantity) if typical_quantity else 0,
+            'is_required': is_required,
+            'notes': notes
+        })
+    return catalog
+
+
+def load_available_stock(session: Session, material_ids: Iterable) -> Dict[Any, float]:
+    """Available warehouse quantity (total - reserved) for many materials in one query"""
+    material_ids = list(material_ids)
+    if not material_ids:
+        return {}
+    rows = session.execute(
+        select(
+            CompanyWarehouse.material_id,
+            CompanyWarehouse.total_qty - CompanyWarehouse.reserved_qty
+        ).where(CompanyWarehouse.material_id.in_(material_ids))
+    ).all()
+    return {material_id: float(available or 0) for material_id, available in rows}
+
+
+def get_stage_catalog() -> Dict[str, List[Dict[str, Any]]]:
+    """Cached stage -> suggestions mapping (without stock)"""
+    global _catalog, _catalog_loaded_at
+    with _lock:
+        if _catalog_loaded_at and time.monotonic() - _catalog_loaded_at < CATALOG_TTL_SECONDS:
+            return _catalog
+
+    session = get_session()
+    try:
+        catalog = load_stage_catalog(session)
+    finally:
+        session.close()
+
+    with _lock:
+        _catalog = catalog
+        _catalog_loaded_at = time.monotonic()
+    return catalog
+
+
+def get_available_stock() -> Dict[Any, float]:
+    """Cached available stock for every material in the catalog"""
+    global _stock, _stock_loaded_at
+    catalog = get_stage_catalog()
+    with _lock:
+        if _stock_loaded_at and time.monotonic() - _stock_loaded_at < STOCK_TTL_SECONDS:
+            return _stock
+
+    material_ids = {item['material_id'] for items in catalog.values() for item in items}
+    session = get_session()
+    try:
+        stock = load_available_stock(session, material_ids)
+    finally:
+        session.close()
+
+    with _lock:
+        _stock = stock
+        _stock_loaded_at = time.monotonic()
+    return stock
+
+
+def suggested_materials(stage_name: str) -> List[Dict[str, Any]]:
+    """Suggestions for one stage with current_stock filled in, served from the cache"""
+    stock = get_available_stock()
+    return [
+        {**item, 'current_stock': stock.get(item['material_id'], 0.0)}
+        for item in get_stage_catalog().get(stage_name, [])
+    ]
+
+
+def invalidate_stage_catalog() -> None:
+    """Drop the cached catalog and stock"""
+    global _catalog_loaded_at, _stock_loaded_at
+    with _lock:
+        _catalog_loaded_at = 0.0
+        _stock_loaded_at = 0.0
+
+
+def invalidate_stock() -> None:
+    """Drop the cached stock only"""
+    global _stock_loaded_at
+    with _lock:
+        _stock_loaded_at = 0.0
+
+
+def _mark_dirty(kind: str):
+    def listener(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            # Reloaded after commit, so other sessions never cache uncommitted rows
+            session.info.setdefault(_DIRTY_KEY, set()).add(kind)
+    return listener
+
+
+def _after_commit(session: Session) -> None:
+    dirty = session.info.pop(_DIRTY_KEY, None)
+    if not dirty:
+        return
+    if 'catalog' in dirty:
+        invalidate_stage_catalog()
+    else:
+        invalidate_stock()
+
+
+def _after_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_KEY, None)
+
+
+for _model, _kind in ((MaterialStageMapping, 'catalog'), (Material, 'catalog'), (CompanyWarehouse, 'stock')):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _mark_dirty(_kind))
+
+event.listen(Session, 'after_commit', _after_commit)
+event.listen(Session, 'after_soft_rollback', lambda session, previous_transaction: _after_rollback(session))
+
+
+__all__ = [
+    'get_stage_catalog',
+    'get_available_stock',
+    'suggested_materials',
+    'load_stage_catalog',
+    'load_available_stock',
+    'invalidate_stage_catalog',
+    'invalidate_stock'
+]
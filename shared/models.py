@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime, Numeric, Text, ForeignKey, CheckConstraint
+from sqlalchemy import Column, String, Integer, BigInteger, Boolean, Date, DateTime, Numeric, Text, ForeignKey, CheckConstraint, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID, JSONB
@@ -185,6 +185,24 @@ class Photo(Base):
         CheckConstraint("label IN ('before','during','after','instrument','other')", name='check_photo_label'),
     )
 
+class PhotoLocationCheck(Base):
+    __tablename__ = 'photo_location_checks'
+    
+    photo_id = Column(UUID(as_uuid=True), ForeignKey('photos.id', ondelete='CASCADE'), primary_key=True)
+    status = Column(Text, nullable=False)  # ok, outlier, no_gps, no_reference
+    reference_type = Column(Text)  # house, segment, cabinet
+    reference_id = Column(UUID(as_uuid=True))
+    distance_m = Column(Numeric(10, 1))
+    threshold_m = Column(Numeric(10, 1), nullable=False)
+    checked_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Relationships
+    photo = relationship("Photo")
+    
+    __table_args__ = (
+        CheckConstraint("status IN ('ok','outlier','no_gps','no_reference')", name='check_photo_location_status'),
+    )
+
 class Crew(Base):
     __tablename__ = 'crews'
     
@@ -549,14 +567,64 @@ class VehicleExpense(Base):
 class VehicleTracking(Base):
     __tablename__ = 'vehicle_tracking'
     
+    # Keys of a partitioned table must include the partition column
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     vehicle_id = Column(UUID(as_uuid=True), ForeignKey('vehicles.id'), nullable=False)
-    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=datetime.utcnow)
     lat = Column(Numeric(10, 7))
     lon = Column(Numeric(10, 7))
+    created_at = Column(DateTime, default=datetime.utcnow)  # Ingestion time; fixes may arrive late
+    
+    # Relationships
+    vehicle = relationship("Vehicle")
+    
+    # Range-partitioned by month on timestamp. The table, its monthly
+    # partitions and ensure_vehicle_tracking_partitions() are created only by
+    # the 20251109 migration; create_all would leave a parent without
+    # partitions that rejects every insert. The unique index keeps re-sent
+    # fixes from being stored twice.
+    __table_args__ = (
+        Index('uq_vehicle_tracking_vehicle_timestamp', 'vehicle_id', 'timestamp', unique=True),
+        Index('idx_vehicle_tracking_vehicle_created_at', 'vehicle_id', 'created_at'),
+        {'postgresql_partition_by': 'RANGE ("timestamp")'},
+    )
+
+class VehiclePosition(Base):
+    __tablename__ = 'vehicle_positions'
+    
+    vehicle_id = Column(UUID(as_uuid=True), ForeignKey('vehicles.id', ondelete='CASCADE'), primary_key=True)
+    timestamp = Column(DateTime, nullable=False)
+    lat = Column(Numeric(10, 7), nullable=False)
+    lon = Column(Numeric(10, 7), nullable=False)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    # Relationships
+    vehicle = relationship("Vehicle")
+
+class VehicleTrip(Base):
+    __tablename__ = 'vehicle_trips'
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    vehicle_id = Column(UUID(as_uuid=True), ForeignKey('vehicles.id', ondelete='CASCADE'), nullable=False)
+    started_at = Column(DateTime, nullable=False)
+    ended_at = Column(DateTime, nullable=False)
+    distance_km = Column(Numeric(10, 3), nullable=False)
+    fix_count = Column(Integer, nullable=False)
+    polyline = Column(JSONB, nullable=False, default=list)  # Simplified [[lat, lon], ...]
+    created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     vehicle = relationship("Vehicle")
+    
+    __table_args__ = (
+        UniqueConstraint('vehicle_id', 'started_at', name='uq_vehicle_trips_vehicle_started_at'),
+    )
+
+class VehicleTripScan(Base):
+    __tablename__ = 'vehicle_trip_scans'
+    
+    vehicle_id = Column(UUID(as_uuid=True), ForeignKey('vehicles.id', ondelete='CASCADE'), primary_key=True)
+    ingested_through = Column(DateTime)  # Fixes ingested up to here are in trips; NULL before the first run
 
 class RentalExpense(Base):
     __tablename__ = 'rental_expenses'
@@ -693,6 +761,10 @@ class MaterialStageMapping(Base):
     
     # Relationships
     material = relationship("Material")
+    
+    __table_args__ = (
+        UniqueConstraint('stage_name', 'material_id', name='uq_material_stage_mapping_stage_material'),
+    )
 
 # Additional Project Preparation Models
 
@@ -1076,8 +1148,17 @@ class DocumentReminder(Base):
                        name='check_notification_method'),
         CheckConstraint("status IN ('pending','sent','failed')",
                        name='check_reminder_status'),
+        UniqueConstraint('document_id', 'reminder_type', 'days_before_expiry', 'reminder_date',
+                         name='uq_document_reminders_dedup'),
     )
 
+class DocumentExpiryScan(Base):
+    __tablename__ = 'document_expiry_scans'
+
+    scanner = Column(Text, primary_key=True, default='worker_documents')
+    scanned_through = Column(Date, nullable=False)  # Reminder dates up to here are generated
+    last_run_at = Column(DateTime)  # Documents changed after this are re-checked; NULL before the first run
+
 
 
 # Additional models for existing database tables - CORRECTED VERSIONS
@@ -1110,11 +1191,12 @@ class InAppNotification(Base):
     message = Column(Text, nullable=False)
     notification_type = Column(Text, default='info')
     priority = Column(Text)
-    is_read = Column(Boolean, default=False)
+    is_read = Column(Boolean, nullable=False, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     read_at = Column(DateTime)
     expires_at = Column(DateTime)
     metadata_json = Column(JSONB)
+    dedup_key = Column(Text)  # Unique where set, for generated notifications
 
     # Relationships
     user = relationship("User")
@@ -1123,6 +1205,14 @@ class InAppNotification(Base):
         CheckConstraint("notification_type IN ('info','warning','error','success')", name='check_notification_type'),
     )
 
+class NotificationUnreadCount(Base):
+    __tablename__ = 'notification_unread_counts'
+
+    # Maintained by statement-level triggers on in_app_notifications
+    user_id = Column(UUID(as_uuid=True), ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    unread_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class CompanyWarehouseMaterial(Base):
     __tablename__ = 'company_warehouse_materials'
 
@@ -1218,3 +1308,21 @@ class SupplierContact(Base):
 
     # Relationships
     supplier = relationship("Supplier")
+
+class DashboardSnapshot(Base):
+    __tablename__ = 'dashboard_snapshots'
+
+    scope = Column(Text, primary_key=True, default='portfolio')
+    metrics = Column(JSONB, nullable=False, default=dict)
+    source_versions = Column(JSONB, nullable=False, default=dict)  # dashboard_source_versions per table at refresh time
+    snapshot_date = Column(Date, nullable=False)
+    computed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    refreshed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class DashboardSourceVersion(Base):
+    __tablename__ = 'dashboard_source_versions'
+
+    # Bumped by statement-level triggers on the KPI source tables (20251116 migration)
+    table_name = Column(Text, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
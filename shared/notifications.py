@@ -0,0 +1,177 @@
+"""
+In-app notifications for COMETA
+Bulk delivery to everyone on a project's crews with one INSERT ... SELECT,
+per-user unread counters kept current by database triggers (so the
+notification bell is a primary key lookup instead of a COUNT(*)), mark-all-read
+as one UPDATE and batched purging of expired notifications.
+"""
+
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import String, delete, func, literal, null, or_, select, union, update
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.orm import Session
+
+try:
+    from .database import get_database_engine
+    from .models import User, Crew, CrewMember, InAppNotification, NotificationUnreadCount
+except ImportError:
+    from database import get_database_engine
+    from models import User, Crew, CrewMember, InAppNotification, NotificationUnreadCount
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 5000
+
+NOTIFICATION_COLUMNS = [
+    'id', 'user_id', 'title', 'message', 'notification_type', 'priority',
+    'is_read', 'created_at', 'expires_at', 'metadata_json', 'dedup_key'
+]
+
+
+def project_recipients(project_id, on_date: Optional[date] = None):
+    """
+    Select of the distinct active users on a project's crews (members active
+    on the given day and foremen)
+    """
+    on_date = on_date or date.today()
+    members = select(CrewMember.user_id.label('user_id')).join(
+        Crew, Crew.id == CrewMember.crew_id
+    ).where(
+        Crew.project_id == project_id,
+        or_(CrewMember.active_from.is_(None), CrewMember.active_from <= on_date),
+        or_(CrewMember.active_to.is_(None), CrewMember.active_to >= on_date)
+    )
+    foremen = select(Crew.foreman_user_id.label('user_id')).where(
+        Crew.project_id == project_id,
+        Crew.foreman_user_id.isnot(None)
+    )
+    recipients = union(members, foremen).subquery('recipients')
+    return select(recipients.c.user_id).join(
+        User, User.id == recipients.c.user_id
+    ).where(User.is_active.isnot(False))
+
+
+def notify_project_crews(session: Session, project_id, title: str, message: str,
+                         notification_type: str = 'info', priority: str = 'medium',
+                         expires_at: Optional[datetime] = None,
+                         metadata: Optional[Dict[str, Any]] = None,
+                         dedup_key: Optional[str] = None,
+                         on_date: Optional[date] = None) -> int:
+    """
+    Deliver one notification to every crew member of a project
+
+    Args:
+        session: Database session (the caller commits)
+        project_id: Project whose crews are notified
+        title, message, notification_type, priority, expires_at: Notification
+            fields, the same for every recipient; priority defaults to
+            'medium' like the column
+        metadata: Optional JSON stored in metadata_json
+        dedup_key: Optional key; recipients who already got a notification
+            with this key are skipped, so the call can be retried
+        on_date: Day crew membership is evaluated for (default today)
+
+    Returns:
+        Number of notifications created
+    """
+    recipients = project_recipients(project_id, on_date).subquery('recipient')
+    source = select(
+        func.gen_random_uuid(),
+        recipients.c.user_id,
+        literal(title),
+        literal(message),
+        literal(notification_type),
+        literal(priority, String),
+        literal(False),
+        literal(datetime.utcnow()),
+        literal(expires_at) if expires_at is not None else null(),
+        literal(metadata, JSONB) if metadata is not None else null(),
+        func.concat(dedup_key, ':', recipients.c.user_id) if dedup_key else null()
+    )
+
+    stmt = insert(InAppNotification).from_select(NOTIFICATION_COLUMNS, source)
+    if dedup_key:
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=['dedup_key'],
+            index_where=InAppNotification.dedup_key.isnot(None)
+        )
+    result = session.execute(stmt)
+    logger.info(f"Notified {result.rowcount} crew members of project {project_id}: {title}")
+    return result.rowcount
+
+
+def unread_count(session: Session, user_id) -> int:
+    """Unread notifications of a user, from the maintained counter"""
+    count = session.execute(
+        select(NotificationUnreadCount.unread_count).where(NotificationUnreadCount.user_id == user_id)
+    ).scalar()
+    return count or 0
+
+
+def mark_read(session: Session, user_id, notification_ids: Iterable) -> int:
+    """Mark some of a user's notifications read; the caller commits"""
+    notification_ids = list(notification_ids)
+    if not notification_ids:
+        return 0
+    result = session.execute(
+        update(InAppNotification)
+        .where(
+            InAppNotification.user_id == user_id,
+            InAppNotification.id.in_(notification_ids),
+            ~InAppNotification.is_read
+        )
+        .values(is_read=True, read_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def mark_all_read(session: Session, user_id) -> int:
+    """Mark every unread notification of a user read with one UPDATE; the caller commits"""
+    result = session.execute(
+        update(InAppNotification)
+        .where(InAppNotification.user_id == user_id, ~InAppNotification.is_read)
+        .values(is_read=True, read_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def purge_expired_notifications(now: Optional[datetime] = None,
+                                batch_size: int = PURGE_BATCH_SIZE) -> int:
+    """
+    Delete notifications past expires_at, one transaction per batch
+
+    Small batches keep row locks and counter updates short while users are
+    reading and marking notifications. Returns the number deleted.
+    """
+    now = now or datetime.utcnow()
+    engine = get_database_engine()
+    purged = 0
+    while True:
+        expired = select(InAppNotification.id).where(
+            InAppNotification.expires_at < now
+        ).limit(batch_size).with_for_update(skip_locked=True)
+        with engine.begin() as conn:
+            deleted = conn.execute(
+                delete(InAppNotification).where(InAppNotification.id.in_(expired))
+            ).rowcount
+        purged += deleted
+        if deleted < batch_size:
+            break
+
+    logger.info(f"Purged {purged} expired notifications")
+    return purged
+
+
+__all__ = [
+    'project_recipients',
+    'notify_project_crews',
+    'unread_count',
+    'mark_read',
+    'mark_all_read',
+    'purge_expired_notifications'
+]
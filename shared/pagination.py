@@ -0,0 +1,260 @@
+"""
+Keyset pagination for COMETA table views
+Fetches one page of a select() at a time, seeking past the last row seen instead
+of using OFFSET, and estimates total counts from the query plan when exact
+counts would be expensive
+"""
+
+import json
+import uuid
+import logging
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import and_, false, func, or_, select, tuple_
+from sqlalchemy.engine import Engine
+
+try:
+    from .database import get_database_engine
+    from .dataframe_loader import rows_to_dataframe
+except ImportError:
+    from database import get_database_engine
+    from dataframe_loader import rows_to_dataframe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+
+# Below this planner estimate an exact COUNT(*) is cheap enough to run
+EXACT_COUNT_THRESHOLD = 10000
+
+QueryFactory = Callable[[], Any]
+
+
+@dataclass
+class SortKey:
+    """
+    One ORDER BY column; the key list must end with a unique, non-null column
+
+    Nullable columns sort with NULLS LAST in both directions. `nullable` is
+    read from the mapped column when not given; expressions without that
+    information are treated as nullable.
+    """
+    column: Any
+    descending: bool = False
+    nullable: Optional[bool] = None
+
+    def __post_init__(self):
+        if self.nullable is None:
+            self.nullable = getattr(getattr(self.column, 'expression', self.column), 'nullable', True)
+
+    def order_by(self):
+        ordered = self.column.desc() if self.descending else self.column.asc()
+        return ordered.nulls_last() if self.nullable else ordered
+
+
+@dataclass
+class Page:
+    """One fetched page"""
+    rows: pd.DataFrame
+    next_cursor: Optional[Tuple]
+    has_next: bool
+
+
+@dataclass
+class RowCount:
+    """Total row count; approximate counts come from the planner estimate"""
+    value: int
+    approximate: bool = False
+
+
+def keyset_condition(sort_keys: Sequence[SortKey], cursor: Sequence):
+    """
+    WHERE clause selecting rows strictly after `cursor` in sort order
+
+    Uses a single row-value comparison when all keys sort the same way and
+    none is nullable (which a composite index can serve directly), otherwise
+    the expanded OR form, where NULLs (sorted last) get explicit IS NULL
+    branches.
+    """
+    columns = [key.column for key in sort_keys]
+    same_direction = all(key.descending == sort_keys[0].descending for key in sort_keys)
+    if same_direction and not any(key.nullable for key in sort_keys):
+        if len(columns) == 1:
+            return columns[0] < cursor[0] if sort_keys[0].descending else columns[0] > cursor[0]
+        if sort_keys[0].descending:
+            return tuple_(*columns) < tuple_(*cursor)
+        return tuple_(*columns) > tuple_(*cursor)
+
+    def equal(key: SortKey, value):
+        return key.column.is_(None) if value is None else key.column == value
+
+    def after(key: SortKey, value):
+        if value is None:
+            return false()  # Nothing sorts after NULL
+        beyond = key.column < value if key.descending else key.column > value
+        return or_(beyond, key.column.is_(None)) if key.nullable else beyond
+
+    clauses = []
+    for i, key in enumerate(sort_keys):
+        clauses.append(and_(*[equal(sort_keys[j], cursor[j]) for j in range(i)], after(key, cursor[i])))
+    return or_(*clauses)
+
+
+class KeysetPaginator:
+    """Pages through the select() produced by a query factory"""
+
+    def __init__(self, query_factory: QueryFactory, sort_keys: Sequence[SortKey],
+                 page_size: int = DEFAULT_PAGE_SIZE, engine: Optional[Engine] = None):
+        """
+        Args:
+            query_factory: Returns a fresh select() with filters applied (no ORDER BY/LIMIT)
+            sort_keys: Ordering; the last key must be unique (e.g. the primary key)
+            page_size: Rows per page
+            engine: Engine to use (defaults to the application engine)
+        """
+        if not sort_keys:
+            raise ValueError("At least one sort key is required")
+        self.query_factory = query_factory
+        self.sort_keys = list(sort_keys)
+        self.page_size = page_size
+        self.engine = engine or get_database_engine()
+
+    def fetch_page(self, cursor: Optional[Sequence] = None) -> Page:
+        """Fetch the page after `cursor` (the first page when cursor is None)"""
+        stmt = self.query_factory()
+        keys = [key.column for key in self.sort_keys]
+        # Cursor values are read from the raw rows, so they bind back unchanged
+        paged = stmt.add_columns(*[column.label(f"_cursor_{i}") for i, column in enumerate(keys)])
+        if cursor is not None:
+            paged = paged.where(keyset_condition(self.sort_keys, cursor))
+        paged = paged.order_by(*[key.order_by() for key in self.sort_keys]).limit(self.page_size + 1)
+
+        with self.engine.connect() as conn:
+            result = conn.execute(paged)
+            rows = result.all()
+
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        width = len(rows[0]) - len(keys) if rows else 0
+        next_cursor = tuple(rows[-1][width:]) if rows and has_next else None
+
+        result_keys = [column.key for column in stmt.selected_columns]
+        data = rows_to_dataframe(stmt, result_keys, [row[:len(result_keys)] for row in rows])
+        return Page(rows=data, next_cursor=next_cursor, has_next=has_next)
+
+    def count(self, exact_threshold: int = EXACT_COUNT_THRESHOLD) -> RowCount:
+        """
+        Total rows matching the query
+
+        Large results are answered from the planner's row estimate (EXPLAIN),
+        which costs no table scan; small ones get an exact COUNT(*).
+        """
+        stmt = self.query_factory()
+        estimate = self.estimate_rows(stmt)
+        if estimate is not None and estimate > exact_threshold:
+            return RowCount(value=estimate, approximate=True)
+
+        with self.engine.connect() as conn:
+            total = conn.execute(select(func.count()).select_from(stmt.order_by(None).subquery())).scalar()
+        return RowCount(value=int(total or 0))
+
+    def estimate_rows(self, stmt) -> Optional[int]:
+        """Planner row estimate for a statement, or None where unavailable"""
+        if self.engine.dialect.name != 'postgresql':
+            return None
+        try:
+            # Values are rendered inline through the column types' literal
+            # processors; raw driver parameters would skip the bind processors
+            compiled = stmt.compile(dialect=self.engine.dialect, compile_kwargs={'literal_binds': True})
+            with self.engine.connect() as conn:
+                plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}").scalar()
+        except Exception as e:
+            logger.warning(f"Row estimate failed: {e}")
+            return None
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _signature_value(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, Decimal)):
+        return str(value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), _signature_value(item)) for key, item in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted((_signature_value(item) for item in value), key=repr))
+    if isinstance(value, (list, tuple)):
+        return tuple(_signature_value(item) for item in value)
+    if hasattr(value, 'id'):
+        # ORM rows: a fresh instance per rerun, so identify them by primary key
+        return (type(value).__name__, _signature_value(value.id))
+    return str(value)
+
+
+def state_signature(*values) -> str:
+    """
+    Stable signature of sort/filter state, built from primitive values
+
+    repr() of ORM objects contains their memory address, which changes on
+    every Streamlit rerun and would reset the table each time.
+    """
+    return json.dumps(_signature_value(values))
+
+
+class PageCursorStack:
+    """
+    Cursors of the pages visited so far plus a small cache of fetched pages
+
+    Keyset pagination can only move forward from a cursor, so the cursor that
+    starts each visited page is kept to allow stepping back. Only the current
+    page and its neighbours stay cached.
+    """
+
+    def __init__(self):
+        self.cursors: List[Optional[Tuple]] = [None]
+        self.pages = {}
+        self.page_number = 0
+        self.total: Optional[RowCount] = None
+
+    def current(self, paginator: KeysetPaginator) -> Page:
+        page = self._get(paginator, self.page_number)
+        if page.has_next and len(self.cursors) <= self.page_number + 1:
+            self.cursors.append(page.next_cursor)
+        return page
+
+    def prefetch_next(self, paginator: KeysetPaginator) -> None:
+        """Load the following page so the Next click is served from the cache"""
+        if len(self.cursors) > self.page_number + 1:
+            self._get(paginator, self.page_number + 1)
+
+    def move(self, step: int) -> None:
+        target = self.page_number + step
+        if 0 <= target < len(self.cursors):
+            self.page_number = target
+        # Keep the neighbours only, so memory stays bounded on long walks
+        self.pages = {n: p for n, p in self.pages.items() if abs(n - self.page_number) <= 1}
+
+    def _get(self, paginator: KeysetPaginator, number: int) -> Page:
+        if number not in self.pages:
+            self.pages[number] = paginator.fetch_page(self.cursors[number])
+        return self.pages[number]
+
+
+__all__ = [
+    'SortKey',
+    'Page',
+    'RowCount',
+    'KeysetPaginator',
+    'PageCursorStack',
+    'keyset_condition',
+    'state_signature',
+    'DEFAULT_PAGE_SIZE'
+]
@@ -0,0 +1,233 @@
+"""
+Photo location checks for COMETA
+Batch job measuring how far each photo's GPS fix is from the place its work
+entry refers to (house point, segment line - directly or via the cut - or
+cabinet point) and storing the verdict in photo_location_checks, so approval
+screens read a flag instead of computing geometry per photo
+"""
+
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+try:
+    from .database import get_database_engine
+    from .models import Photo, PhotoLocationCheck, WorkEntry, Cut, Segment, House, Cabinet
+    from .spatial import parse_geometry, points_distance_m
+except ImportError:
+    from database import get_database_engine
+    from models import Photo, PhotoLocationCheck, WorkEntry, Cut, Segment, House, Cabinet
+    from spatial import parse_geometry, points_distance_m
+
+logger = logging.getLogger(__name__)
+
+# Phone GPS is good to a few tens of meters; beyond this the photo is flagged
+DEFAULT_THRESHOLD_M = 100.0
+CHECK_BATCH_SIZE = 5000
+
+# Most specific reference first
+REFERENCE_TYPES = ('house', 'segment', 'cabinet')
+
+
+def _batch_query(after_id, batch_size: int, recheck: bool):
+    segment_id = func.coalesce(WorkEntry.segment_id, Cut.segment_id)
+    stmt = select(
+        Photo.id.label('photo_id'),
+        Photo.gps_lat,
+        Photo.gps_lon,
+        WorkEntry.house_id,
+        House.geom_point.label('house_geom'),
+        segment_id.label('segment_id'),
+        Segment.geom_line.label('segment_geom'),
+        WorkEntry.cabinet_id,
+        Cabinet.geom_point.label('cabinet_geom')
+    ).select_from(Photo).outerjoin(
+        WorkEntry, WorkEntry.id == Photo.work_entry_id
+    ).outerjoin(
+        Cut, Cut.id == WorkEntry.cut_id
+    ).outerjoin(
+        House, House.id == WorkEntry.house_id
+    ).outerjoin(
+        Segment, Segment.id == segment_id
+    ).outerjoin(
+        Cabinet, Cabinet.id == WorkEntry.cabinet_id
+    ).order_by(Photo.id).limit(batch_size)
+
+    if after_id is not None:
+        stmt = stmt.where(Photo.id > after_id)
+    if not recheck:
+        stmt = stmt.outerjoin(
+            PhotoLocationCheck, PhotoLocationCheck.photo_id == Photo.id
+        ).where(PhotoLocationCheck.photo_id.is_(None))
+    return stmt
+
+
+def evaluate_photos(photos: pd.DataFrame, threshold_m: float = DEFAULT_THRESHOLD_M) -> pd.DataFrame:
+    """
+    Verdict per photo
+
+    Args:
+        photos: Frame as returned by the batch query (photo_id, gps_lat,
+            gps_lon and id / geometry columns per reference type)
+        threshold_m: Distance above which a photo is an outlier
+
+    Returns:
+        Frame with photo_id, status, reference_type, reference_id and
+        distance_m. Distances are computed per reference geometry, for all
+        of its photos at once.
+    """
+    lat = pd.to_numeric(photos['gps_lat'], errors='coerce').to_numpy(dtype='float64')
+    lon = pd.to_numeric(photos['gps_lon'], errors='coerce').to_numpy(dtype='float64')
+    has_gps = ~(np.isnan(lat) | np.isnan(lon))
+
+    reference_type = np.full(len(photos), None, dtype=object)
+    reference_id = np.full(len(photos), None, dtype=object)
+    distance = np.full(len(photos), np.nan)
+
+    for kind in REFERENCE_TYPES:
+        ids = photos[f'{kind}_id'].to_numpy(dtype=object)
+        geometries = photos[f'{kind}_geom'].to_numpy(dtype=object)
+        pending = np.flatnonzero(pd.isna(reference_type) & pd.notna(ids))
+        for ref_id, rows in pd.Series(pending).groupby(ids[pending]):
+            rows = rows.to_numpy()
+            geometry = parse_geometry(geometries[rows[0]])
+            if geometry is None:
+                continue
+            reference_type[rows] = kind
+            reference_id[rows] = ref_id
+            measurable = rows[has_gps[rows]]
+            if len(measurable):
+                distance[measurable] = points_distance_m(lat[measurable], lon[measurable], geometry)
+
+    status = np.where(
+        ~has_gps, 'no_gps',
+        np.where(pd.isna(reference_type), 'no_reference',
+                 np.where(distance > threshold_m, 'outlier', 'ok'))
+    )
+    return pd.DataFrame({
+        'photo_id': photos['photo_id'].to_numpy(),
+        'status': status,
+        'reference_type': reference_type,
+        'reference_id': reference_id,
+        'distance_m': np.round(distance, 1)
+    })
+
+
+def _store_checks(conn: Connection, results: pd.DataFrame, threshold_m: float) -> None:
+    now = datetime.utcnow()
+    rows = [
+        {
+            'photo_id': photo_id,
+            'status': status,
+            'reference_type': reference_type,
+            'reference_id': reference_id,
+            'distance_m': None if np.isnan(distance_m) else float(distance_m),
+            'threshold_m': threshold_m,
+            'checked_at': now
+        }
+        for photo_id, status, reference_type, reference_id, distance_m in results.itertuples(index=False)
+    ]
+    stmt = insert(PhotoLocationCheck)
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=['photo_id'],
+        set_={column: stmt.excluded[column] for column in
+              ('status', 'reference_type', 'reference_id', 'distance_m', 'threshold_m', 'checked_at')}
+    ), rows)
+
+
+def check_photo_locations(threshold_m: float = DEFAULT_THRESHOLD_M, recheck: bool = False,
+                          batch_size: int = CHECK_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Check photo locations in batches, one transaction per batch
+
+    Args:
+        threshold_m: Distance above which a photo is flagged
+        recheck: Re-evaluate every photo (after geometry changes or a new
+            threshold) instead of only photos without a check
+        batch_size: Photos per batch
+
+    Returns:
+        Number of photos per status
+    """
+    counts = {status: 0 for status in ('ok', 'outlier', 'no_gps', 'no_reference')}
+    after_id = None
+    engine = get_database_engine()
+    while True:
+        with engine.begin() as conn:
+            result = conn.execute(_batch_query(after_id, batch_size, recheck))
+            photos = pd.DataFrame.from_records(result.all(), columns=list(result.keys()))
+            if photos.empty:
+                break
+            results = evaluate_photos(photos, threshold_m)
+            _store_checks(conn, results, threshold_m)
+
+        for status, count in results['status'].value_counts().items():
+            counts[status] += int(count)
+        after_id = photos['photo_id'].iloc[-1]
+        if len(photos) < batch_size:
+            break
+
+    logger.info(f"Photo location check: {counts}")
+    return counts
+
+
+def photo_location_flags(session: Session, work_entry_ids: Iterable) -> Dict[Any, Dict[str, Any]]:
+    """Stored checks for the photos of some work entries, keyed by photo id"""
+    work_entry_ids = list(work_entry_ids)
+    if not work_entry_ids:
+        return {}
+    rows = session.execute(
+        select(
+            PhotoLocationCheck.photo_id,
+            PhotoLocationCheck.status,
+            PhotoLocationCheck.reference_type,
+            PhotoLocationCheck.distance_m
+        ).join(Photo, Photo.id == PhotoLocationCheck.photo_id)
+        .where(Photo.work_entry_id.in_(work_entry_ids))
+    ).all()
+    return {
+        photo_id: {
+            'status': status,
+            'reference_type': reference_type,
+            'distance_m': float(distance_m) if distance_m is not None else None
+        }
+        for photo_id, status, reference_type, distance_m in rows
+    }
+
+
+def flagged_photos(session: Session, project_id=None, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
+    """Outlier photos, most recently checked first"""
+    stmt = select(
+        Photo.id,
+        Photo.work_entry_id,
+        Photo.url,
+        PhotoLocationCheck.reference_type,
+        PhotoLocationCheck.distance_m
+    ).join(PhotoLocationCheck, PhotoLocationCheck.photo_id == Photo.id).where(
+        PhotoLocationCheck.status == 'outlier'
+    ).order_by(PhotoLocationCheck.checked_at.desc())
+    if project_id is not None:
+        stmt = stmt.join(WorkEntry, WorkEntry.id == Photo.work_entry_id).where(WorkEntry.project_id == project_id)
+    if limit:
+        stmt = stmt.limit(limit)
+    return [
+        {'photo_id': photo_id, 'work_entry_id': work_entry_id, 'url': url,
+         'reference_type': reference_type, 'distance_m': float(distance_m)}
+        for photo_id, work_entry_id, url, reference_type, distance_m in session.execute(stmt)
+    ]
+
+
+__all__ = [
+    'DEFAULT_THRESHOLD_M',
+    'evaluate_photos',
+    'check_photo_locations',
+    'photo_location_flags',
+    'flagged_photos'
+]
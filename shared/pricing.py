@@ -0,0 +1,228 @@
+"""
+Pricing engine for COMETA
+Prices work entries against a project's active PriceList: PriceRule rates are
+held in a (surface x depth band) lookup table and whole batches of entries are
+classified and priced with NumPy instead of a Python loop per row
+"""
+
+import logging
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+try:
+    from .models import PriceList, PriceRule, PriceExtra, Project, WorkEntry, Segment
+    from .dataframe_loader import rows_to_dataframe
+    from .query_filters import work_entry_approved
+except ImportError:
+    from models import PriceList, PriceRule, PriceExtra, Project, WorkEntry, Segment
+    from dataframe_loader import rows_to_dataframe
+    from query_filters import work_entry_approved
+
+logger = logging.getLogger(__name__)
+
+SURFACES = ('asphalt', 'concrete', 'dirt', 'grass', 'paving')
+DEPTH_BANDS = ('0-50cm', '50-80cm', '80-120cm', '120cm+')
+
+# Upper band limits in cm; a depth on a limit belongs to the lower band
+DEPTH_BAND_EDGES_CM = np.array([50.0, 80.0, 120.0])
+
+# Segment surfaces use different names than price rules
+SEGMENT_SURFACE_MAP = {'pavers': 'paving', 'green': 'grass'}
+
+_SURFACE_INDEX = {surface: i for i, surface in enumerate(SURFACES)}
+
+
+@dataclass
+class PriceTable:
+    """A price list compiled for vectorized lookups"""
+    price_list_id: Any
+    rates: np.ndarray  # shape (len(SURFACES), len(DEPTH_BANDS)); NaN where no rule exists
+    base_rate: float
+    extras: List[Dict[str, Any]] = field(default_factory=list)
+
+    def rates_for(self, surface_idx: np.ndarray, band_idx: np.ndarray) -> np.ndarray:
+        """Rate per meter for each entry, falling back to the project base rate"""
+        known = (surface_idx >= 0) & (band_idx >= 0)
+        rates = np.full(surface_idx.shape, np.nan)
+        rates[known] = self.rates[surface_idx[known], band_idx[known]]
+        return np.where(np.isnan(rates), self.base_rate, rates)
+
+
+def classify_depth_bands(depth_m) -> np.ndarray:
+    """Depth band index per entry (-1 for missing depth)"""
+    depth_cm = np.asarray(depth_m, dtype='float64') * 100
+    bands = np.digitize(depth_cm, DEPTH_BAND_EDGES_CM, right=True)
+    return np.where(np.isnan(depth_cm), -1, bands)
+
+
+def surface_indices(surfaces) -> np.ndarray:
+    """Surface index per entry (-1 for unknown surfaces)"""
+    normalized = pd.Series(surfaces, dtype=object).replace(SEGMENT_SURFACE_MAP)
+    return normalized.map(_SURFACE_INDEX).fillna(-1).astype('int64').to_numpy()
+
+
+def load_price_table(session: Session, project_id, as_of: Optional[date] = None) -> PriceTable:
+    """
+    Compile the project's active price list (as of a date) into a PriceTable
+
+    Without an active price list every entry is priced at the project's
+    base_rate_per_m.
+    """
+    as_of = as_of or date.today()
+    base_rate = session.execute(
+        select(Project.base_rate_per_m).where(Project.id == project_id)
+    ).scalar()
+    base_rate = float(base_rate or 0)
+
+    price_list_id = session.execute(
+        select(PriceList.id).where(
+            PriceList.project_id == project_id,
+            PriceList.is_active.is_(True),
+            or_(PriceList.valid_from.is_(None), PriceList.valid_from <= as_of),
+            or_(PriceList.valid_to.is_(None), PriceList.valid_to >= as_of)
+        ).order_by(PriceList.valid_from.desc().nullslast()).limit(1)
+    ).scalar()
+
+    rates = np.full((len(SURFACES), len(DEPTH_BANDS)), np.nan)
+    if price_list_id is None:
+        return PriceTable(price_list_id=None, rates=rates, base_rate=base_rate)
+
+    band_index = {band: i for i, band in enumerate(DEPTH_BANDS)}
+    for surface, depth_band, rate in session.execute(
+        select(PriceRule.surface, PriceRule.depth_band, PriceRule.rate_per_m)
+        .where(PriceRule.price_list_id == price_list_id)
+    ):
+        if surface in _SURFACE_INDEX and depth_band in band_index:
+            rates[_SURFACE_INDEX[surface], band_index[depth_band]] = float(rate)
+
+    extras = [
+        {'type': extra_type, 'description': description, 'unit': unit, 'rate': float(rate)}
+        for extra_type, description, unit, rate in session.execute(
+            select(PriceExtra.type, PriceExtra.description, PriceExtra.unit, PriceExtra.rate)
+            .where(PriceExtra.price_list_id == price_list_id)
+        )
+    ]
+    return PriceTable(price_list_id=price_list_id, rates=rates, base_rate=base_rate, extras=extras)
+
+
+def price_work_entries(table: PriceTable, entries: pd.DataFrame) -> pd.DataFrame:
+    """
+    Price a batch of work entries
+
+    Args:
+        table: Compiled price list
+        entries: Frame with meters_done_m, depth_m and surface columns
+
+    Returns:
+        Copy of entries with depth_band, rate_per_m and amount_eur added
+    """
+    priced = entries.copy()
+    band_idx = classify_depth_bands(priced['depth_m'])
+    rates = table.rates_for(surface_indices(priced['surface']), band_idx)
+
+    labels = np.array(DEPTH_BANDS + (None,), dtype=object)
+    priced['depth_band'] = labels[band_idx]
+    priced['rate_per_m'] = rates
+    priced['amount_eur'] = priced['meters_done_m'].astype('float64').fillna(0).to_numpy() * rates
+    return priced
+
+
+def price_extras(table: PriceTable, entries: pd.DataFrame,
+                 extra_quantities: Optional[Dict[str, float]] = None) -> pd.DataFrame:
+    """
+    Price the list's extras
+
+    The weekend surcharge is derived from the entries themselves (weekend
+    meters, days or entries depending on its unit). Other extras are billed for
+    the quantities given in extra_quantities, keyed by extra type.
+    """
+    extra_quantities = extra_quantities or {}
+    lines = []
+
+    weekend = pd.to_datetime(entries['date']).dt.dayofweek.to_numpy() >= 5 if len(entries) else np.array([], dtype=bool)
+    weekend_entries = entries[weekend]
+
+    for extra in table.extras:
+        unit = extra['unit']
+        if extra['type'] == 'weekend_surcharge':
+            if unit == 'per_m':
+                quantity = float(weekend_entries['meters_done_m'].astype('float64').sum())
+            elif unit == 'per_day':
+                quantity = float(weekend_entries['date'].nunique())
+            elif unit == 'per_piece':
+                quantity = float(len(weekend_entries))
+            elif unit == 'lump_sum':
+                quantity = 1.0 if len(weekend_entries) else 0.0
+            else:
+                quantity = float(extra_quantities.get(extra['type'], 0))
+        else:
+            quantity = float(extra_quantities.get(extra['type'], 0))
+            if unit == 'lump_sum':
+                quantity = 1.0 if quantity else 0.0
+
+        if quantity:
+            lines.append({**extra, 'quantity': quantity, 'amount_eur': quantity * extra['rate']})
+
+    return pd.DataFrame(lines, columns=['type', 'description', 'unit', 'rate', 'quantity', 'amount_eur'])
+
+
+def load_work_entries_for_pricing(session: Session, project_id, approved_only: bool = True) -> pd.DataFrame:
+    """Work entries of a project with the surface of their segment"""
+    stmt = select(
+        WorkEntry.id,
+        WorkEntry.date,
+        WorkEntry.meters_done_m,
+        WorkEntry.depth_m,
+        Segment.surface
+    ).outerjoin(Segment, WorkEntry.segment_id == Segment.id).where(WorkEntry.project_id == project_id)
+    if approved_only:
+        stmt = stmt.where(work_entry_approved())
+
+    result = session.execute(stmt)
+    return rows_to_dataframe(stmt, list(result.keys()), result.all())
+
+
+def price_project(session: Session, project_id, approved_only: bool = True,
+                  extra_quantities: Optional[Dict[str, float]] = None,
+                  as_of: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Price all (approved) work of a project
+
+    Returns:
+        Dict with work_amount, extras_amount, total_amount, the priced entries
+        and the extras lines
+    """
+    table = load_price_table(session, project_id, as_of)
+    entries = price_work_entries(table, load_work_entries_for_pricing(session, project_id, approved_only))
+    extras = price_extras(table, entries, extra_quantities)
+
+    work_amount = float(entries['amount_eur'].sum())
+    extras_amount = float(extras['amount_eur'].sum())
+    return {
+        'price_list_id': table.price_list_id,
+        'work_amount': work_amount,
+        'extras_amount': extras_amount,
+        'total_amount': work_amount + extras_amount,
+        'entries': entries,
+        'extras': extras
+    }
+
+
+__all__ = [
+    'SURFACES',
+    'DEPTH_BANDS',
+    'PriceTable',
+    'classify_depth_bands',
+    'surface_indices',
+    'load_price_table',
+    'price_work_entries',
+    'price_extras',
+    'load_work_entries_for_pricing',
+    'price_project'
+]
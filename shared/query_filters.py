@@ -0,0 +1,182 @@
+"""
+SQL filter compilation for COMETA list views
+Turns the values returned by UIComponents.filter_sidebar into WHERE clauses so
+rows are filtered by the database (with index support) instead of in pandas
+"""
+
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from sqlalchemy import and_, false, or_
+from sqlalchemy import types as sqltypes
+
+try:
+    from .models import WorkEntry, User, Project
+except ImportError:
+    from models import WorkEntry, User, Project
+
+StatusFilter = Callable[[Sequence[str]], Any]
+
+
+@dataclass
+class FilterColumns:
+    """
+    Where each filter_sidebar value applies for one list view
+
+    status may be a column (matched with IN) or a callable building the clause
+    for models without a status column. role_join is (target, onclause) for
+    views whose role column lives on a joined table.
+    """
+    date: Any = None
+    status: Union[Any, StatusFilter, None] = None
+    project: Any = None
+    role: Any = None
+    role_join: Optional[tuple] = None
+
+
+def work_entry_approved():
+    """
+    Approved work entries: the approved flag, which every approval sets
+    (approved_by is only recorded when the approver is known)
+    """
+    return WorkEntry.approved.is_(True)
+
+
+def work_entry_pending():
+    """
+    Work entries awaiting approval; written as IS NOT TRUE so the planner can
+    use the partial index from the 20251104 migration
+    """
+    return WorkEntry.approved.isnot(True)
+
+
+def work_entry_status_clause(statuses: Sequence[str]):
+    """Work entries have no status column; their status is the approval flag"""
+    clauses = []
+    if 'approved' in statuses or 'completed' in statuses:
+        clauses.append(work_entry_approved())
+    if 'pending' in statuses:
+        clauses.append(work_entry_pending())
+    return or_(*clauses) if clauses else false()
+
+
+def user_status_clause(statuses: Sequence[str]):
+    """Users are 'active' or 'inactive' through is_active"""
+    clauses = []
+    if 'active' in statuses:
+        clauses.append(User.is_active.is_(True))
+    if 'inactive' in statuses:
+        clauses.append(User.is_active.isnot(True))
+    return or_(*clauses) if clauses else false()
+
+
+FILTER_COLUMNS: Dict[str, FilterColumns] = {
+    'work_entries': FilterColumns(
+        date=WorkEntry.date,
+        status=work_entry_status_clause,
+        project=WorkEntry.project_id,
+        role=User.role,
+        role_join=(User, WorkEntry.user_id == User.id)
+    ),
+    'projects': FilterColumns(
+        date=Project.start_date,
+        status=Project.status,
+        project=Project.id
+    ),
+    'users': FilterColumns(
+        status=user_status_clause,
+        role=User.role
+    ),
+}
+
+
+def _date_range_clause(column, date_range):
+    if isinstance(date_range, (date, datetime)):
+        date_range = (date_range, date_range)
+    date_range = [value for value in (date_range or ()) if value is not None]
+    if not date_range:
+        return None
+    start, end = date_range[0], date_range[-1]
+
+    if isinstance(column.type, sqltypes.DateTime):
+        # Whole days: [start 00:00, end + 1 day 00:00) keeps the index range scan
+        if not isinstance(start, datetime):
+            start = datetime.combine(start, time.min)
+        if not isinstance(end, datetime):
+            end = datetime.combine(end + timedelta(days=1), time.min)
+            return and_(column >= start, column < end)
+        return and_(column >= start, column <= end)
+
+    return column.between(start, end)
+
+
+def compile_filters(filter_values: Dict[str, Any], columns: FilterColumns) -> List[Any]:
+    """
+    Build WHERE clauses from filter_sidebar values
+
+    Unset filters ('All', None) produce no clause. An empty status selection
+    matches nothing, as it did when the rows were filtered in pandas.
+    """
+    clauses = []
+
+    if columns.date is not None and 'date_range' in filter_values:
+        clause = _date_range_clause(columns.date, filter_values['date_range'])
+        if clause is not None:
+            clauses.append(clause)
+
+    if columns.status is not None and filter_values.get('status') is not None:
+        statuses = list(filter_values['status'])
+        if callable(columns.status) and not hasattr(columns.status, 'in_'):
+            clauses.append(columns.status(statuses))
+        else:
+            clauses.append(columns.status.in_(statuses) if statuses else false())
+
+    project = filter_values.get('project')
+    if columns.project is not None and project is not None:
+        clauses.append(columns.project == getattr(project, 'id', project))
+
+    role = filter_values.get('user_role')
+    if columns.role is not None and role:
+        clauses.append(columns.role == role)
+
+    return clauses
+
+
+def apply_filters(stmt, filter_values: Dict[str, Any], columns: Union[str, FilterColumns]):
+    """
+    Add the filter_sidebar selections to a select()
+
+    Args:
+        stmt: select() to narrow
+        filter_values: Dict returned by UIComponents.filter_sidebar
+        columns: FilterColumns, or a FILTER_COLUMNS key such as 'work_entries'.
+            The role join is added here, so stmt should not join it already.
+
+    Example:
+        filters = UIComponents.filter_sidebar({'date_range': True, 'user_role': roles})
+        stmt = apply_filters(select(WorkEntry.id, WorkEntry.date), filters, 'work_entries')
+    """
+    if isinstance(columns, str):
+        columns = FILTER_COLUMNS[columns]
+    if not filter_values:
+        return stmt
+
+    if columns.role_join is not None and filter_values.get('user_role'):
+        target, onclause = columns.role_join
+        stmt = stmt.join(target, onclause)
+
+    clauses = compile_filters(filter_values, columns)
+    return stmt.where(*clauses) if clauses else stmt
+
+
+__all__ = [
+    'FilterColumns',
+    'FILTER_COLUMNS',
+    'compile_filters',
+    'apply_filters',
+    'work_entry_approved',
+    'work_entry_pending',
+    'work_entry_status_clause',
+    'user_status_clause'
+]
@@ -0,0 +1,198 @@
+"""
+Declarative seed data for COMETA
+Stage definitions, default stage -> material mappings and the bootstrap admin
+are declared here and written with set-based, idempotent inserts: a fresh
+tenant is provisioned in a handful of statements, and re-running is a no-op
+"""
+
+import os
+import uuid
+import logging
+from typing import Dict, List, Tuple
+
+from sqlalchemy import exists, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+
+try:
+    from .database import get_database_engine
+    from .models import StageDef, User, Material, MaterialStageMapping
+    from .material_catalog import invalidate_stage_catalog
+except ImportError:
+    from database import get_database_engine
+    from models import StageDef, User, Material, MaterialStageMapping
+    from material_catalog import invalidate_stage_catalog
+
+logger = logging.getLogger(__name__)
+
+
+STAGE_DEFS = [
+    {'code': 'stage_1_marking', 'name_ru': 'Разметка', 'name_de': 'Markierung',
+     'requires_photos_min': 2, 'requires_measurements': True, 'requires_density': False},
+    {'code': 'stage_2_excavation', 'name_ru': 'Выемка грунта', 'name_de': 'Aushub',
+     'requires_photos_min': 3, 'requires_measurements': True, 'requires_density': False},
+    {'code': 'stage_3_conduit', 'name_ru': 'Укладка труб', 'name_de': 'Rohrverlegung',
+     'requires_photos_min': 3, 'requires_measurements': True, 'requires_density': False},
+    {'code': 'stage_4_cable', 'name_ru': 'Прокладка кабеля', 'name_de': 'Kabelverlegung',
+     'requires_photos_min': 3, 'requires_measurements': True, 'requires_density': False},
+    {'code': 'stage_5_splice', 'name_ru': 'Сварка', 'name_de': 'Spleißen',
+     'requires_photos_min': 3, 'requires_measurements': True, 'requires_density': False},
+    {'code': 'stage_6_test', 'name_ru': 'Тестирование', 'name_de': 'Testen',
+     'requires_photos_min': 2, 'requires_measurements': True, 'requires_density': False},
+]
+
+# stage -> (material name, typical quantity, required, notes)
+DEFAULT_MATERIAL_MAPPINGS: Dict[str, List[Tuple[str, float, bool, str]]] = {
+    'stage_1_plan': [],  # Planning - no materials needed
+    'stage_2_excavation': [
+        ('Fiber Cable - Single Mode', 100, True, 'Typical cable per 100m segment'),
+        ('Conduit Pipe', 105, True, 'Extra 5% for curves and connections'),
+    ],
+    'stage_3_conduit': [
+        ('Conduit Pipe', 100, True, 'Main conduit installation'),
+        ('Conduit Connectors', 5, True, 'For joining sections'),
+        ('Warning Tape', 100, True, 'Buried cable warning'),
+    ],
+    'stage_4_cable': [
+        ('Fiber Cable - Single Mode', 100, True, 'Main fiber cable'),
+        ('Cable Lubricant', 1, True, 'For easier pulling'),
+        ('Cable Markers', 10, False, 'Distance markers'),
+    ],
+    'stage_5_splice': [
+        ('Splice Closure', 2, True, 'Connection points'),
+        ('Fiber Splice Sleeves', 12, True, 'Individual fiber splicing'),
+        ('Cleaning Supplies', 1, True, 'Fiber cleaning kit'),
+    ],
+    'stage_6_test': [
+        ('Testing Equipment', 1, False, 'OTDR testing'),
+        ('Test Cables', 2, True, 'Reference cables'),
+    ],
+    'stage_7_connect': [
+        ('Fiber Connectors', 4, True, 'End connections'),
+        ('Connector Boots', 4, True, 'Protection'),
+        ('Adapter Plates', 2, True, 'Wall/cabinet mounting'),
+    ],
+    'stage_8_final': [
+        ('Documentation Supplies', 1, True, 'Labels and documentation'),
+        ('Protective Covers', 2, True, 'Final protection'),
+    ],
+    'stage_9_cleanup': [
+        ('Cleanup Supplies', 1, True, 'Site restoration materials'),
+    ],
+    'stage_10_inspect': []  # Inspection - no materials needed
+}
+
+DEFAULT_ADMIN = {
+    'first_name': 'Admin',
+    'last_name': 'User',
+    'email': 'admin@example.com',
+    'phone': '+1234567890',
+    'role': 'admin',
+    'language_preference': 'en',
+    'is_active': True,
+}
+
+
+def seed_stage_defs(conn: Connection) -> int:
+    """Insert missing stage definitions; returns the number inserted"""
+    rows = [{'id': uuid.uuid4(), **stage} for stage in STAGE_DEFS]
+    stmt = insert(StageDef).values(rows).on_conflict_do_nothing(index_elements=['code'])
+    return conn.execute(stmt).rowcount
+
+
+def seed_material_stage_mappings(conn: Connection,
+                                 mappings: Dict[str, List[Tuple[str, float, bool, str]]] = None) -> int:
+    """
+    Insert missing stage -> material mappings; returns the number inserted
+
+    Material names are resolved with a single IN query. Mappings for materials
+    that do not exist yet are skipped (and picked up by a later run). Core
+    inserts bypass the ORM events of material_catalog, so callers invalidate
+    the stage catalog once the transaction has committed.
+    """
+    mappings = DEFAULT_MATERIAL_MAPPINGS if mappings is None else mappings
+    names = {name for materials in mappings.values() for name, _, _, _ in materials}
+    if not names:
+        return 0
+
+    material_ids = dict(conn.execute(
+        select(Material.name, Material.id).where(Material.name.in_(names))
+    ).all())
+
+    rows = []
+    for stage_name, materials in mappings.items():
+        for material_name, quantity, required, notes in materials:
+            material_id = material_ids.get(material_name)
+            if material_id is None:
+                continue
+            rows.append({
+                'id': uuid.uuid4(),
+                'stage_name': stage_name,
+                'material_id': material_id,
+                'typical_quantity': quantity,
+                'is_required': required,
+                'notes': notes
+            })
+
+    missing = names - set(material_ids)
+    if missing:
+        logger.info(f"Skipping stage mappings for unknown materials: {', '.join(sorted(missing))}")
+    if not rows:
+        return 0
+
+    stmt = insert(MaterialStageMapping).values(rows).on_conflict_do_nothing(
+        index_elements=['stage_name', 'material_id']
+    )
+    return conn.execute(stmt).rowcount
+
+
+def seed_admin_user(conn: Connection) -> int:
+    """
+    Create the bootstrap admin unless an admin already exists
+
+    A single INSERT ... SELECT ... WHERE NOT EXISTS, so concurrent starts cannot
+    both pass a count check. The PIN comes from COMETA_ADMIN_PIN; without it
+    no admin is created, so no database ever gets a known default PIN.
+    """
+    pin_code = os.getenv('COMETA_ADMIN_PIN')
+    if not pin_code:
+        logger.warning("COMETA_ADMIN_PIN is not set; skipping bootstrap admin creation")
+        return 0
+
+    values = {
+        'id': uuid.uuid4(),
+        **DEFAULT_ADMIN,
+        'pin_code': pin_code,
+    }
+    columns = list(values)
+    no_admin = ~exists().where(User.role == 'admin')
+    stmt = insert(User).from_select(
+        columns,
+        select(*[literal(values[column], User.__table__.c[column].type) for column in columns]).where(no_admin)
+    ).on_conflict_do_nothing(index_elements=['email'])
+    return conn.execute(stmt).rowcount
+
+
+def run_seeds(include_mappings: bool = True) -> Dict[str, int]:
+    """Apply all seeds in one transaction; returns inserted row counts per seed"""
+    with get_database_engine().begin() as conn:
+        result = {
+            'stage_defs': seed_stage_defs(conn),
+            'admin_user': seed_admin_user(conn),
+        }
+        if include_mappings:
+            result['material_stage_mappings'] = seed_material_stage_mappings(conn)
+    if result.get('material_stage_mappings'):
+        invalidate_stage_catalog()
+    logger.info(f"Seeds applied: {result}")
+    return result
+
+
+__all__ = [
+    'STAGE_DEFS',
+    'DEFAULT_MATERIAL_MAPPINGS',
+    'seed_stage_defs',
+    'seed_material_stage_mappings',
+    'seed_admin_user',
+    'run_seeds'
+]
@@ -0,0 +1,414 @@
+"""
+Spatial queries for COMETA
+Nearest cabinet for a house, houses within a radius and constraints along a
+segment. With PostGIS the queries run against the generated, GiST-indexed
+`geog` columns (20251111 migration); without it the project's JSONB
+geometries are loaded into an in-process grid index.
+"""
+
+import math
+import time
+import threading
+import logging
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+try:
+    from .models import House, Cabinet, Segment, Constraint
+    from .trajectories import EARTH_RADIUS_KM, haversine_km
+except ImportError:
+    from models import House, Cabinet, Segment, Constraint
+    from trajectories import EARTH_RADIUS_KM, haversine_km
+
+logger = logging.getLogger(__name__)
+
+# (kind, coords) with coords an (n, 2) array of (lat, lon); kind is point, line or polygon
+Geometry = Tuple[str, np.ndarray]
+
+GRID_CELL_M = 250.0
+GRID_TTL_SECONDS = 60
+
+_METERS_PER_DEGREE = EARTH_RADIUS_KM * 1000 * math.pi / 180
+
+_postgis_available: Optional[bool] = None
+_grid_lock = threading.Lock()
+_grid_cache: Dict[Tuple[str, Any], Tuple[float, 'GridIndex']] = {}
+
+
+def parse_geometry(value: Any) -> Optional[Geometry]:
+    """
+    Geometry from the JSONB shapes stored by the app
+
+    {"lat", "lng"/"lon"} points, GeoJSON geometries or Features ([lon, lat]
+    order) and bare {"coordinates": [[lon, lat], ...]} lines. Returns None for
+    anything else. Multi-geometries use their first part, polygons their
+    outer ring.
+    """
+    if not isinstance(value, dict):
+        return None
+    try:
+        if 'lat' in value:
+            lon = value.get('lng', value.get('lon'))
+            return 'point', np.array([[float(value['lat']), float(lon)]])
+
+        if value.get('type') == 'Feature':
+            value = value.get('geometry') or {}
+        geometry_type = value.get('type', 'LineString')
+        coordinates = value.get('coordinates')
+        if coordinates is None:
+            return None
+
+        if geometry_type.startswith('Multi'):
+            geometry_type, coordinates = geometry_type[5:], coordinates[0]
+        if geometry_type == 'Point':
+            kind, points = 'point', [coordinates]
+        elif geometry_type == 'LineString':
+            kind, points = 'line', coordinates
+        elif geometry_type == 'Polygon':
+            kind, points = 'polygon', coordinates[0]
+        else:
+            return None
+
+        lon_lat = np.asarray(points, dtype='float64')[:, :2]
+        if not len(lon_lat) or np.isnan(lon_lat).any():
+            return None
+        return kind, lon_lat[:, ::-1].copy()
+    except (TypeError, ValueError, IndexError, KeyError):
+        return None
+
+
+def project_to_meters(coords: np.ndarray, ref_lat: float) -> np.ndarray:
+    """(lat, lon) to local planar meters (equirectangular around ref_lat)"""
+    return np.column_stack([
+        coords[:, 1] * _METERS_PER_DEGREE * math.cos(math.radians(ref_lat)),
+        coords[:, 0] * _METERS_PER_DEGREE
+    ])
+
+
+def _edges(kind: str, xy: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    if kind == 'point' or len(xy) == 1:
+        return xy[:1], xy[:1]
+    if kind == 'polygon':
+        return xy, np.roll(xy, -1, axis=0)
+    return xy[:-1], xy[1:]
+
+
+def _cross(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _point_segment_distance(p: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    ab = b - a
+    length_sq = (ab ** 2).sum(axis=-1)
+    t = np.where(length_sq > 0, ((p - a) * ab).sum(axis=-1) / np.where(length_sq > 0, length_sq, 1), 0)
+    closest = a + np.clip(t, 0, 1)[..., None] * ab
+    return np.hypot(*np.moveaxis(p - closest, -1, 0))
+
+
+def _inside_polygon(points: np.ndarray, ring: np.ndarray) -> np.ndarray:
+    """Ray casting, vectorized over points and ring edges"""
+    a, b = ring[None, :, :], np.roll(ring, -1, axis=0)[None, :, :]
+    p = points[:, None, :]
+    straddles = (a[..., 1] > p[..., 1]) != (b[..., 1] > p[..., 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = a[..., 0] + (p[..., 1] - a[..., 1]) * (b[..., 0] - a[..., 0]) / (b[..., 1] - a[..., 1])
+    return ((straddles & (p[..., 0] < x_cross)).sum(axis=1) % 2) == 1
+
+
+def geometry_distance_m(first: Geometry, second: Geometry) -> float:
+    """Minimum distance between two geometries in meters (0 if they intersect)"""
+    ref_lat = float(np.concatenate([first[1][:, 0], second[1][:, 0]]).mean())
+    xy1, xy2 = project_to_meters(first[1], ref_lat), project_to_meters(second[1], ref_lat)
+
+    for (kind, _), inner, outer in ((first, xy2, xy1), (second, xy1, xy2)):
+        if kind == 'polygon' and _inside_polygon(inner, outer).any():
+            return 0.0
+
+    a, b = (e[:, None, :] for e in _edges(first[0], xy1))
+    c, d = (e[None, :, :] for e in _edges(second[0], xy2))
+    crossing = (
+        (np.sign(_cross(b - a, c - a)) * np.sign(_cross(b - a, d - a)) < 0)
+        & (np.sign(_cross(d - c, a - c)) * np.sign(_cross(d - c, b - c)) < 0)
+    )
+    if crossing.any():
+        return 0.0
+    return float(np.min([
+        _point_segment_distance(a, c, d).min(),
+        _point_segment_distance(b, c, d).min(),
+        _point_segment_distance(c, a, b).min(),
+        _point_segment_distance(d, a, b).min()
+    ]))
+
+
+def points_distance_m(lat, lon, geometry: Geometry) -> np.ndarray:
+    """Distance in meters from each of many points to one geometry (0 inside polygons)"""
+    coords = np.column_stack([np.asarray(lat, dtype='float64'), np.asarray(lon, dtype='float64')])
+    ref_lat = float(geometry[1][:, 0].mean())
+    points = project_to_meters(coords, ref_lat)
+    a, b = (e[None, :, :] for e in _edges(geometry[0], project_to_meters(geometry[1], ref_lat)))
+    distances = _point_segment_distance(points[:, None, :], a, b).min(axis=1)
+    if geometry[0] == 'polygon':
+        distances[_inside_polygon(points, project_to_meters(geometry[1], ref_lat))] = 0.0
+    return distances
+
+
+class GridIndex:
+    """
+    Uniform grid over (lat, lon) with roughly cell_m square cells
+
+    Geometries are registered in every cell their bounding box touches;
+    queries only look at nearby cells and then measure exactly.
+    """
+
+    def __init__(self, items: Iterable[Tuple[Hashable, Geometry]], cell_m: float = GRID_CELL_M):
+        self.geometries: Dict[Hashable, Geometry] = dict(items)
+        self.cell_m = cell_m
+        lats = [g[1][:, 0].mean() for g in self.geometries.values()]
+        self.lat_step = cell_m / _METERS_PER_DEGREE
+        self.lon_step = self.lat_step / math.cos(math.radians(float(np.mean(lats)) if lats else 0.0))
+
+        self.cells: Dict[Tuple[int, int], List[Hashable]] = {}
+        for key, (_, coords) in self.geometries.items():
+            (i0, j0), (i1, j1) = self._cell(*coords.min(axis=0)), self._cell(*coords.max(axis=0))
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    self.cells.setdefault((i, j), []).append(key)
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.lat_step), math.floor(lon / self.lon_step)
+
+    def _ring(self, center: Tuple[int, int], radius: int) -> set:
+        ci, cj = center
+        if radius == 0:
+            return set(self.cells.get(center, ()))
+        perimeter = [(ci + di, cj + dj) for di in (-radius, radius) for dj in range(-radius, radius + 1)]
+        perimeter += [(ci + di, cj + dj) for dj in (-radius, radius) for di in range(-radius + 1, radius)]
+        return {key for cell in perimeter for key in self.cells.get(cell, ())}
+
+    def _distances(self, geometry: Geometry, keys: Iterable[Hashable]) -> Dict[Hashable, float]:
+        keys = list(keys)
+        points = [k for k in keys if self.geometries[k][0] == 'point']
+        distances = {}
+        if geometry[0] == 'point' and points:
+            lat, lon = geometry[1][0]
+            coords = np.array([self.geometries[k][1][0] for k in points])
+            distances.update(zip(points, haversine_km(lat, lon, coords[:, 0], coords[:, 1]) * 1000))
+        for key in keys:
+            if key not in distances:
+                distances[key] = geometry_distance_m(geometry, self.geometries[key])
+        return distances
+
+    def within(self, geometry: Geometry, distance_m: float) -> List[Tuple[Hashable, float]]:
+        """Geometries within distance_m, nearest first"""
+        (i0, j0), (i1, j1) = (self._cell(*c) for c in (geometry[1].min(axis=0), geometry[1].max(axis=0)))
+        pad = math.ceil(distance_m / self.cell_m)
+        candidates = set()
+        for i in range(i0 - pad, i1 + pad + 1):
+            for j in range(j0 - pad, j1 + pad + 1):
+                candidates.update(self.cells.get((i, j), ()))
+        found = [(k, d) for k, d in self._distances(geometry, candidates).items() if d <= distance_m]
+        return sorted(found, key=lambda item: item[1])
+
+    def nearest(self, lat: float, lon: float, max_distance_m: Optional[float] = None) -> Optional[Tuple[Hashable, float]]:
+        """Nearest geometry to a point, searching outwards ring by ring"""
+        if not self.cells:
+            return None
+        point = ('point', np.array([[lat, lon]]))
+        center = self._cell(lat, lon)
+        max_ring = max(max(abs(i - center[0]), abs(j - center[1])) for i, j in self.cells)
+
+        best: Optional[Tuple[Hashable, float]] = None
+        seen = set()
+        for radius in range(max_ring + 1):
+            # Cells of ring r are at least r - 1 cells away from the query point
+            if best is not None and best[1] <= (radius - 1) * self.cell_m:
+                break
+            if max_distance_m is not None and (radius - 1) * self.cell_m > max_distance_m:
+                break
+            keys = self._ring(center, radius) - seen
+            seen |= keys
+            for key, distance in self._distances(point, keys).items():
+                if best is None or distance < best[1]:
+                    best = (key, distance)
+
+        if best is None or (max_distance_m is not None and best[1] > max_distance_m):
+            return None
+        return best
+
+
+def postgis_available(session: Session) -> bool:
+    """Whether the generated geography columns exist (checked once per process)"""
+    global _postgis_available
+    if _postgis_available is None:
+        try:
+            _postgis_available = bool(session.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'houses' AND column_name = 'geog'"
+            )).first())
+        except Exception as e:
+            logger.warning(f"Could not check for PostGIS columns: {e}")
+            return False
+    return _postgis_available
+
+
+def _project_grid(session: Session, kind: str, project_id) -> 'GridIndex':
+    """Cached grid of a project's cabinets / houses / constraints"""
+    cache_key = (kind, project_id)
+    with _grid_lock:
+        cached = _grid_cache.get(cache_key)
+        if cached and time.monotonic() - cached[0] < GRID_TTL_SECONDS:
+            return cached[1]
+
+    if kind == 'cabinets':
+        rows = session.execute(select(Cabinet.id, Cabinet.geom_point).where(Cabinet.project_id == project_id))
+    elif kind == 'houses':
+        rows = session.execute(select(House.id, House.geom_point).where(House.project_id == project_id))
+    else:
+        rows = session.execute(select(Constraint.id, Constraint.geom).where(Constraint.project_id == project_id))
+
+    items = [(key, geometry) for key, geometry in ((k, parse_geometry(v)) for k, v in rows) if geometry]
+    grid = GridIndex(items)
+    with _grid_lock:
+        _grid_cache[cache_key] = (time.monotonic(), grid)
+    return grid
+
+
+def invalidate_spatial_cache(project_id=None) -> None:
+    """Drop cached grids (of one project, or all)"""
+    with _grid_lock:
+        for key in [k for k in _grid_cache if project_id is None or k[1] == project_id]:
+            del _grid_cache[key]
+
+
+def nearest_cabinet_for_house(session: Session, house_id,
+                              max_distance_m: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """Nearest cabinet of the house's project, with the distance in meters"""
+    if postgis_available(session):
+        row = session.execute(text("""
+            SELECT c.id, c.code, c.name, ST_Distance(c.geog, h.geog) AS distance_m
+            FROM houses h
+            JOIN cabinets c ON c.project_id = h.project_id AND c.geog IS NOT NULL
+            WHERE h.id = :house_id
+              AND (CAST(:max_distance_m AS float8) IS NULL OR ST_DWithin(c.geog, h.geog, :max_distance_m))
+            ORDER BY c.geog <-> h.geog
+            LIMIT 1
+        """), {'house_id': house_id, 'max_distance_m': max_distance_m}).first()
+        if row is None:
+            return None
+        cabinet_id, code, name, distance_m = row
+    else:
+        house = session.execute(
+            select(House.project_id, House.geom_point).where(House.id == house_id)
+        ).first()
+        geometry = parse_geometry(house.geom_point) if house else None
+        if geometry is None:
+            return None
+        lat, lon = geometry[1].mean(axis=0)
+        found = _project_grid(session, 'cabinets', house.project_id).nearest(lat, lon, max_distance_m)
+        if found is None:
+            return None
+        cabinet_id, distance_m = found
+        code, name = session.execute(select(Cabinet.code, Cabinet.name).where(Cabinet.id == cabinet_id)).one()
+
+    return {'cabinet_id': cabinet_id, 'code': code, 'name': name, 'distance_m': float(distance_m)}
+
+
+def houses_within_radius(session: Session, lat: float, lon: float, radius_m: float,
+                         project_id=None) -> List[Dict[str, Any]]:
+    """Houses within radius_m of a point, nearest first"""
+    if postgis_available(session):
+        rows = session.execute(text("""
+            SELECT id, address, house_number, ST_Distance(geog, point.geog) AS distance_m
+            FROM houses,
+                 (SELECT ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)::geography AS geog) AS point
+            WHERE ST_DWithin(houses.geog, point.geog, :radius_m)
+              AND (CAST(:project_id AS uuid) IS NULL OR project_id = CAST(:project_id AS uuid))
+            ORDER BY distance_m
+        """), {'lat': lat, 'lon': lon, 'radius_m': radius_m,
+               'project_id': str(project_id) if project_id else None}).all()
+        return [
+            {'house_id': house_id, 'address': address, 'house_number': house_number, 'distance_m': float(distance)}
+            for house_id, address, house_number, distance in rows
+        ]
+
+    if project_id is None:
+        project_ids = session.execute(select(House.project_id).distinct()).scalars().all()
+    else:
+        project_ids = [project_id]
+    point = ('point', np.array([[lat, lon]]))
+    found = [hit for pid in project_ids for hit in _project_grid(session, 'houses', pid).within(point, radius_m)]
+    if not found:
+        return []
+
+    distances = dict(found)
+    details = {
+        house_id: (address, house_number)
+        for house_id, address, house_number in session.execute(
+            select(House.id, House.address, House.house_number).where(House.id.in_(list(distances)))
+        )
+    }
+    return [
+        {'house_id': house_id, 'address': details[house_id][0], 'house_number': details[house_id][1],
+         'distance_m': float(distance)}
+        for house_id, distance in sorted(found, key=lambda item: item[1])
+        if house_id in details
+    ]
+
+
+def constraints_intersecting_segment(session: Session, segment_id,
+                                     tolerance_m: float = 0.0) -> List[Dict[str, Any]]:
+    """Constraints of the segment's project within tolerance_m of the segment's line"""
+    if postgis_available(session):
+        rows = session.execute(text("""
+            SELECT k.id, k.kind, k.status, k.description
+            FROM segments s
+            JOIN cabinets c ON c.id = s.cabinet_id
+            JOIN constraints k ON k.project_id = c.project_id
+            WHERE s.id = :segment_id
+              AND ST_DWithin(k.geog, s.geog, :tolerance_m)
+            ORDER BY ST_Distance(k.geog, s.geog)
+        """), {'segment_id': segment_id, 'tolerance_m': tolerance_m}).all()
+    else:
+        segment = session.execute(
+            select(Cabinet.project_id, Segment.geom_line)
+            .join(Cabinet, Cabinet.id == Segment.cabinet_id)
+            .where(Segment.id == segment_id)
+        ).first()
+        geometry = parse_geometry(segment.geom_line) if segment else None
+        if geometry is None:
+            return []
+        hits = _project_grid(session, 'constraints', segment.project_id).within(geometry, tolerance_m)
+        constraint_ids = [constraint_id for constraint_id, _ in hits]
+        if not constraint_ids:
+            return []
+        rows = session.execute(
+            select(Constraint.id, Constraint.kind, Constraint.status, Constraint.description)
+            .where(Constraint.id.in_(constraint_ids))
+        ).all()
+        order = {constraint_id: i for i, constraint_id in enumerate(constraint_ids)}
+        rows = sorted(rows, key=lambda row: order[row[0]])
+
+    return [
+        {'constraint_id': constraint_id, 'kind': kind, 'status': status, 'description': description}
+        for constraint_id, kind, status, description in rows
+    ]
+
+
+__all__ = [
+    'parse_geometry',
+    'project_to_meters',
+    'geometry_distance_m',
+    'points_distance_m',
+    'GridIndex',
+    'postgis_available',
+    'invalidate_spatial_cache',
+    'nearest_cabinet_for_house',
+    'houses_within_radius',
+    'constraints_intersecting_segment'
+]
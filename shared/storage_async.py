@@ -0,0 +1,290 @@
+"""
+Async Supabase Storage client for COMETA FastAPI services
+Same upload/delete/list/public-URL surface as SupabaseStorageClient, built on a
+shared non-blocking HTTP client (one per event loop) so uploads do not stall the
+event loop
+"""
+
+import os
+import asyncio
+import inspect
+import mimetypes
+import logging
+import weakref
+from typing import AsyncIterator, Optional, Tuple, Union
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    from .storage_resilience import NO_RETRY, RetryPolicy, StorageResult, async_call_with_resilience
+    from .storage_utils import generate_file_path
+except ImportError:
+    from storage_resilience import NO_RETRY, RetryPolicy, StorageResult, async_call_with_resilience
+    from storage_utils import generate_file_path
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# An httpx.AsyncClient's connections belong to the loop that opened them, so
+# each event loop gets its own client; entries go away with their loop
+_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client() -> "httpx.AsyncClient":
+    """
+    Get the shared async HTTP client of the running event loop for storage calls
+
+    Connection limits come from SUPABASE_STORAGE_MAX_CONNECTIONS and
+    SUPABASE_STORAGE_MAX_KEEPALIVE so a burst of uploads cannot exhaust sockets.
+    Must be called from a coroutine.
+    """
+    if not HAS_HTTPX:
+        raise ImportError("httpx is required for AsyncSupabaseStorageClient (pip install httpx)")
+
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv('SUPABASE_STORAGE_MAX_CONNECTIONS', '20')),
+                max_keepalive_connections=int(os.getenv('SUPABASE_STORAGE_MAX_KEEPALIVE', '10'))
+            ),
+            timeout=httpx.Timeout(
+                float(os.getenv('SUPABASE_STORAGE_READ_TIMEOUT', '30')),
+                connect=float(os.getenv('SUPABASE_STORAGE_CONNECT_TIMEOUT', '3.05'))
+            )
+        )
+        _http_clients[loop] = client
+    return client
+
+
+async def close_async_http_client() -> None:
+    """Close the running loop's shared HTTP client (call from the FastAPI shutdown handler)"""
+    client = _http_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def _stream_position(upload) -> Optional[int]:
+    """Current offset of an upload stream, or None if it cannot be told"""
+    for target in (upload, getattr(upload, 'file', None)):
+        tell = getattr(target, 'tell', None)
+        if tell is None:
+            continue
+        try:
+            position = tell()
+            if inspect.isawaitable(position):
+                position = await position
+            return position
+        except Exception:
+            return None
+    return None
+
+
+def _classify_httpx_error(error: Exception, attempts: int) -> StorageResult:
+    if isinstance(error, httpx.TimeoutException):
+        error_type = 'timeout'
+    elif isinstance(error, httpx.TransportError):
+        error_type = 'connection'
+    else:
+        error_type = 'client'
+    return StorageResult(ok=False, error=str(error) or type(error).__name__, error_type=error_type, attempts=attempts)
+
+
+class AsyncSupabaseStorageClient:
+    """Async client for Supabase Storage operations"""
+
+    def __init__(self, http_client: Optional["httpx.AsyncClient"] = None,
+                 retry_policy: Optional[RetryPolicy] = None):
+        self._http_client = http_client
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.base_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
+        self.anon_key = os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
+
+        if not self.base_url or not self.anon_key:
+            raise ValueError("Supabase URL and ANON_KEY must be set in environment variables")
+
+        self.storage_url = f"{self.base_url}/storage/v1"
+        self.headers = {
+            'Authorization': f'Bearer {self.anon_key}',
+            'apikey': self.anon_key
+        }
+
+    @property
+    def http_client(self) -> "httpx.AsyncClient":
+        """The client passed in, else the running loop's shared client"""
+        return self._http_client or get_async_http_client()
+
+    async def _request(self, method: str, bucket: str, url: str, **kwargs) -> StorageResult:
+        async def operation(attempt: int):
+            return await self.http_client.request(method, url, **kwargs)
+
+        return await async_call_with_resilience(
+            bucket, operation, _classify_httpx_error, policy=self.retry_policy
+        )
+
+    async def upload_file_result(self, bucket: str, file_path: str, upload,
+                                 content_type: str = 'application/octet-stream') -> StorageResult:
+        """
+        Upload file to Supabase Storage
+
+        Args:
+            bucket: Storage bucket name
+            file_path: Path within bucket
+            upload: bytes, or an object with async read()/seek() such as FastAPI's
+                UploadFile. Objects are streamed in chunks, never read whole, from
+                their current position; retries seek back to it.
+            content_type: MIME type of file
+
+        Returns:
+            StorageResult with the public URL as value
+        """
+        url = f"{self.storage_url}/object/{bucket}/{file_path}"
+        headers = {**self.headers, 'Content-Type': content_type}
+
+        if isinstance(upload, (bytes, bytearray)):
+            def body() -> Union[bytes, AsyncIterator[bytes]]:
+                return bytes(upload)
+            rewind = None
+            replayable = True
+        else:
+            # The body is the rest of the stream; retries resend it from here
+            start = await _stream_position(upload)
+            replayable = start is not None and hasattr(upload, 'seek')
+
+            size = getattr(upload, 'size', None)
+            if size is not None and start is not None:
+                # Lets storage reject oversized files before the body is sent
+                headers['Content-Length'] = str(size - start)
+
+            def body() -> Union[bytes, AsyncIterator[bytes]]:
+                return _iter_chunks(upload)
+
+            async def rewind() -> bool:
+                try:
+                    await upload.seek(start)
+                    return True
+                except Exception:
+                    return False
+
+        async def operation(attempt: int):
+            attempt_headers = {**headers, 'x-upsert': 'true'} if attempt > 1 else headers
+            return await self.http_client.post(url, headers=attempt_headers, content=body())
+
+        result = await async_call_with_resilience(
+            bucket,
+            operation,
+            _classify_httpx_error,
+            success_codes=(200, 201),
+            policy=self.retry_policy if replayable else NO_RETRY,
+            before_retry=rewind
+        )
+        if result.ok:
+            result.value = self.get_public_url(bucket, file_path)
+        return result
+
+    async def upload_file(self, bucket: str, file_path: str, upload,
+                          content_type: str = 'application/octet-stream') -> Optional[str]:
+        """Upload file to Supabase Storage; returns the public URL or None"""
+        result = await self.upload_file_result(bucket, file_path, upload, content_type)
+        if not result.ok:
+            logger.warning(f"Upload of {bucket}/{file_path} failed after {result.attempts} attempt(s): {result.error}")
+            return None
+        return result.value
+
+    def get_public_url(self, bucket: str, file_path: str) -> str:
+        """Get public URL for a file"""
+        return f"{self.storage_url}/object/public/{bucket}/{file_path}"
+
+    async def delete_file_result(self, bucket: str, file_path: str) -> StorageResult:
+        """Delete file from storage, returning a structured result"""
+        url = f"{self.storage_url}/object/{bucket}/{file_path}"
+        return await self._request('DELETE', bucket, url, headers=self.headers)
+
+    async def delete_file(self, bucket: str, file_path: str) -> bool:
+        """Delete file from storage"""
+        result = await self.delete_file_result(bucket, file_path)
+        if not result.ok:
+            logger.warning(f"Delete of {bucket}/{file_path} failed: {result.error}")
+        return result.ok
+
+    async def list_files_result(self, bucket: str, folder: str = "") -> StorageResult:
+        """List files in bucket/folder, returning a structured result with the entries as value"""
+        url = f"{self.storage_url}/object/list/{bucket}"
+        data = {"prefix": folder} if folder else {}
+        result = await self._request('POST', bucket, url, headers=self.headers, json=data)
+        if result.ok:
+            result.value = result.value.json()
+        return result
+
+    async def list_files(self, bucket: str, folder: str = "") -> list:
+        """List files in bucket/folder"""
+        result = await self.list_files_result(bucket, folder)
+        if not result.ok:
+            logger.warning(f"Listing {bucket}/{folder} failed: {result.error}")
+            return []
+        return result.value
+
+
+async def _iter_chunks(upload, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def _upload_target(filename: str, content_type: Optional[str], project_id: Optional[str]) -> Tuple[str, str, str]:
+    """Bucket, path and content type for an upload, mirroring save_uploaded_file"""
+    content_type = content_type or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if project_id == 'house_documents':
+        bucket = os.getenv('SUPABASE_HOUSE_DOCUMENTS_BUCKET', 'house-documents')
+        return bucket, generate_file_path('general', 'documents', filename), content_type
+
+    if content_type.startswith('image/'):
+        bucket = os.getenv('SUPABASE_WORK_PHOTOS_BUCKET', 'work-photos')
+        return bucket, generate_file_path(project_id or 'general', 'work-photos', filename), content_type
+
+    bucket = os.getenv('SUPABASE_PROJECT_DOCUMENTS_BUCKET', 'project-documents')
+    return bucket, generate_file_path(project_id or 'general', 'documents', filename), content_type
+
+
+async def save_uploaded_file_async(upload_file, project_id: str = None,
+                                   client: Optional[AsyncSupabaseStorageClient] = None) -> Optional[str]:
+    """
+    Save a FastAPI UploadFile to storage without buffering it in memory
+
+    Args:
+        upload_file: FastAPI/Starlette UploadFile
+        project_id: Project ID for organization (or 'house_documents' for house files)
+        client: Storage client (created on demand)
+
+    Returns:
+        Public URL if successful
+    """
+    if not upload_file or not upload_file.filename:
+        return None
+
+    try:
+        client = client or AsyncSupabaseStorageClient()
+        bucket, file_path, content_type = _upload_target(
+            upload_file.filename, upload_file.content_type, project_id
+        )
+        return await client.upload_file(bucket, file_path, upload_file, content_type)
+    except Exception as e:
+        logger.error(f"File upload error: {str(e)}")
+        return None
+
+
+__all__ = [
+    'AsyncSupabaseStorageClient',
+    'get_async_http_client',
+    'close_async_http_client',
+    'save_uploaded_file_async'
+]
@@ -0,0 +1,324 @@
+"""
+Storage reconciliation for COMETA
+Finds blobs in Supabase Storage that no database row references any more
+(deleted projects, replaced photos, aborted uploads) and optionally removes them
+"""
+
+import re
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+
+try:
+    from .database import get_session
+    from .models import (Base, Photo, HouseDocument, HouseDoc, HseRequirement, ProjectFile, WorkerDocument,
+                         ProjectDocument, ProjectPlan)
+    from .storage_utils import SupabaseStorageClient, get_storage_info, parse_storage_url
+except ImportError:
+    from database import get_session
+    from models import (Base, Photo, HouseDocument, HouseDoc, HseRequirement, ProjectFile, WorkerDocument,
+                        ProjectDocument, ProjectPlan)
+    from storage_utils import SupabaseStorageClient, get_storage_info, parse_storage_url
+
+logger = logging.getLogger(__name__)
+
+
+# Columns holding storage references, with the bucket assumed for bare paths
+REFERENCE_COLUMNS = [
+    (Photo.url, 'work_photos'),
+    (HouseDocument.file_path, 'house_documents'),
+    (HouseDoc.file_url, 'house_documents'),
+    (ProjectFile.file_url, 'project_documents'),
+    (WorkerDocument.file_url, 'project_documents'),
+    (WorkerDocument.file_path, 'project_documents'),
+    (ProjectDocument.file_path, 'project_documents'),
+    (ProjectPlan.file_path, 'project_documents'),
+    (HseRequirement.file_url, 'project_documents'),
+]
+
+# Mapped columns that look like storage references (name ends in url / path).
+# Each must be in REFERENCE_COLUMNS or in NON_REFERENCE_COLUMNS before orphans
+# are deleted, so a newly added file column cannot silently make its blobs
+# look orphaned.
+REFERENCE_COLUMN_PATTERN = re.compile(r'(^|_)(url|path)$')
+NON_REFERENCE_COLUMNS: set = set()
+
+# Buckets whose contents are fully described by REFERENCE_COLUMNS. project_photos
+# is left out: its uploads are not recorded in any table, so every blob in it
+# would look orphaned.
+RECONCILED_BUCKETS = ['work_photos', 'project_documents', 'house_documents']
+
+DELETE_BATCH_SIZE = 100
+
+
+class ReconciliationError(Exception):
+    """Raised when a reconciliation run cannot be trusted (e.g. unordered listing)"""
+
+
+@dataclass
+class ReconciliationReport:
+    """Outcome of reconciling one bucket prefix"""
+    bucket: str
+    prefix: str
+    scanned_blobs: int = 0
+    referenced_blobs: int = 0
+    skipped_recent: int = 0
+    orphan_count: int = 0
+    orphan_bytes: int = 0
+    deleted_count: int = 0
+    missing_count: int = 0
+    orphan_sample: List[str] = field(default_factory=list)
+    missing_sample: List[str] = field(default_factory=list)
+
+
+def _path_key(path: str) -> Tuple[str, ...]:
+    """Sort key matching the depth-first name order of a recursive storage listing"""
+    return tuple(path.split('/'))
+
+
+def _column_name(column) -> str:
+    return f"{column.table.name}.{column.name}"
+
+
+def unlisted_reference_columns() -> List[str]:
+    """Mapped columns that may hold storage references but are not reconciled"""
+    listed = {_column_name(column.expression) for column, _ in REFERENCE_COLUMNS}
+    return sorted(
+        name
+        for table in Base.metadata.sorted_tables
+        for column in table.columns
+        if REFERENCE_COLUMN_PATTERN.search(column.name)
+        for name in [_column_name(column)]
+        if name not in listed and name not in NON_REFERENCE_COLUMNS
+    )
+
+
+def check_reference_coverage() -> None:
+    """Raise ReconciliationError unless every storage reference column is accounted for"""
+    unlisted = unlisted_reference_columns()
+    if unlisted:
+        raise ReconciliationError(
+            "Columns that may reference storage are not in REFERENCE_COLUMNS: " + ", ".join(unlisted)
+        )
+
+
+def _like_prefix(folder: str) -> str:
+    """
+    Leading folder segments that read the same percent-encoded, for a LIKE
+    prefilter that cannot miss encoded URLs; '' when nothing is safe
+    """
+    safe = []
+    for segment in folder.strip('/').split('/'):
+        if not segment or quote(segment) != segment:
+            break
+        safe.append(segment)
+    return '/'.join(safe)
+
+
+def normalize_reference(value: str, default_bucket: str) -> Optional[Tuple[str, str]]:
+    """
+    Turn a stored file reference into (bucket, path)
+
+    Full storage URLs carry their own bucket; bare paths are assumed to live in
+    default_bucket (optionally prefixed with the bucket name).
+    """
+    if not value:
+        return None
+    if '://' in value:
+        return parse_storage_url(value)
+
+    path = value.lstrip('/')
+    if path.startswith(f"{default_bucket}/"):
+        path = path[len(default_bucket) + 1:]
+    return default_bucket, path
+
+
+def iter_referenced_paths(bucket: str, prefix: str, yield_per: int = 1000) -> Iterator[str]:
+    """Stream every path under bucket/prefix that the database references"""
+    buckets = get_storage_info()['buckets']
+    folder = f"{prefix.strip('/')}/" if prefix.strip('/') else ''
+
+    like_prefix = _like_prefix(folder)
+
+    session = get_session()
+    try:
+        for column, default_bucket_key in REFERENCE_COLUMNS:
+            default_bucket = buckets[default_bucket_key]
+            # Narrow on the server side; exact matching happens after normalization
+            # (which decodes URLs), so only the encoding-stable part is used here
+            query = session.query(column).filter(column.isnot(None))
+            if like_prefix:
+                query = query.filter(column.like(f"%{like_prefix}%"))
+            query = query.yield_per(yield_per)
+            for (value,) in query:
+                location = normalize_reference(value, default_bucket)
+                if location and location[0] == bucket and location[1].startswith(folder):
+                    yield location[1]
+    finally:
+        session.close()
+
+
+def _created_at(entry: dict) -> Optional[datetime]:
+    value = entry.get('created_at')
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+class StorageReconciler:
+    """Merges storage listings with database references, one prefix at a time"""
+
+    def __init__(self, client: Optional[SupabaseStorageClient] = None,
+                 min_age: timedelta = timedelta(hours=24),
+                 page_size: int = 1000,
+                 sample_limit: int = 50):
+        """
+        Args:
+            client: Storage client (created on demand)
+            min_age: Blobs younger than this are never reported as orphans, so
+                uploads whose database row is not committed yet are left alone
+            page_size: Entries per storage list call
+            sample_limit: Paths kept in each report for review
+        """
+        unlisted = unlisted_reference_columns()
+        if unlisted:
+            logger.warning(f"Orphan deletion disabled; unreconciled reference columns: {', '.join(unlisted)}")
+        self.client = client or SupabaseStorageClient()
+        self.min_age = min_age
+        self.page_size = page_size
+        self.sample_limit = sample_limit
+
+    def reconcile_prefix(self, bucket: str, prefix: str, delete: bool = False) -> ReconciliationReport:
+        """
+        Reconcile one bucket prefix
+
+        Database references under the prefix are sorted once, then merged with the
+        recursive storage listing (which arrives in the same order). Orphans are
+        collected during the listing and deleted in batches after it finishes
+        when delete=True (deleting while the listing pages by offset would shift
+        later entries past it), otherwise only reported.
+        """
+        if delete:
+            check_reference_coverage()
+        report = ReconciliationReport(bucket=bucket, prefix=prefix.strip('/'))
+        referenced = sorted(set(iter_referenced_paths(bucket, prefix)), key=_path_key)
+        cutoff = datetime.now(timezone.utc) - self.min_age
+
+        ref_index = 0
+        previous_key: Optional[Tuple[str, ...]] = None
+        pending_delete: List[str] = []
+
+        for entry in self.client.iter_files(bucket, prefix, self.page_size, recursive=True):
+            path = entry['path']
+            key = _path_key(path)
+            if previous_key is not None and key < previous_key:
+                # Deleting on top of a listing we cannot merge would remove live files
+                raise ReconciliationError(f"Storage listing for {bucket}/{prefix} is not in name order")
+            previous_key = key
+            report.scanned_blobs += 1
+
+            while ref_index < len(referenced) and _path_key(referenced[ref_index]) < key:
+                self._record_missing(report, referenced[ref_index])
+                ref_index += 1
+
+            if ref_index < len(referenced) and referenced[ref_index] == path:
+                report.referenced_blobs += 1
+                ref_index += 1
+                continue
+
+            created_at = _created_at(entry)
+            if created_at is None or created_at > cutoff:
+                report.skipped_recent += 1
+                continue
+
+            report.orphan_count += 1
+            report.orphan_bytes += int((entry.get('metadata') or {}).get('size') or 0)
+            if len(report.orphan_sample) < self.sample_limit:
+                report.orphan_sample.append(path)
+
+            if delete:
+                pending_delete.append(path)
+
+        for path in referenced[ref_index:]:
+            self._record_missing(report, path)
+
+        for start in range(0, len(pending_delete), DELETE_BATCH_SIZE):
+            report.deleted_count += self._delete_batch(bucket, pending_delete[start:start + DELETE_BATCH_SIZE])
+
+        return report
+
+    def reconcile(self, bucket: str, prefixes: Iterable[str], delete: bool = False,
+                  start_after: Optional[str] = None) -> Iterator[ReconciliationReport]:
+        """
+        Reconcile prefixes one by one, yielding a report after each
+
+        Callers persist the last reported prefix and pass it back as start_after
+        to resume an interrupted run.
+        """
+        for prefix in prefixes:
+            if start_after is not None and _path_key(prefix) <= _path_key(start_after):
+                continue
+            report = self.reconcile_prefix(bucket, prefix, delete=delete)
+            logger.info(
+                f"Reconciled {bucket}/{report.prefix}: {report.scanned_blobs} blobs, "
+                f"{report.orphan_count} orphans, {report.deleted_count} deleted, "
+                f"{report.missing_count} missing"
+            )
+            yield report
+
+    def project_prefixes(self, bucket: str) -> Iterator[str]:
+        """Per-project folders present in a bucket, including those of deleted projects"""
+        return self.client.iter_folders(bucket, 'projects', self.page_size)
+
+    def reconcile_bucket(self, bucket: str, delete: bool = False,
+                         start_after: Optional[str] = None) -> Iterator[ReconciliationReport]:
+        """Reconcile a whole bucket incrementally, one project folder at a time"""
+        return self.reconcile(bucket, self.project_prefixes(bucket), delete=delete, start_after=start_after)
+
+    def reconcile_project(self, project_id: str, delete: bool = False) -> List[ReconciliationReport]:
+        """Reconcile a single project's folders across all reconciled buckets (e.g. after delete_project)"""
+        buckets = get_storage_info()['buckets']
+        return [
+            self.reconcile_prefix(buckets[key], f"projects/{project_id}", delete=delete)
+            for key in RECONCILED_BUCKETS
+        ]
+
+    def _record_missing(self, report: ReconciliationReport, path: str) -> None:
+        report.missing_count += 1
+        if len(report.missing_sample) < self.sample_limit:
+            report.missing_sample.append(path)
+
+    def _delete_batch(self, bucket: str, paths: List[str]) -> int:
+        if self.client.delete_files(bucket, paths):
+            return len(paths)
+        logger.error(f"Failed to delete {len(paths)} orphaned blobs from {bucket}")
+        return 0
+
+
+def reconcile_storage(delete: bool = False) -> List[ReconciliationReport]:
+    """Reconcile every reconciled bucket; reports only unless delete=True"""
+    reconciler = StorageReconciler()
+    buckets = get_storage_info()['buckets']
+    reports = []
+    for key in RECONCILED_BUCKETS:
+        reports.extend(reconciler.reconcile_bucket(buckets[key], delete=delete))
+    return reports
+
+
+__all__ = [
+    'StorageReconciler',
+    'ReconciliationReport',
+    'ReconciliationError',
+    'REFERENCE_COLUMNS',
+    'RECONCILED_BUCKETS',
+    'unlisted_reference_columns',
+    'check_reference_coverage',
+    'normalize_reference',
+    'iter_referenced_paths',
+    'reconcile_storage'
+]
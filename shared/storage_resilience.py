@@ -0,0 +1,299 @@
+"""
+Storage resilience layer for COMETA
+Retries transient Supabase Storage failures with jittered exponential backoff and
+fails fast through per-bucket circuit breakers while storage is degraded
+"""
+
+import os
+import asyncio
+import random
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying; everything else in 4xx is a caller error
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class StorageResult:
+    """Structured outcome of a storage operation"""
+    ok: bool
+    value: Any = None
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    error_type: Optional[str] = None  # 'http', 'timeout', 'connection', 'circuit_open', 'client'
+    attempts: int = 0
+
+    @property
+    def retryable(self) -> bool:
+        """Whether the failure looks transient"""
+        if self.ok:
+            return False
+        if self.error_type in ('timeout', 'connection'):
+            return True
+        return self.status_code in RETRYABLE_STATUS_CODES
+
+
+class StorageError(Exception):
+    """Raised by streaming operations that cannot return a StorageResult"""
+
+    def __init__(self, result: StorageResult):
+        super().__init__(result.error)
+        self.result = result
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+    max_attempts: int = 4
+    base_delay: float = 0.25
+    max_delay: float = 5.0
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    """
+    Per-bucket circuit breaker
+
+    Opens after `failure_threshold` consecutive transient failures and rejects
+    calls for `reset_timeout` seconds. Afterwards a single trial call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            # Half-open: exactly one trial request at a time
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"Storage circuit for '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Give up a half-open trial slot without judging the backend (e.g. caller error)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(bucket: str) -> CircuitBreaker:
+    """Get the process-wide circuit breaker for a bucket"""
+    with _breakers_lock:
+        breaker = _breakers.get(bucket)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                bucket,
+                failure_threshold=int(os.getenv('SUPABASE_STORAGE_BREAKER_THRESHOLD', '5')),
+                reset_timeout=float(os.getenv('SUPABASE_STORAGE_BREAKER_RESET_SECONDS', '30'))
+            )
+            _breakers[bucket] = breaker
+        return breaker
+
+
+def classify_response(response: requests.Response, success_codes: Iterable[int], attempts: int) -> StorageResult:
+    """Turn an HTTP response into a StorageResult (value is the response on success)"""
+    if response.status_code in success_codes:
+        return StorageResult(ok=True, value=response, status_code=response.status_code, attempts=attempts)
+    return StorageResult(
+        ok=False,
+        status_code=response.status_code,
+        error=f"HTTP {response.status_code}: {response.text[:500]}",
+        error_type='http',
+        attempts=attempts
+    )
+
+
+def classify_exception(error: Exception, attempts: int) -> StorageResult:
+    """Turn a transport exception into a StorageResult"""
+    if isinstance(error, requests.Timeout):
+        error_type = 'timeout'
+    elif isinstance(error, requests.ConnectionError):
+        error_type = 'connection'
+    else:
+        error_type = 'client'
+    return StorageResult(ok=False, error=str(error), error_type=error_type, attempts=attempts)
+
+
+def call_with_resilience(bucket: str,
+                         operation: Callable[[int], requests.Response],
+                         success_codes: Iterable[int] = (200,),
+                         policy: RetryPolicy = RetryPolicy(),
+                         before_retry: Optional[Callable[[], bool]] = None) -> StorageResult:
+    """
+    Run a storage HTTP call through the bucket's circuit breaker with retries
+
+    Args:
+        bucket: Bucket the call targets (selects the circuit breaker)
+        operation: Performs one attempt; receives the 1-based attempt number
+        success_codes: Status codes counted as success
+        policy: Retry policy; use NO_RETRY for non-idempotent calls
+        before_retry: Prepares a retry (e.g. rewinds an upload stream); returning
+            False stops retrying
+
+    Returns:
+        StorageResult whose value is the successful response
+    """
+    breaker = get_circuit_breaker(bucket)
+    success_codes = tuple(success_codes)
+    result = StorageResult(ok=False, error='No attempt made', error_type='client')
+
+    for attempt in range(1, policy.max_attempts + 1):
+        if not breaker.allow_request():
+            return StorageResult(
+                ok=False,
+                error=f"Storage circuit for '{bucket}' is open",
+                error_type='circuit_open',
+                attempts=attempt - 1
+            )
+
+        try:
+            result = classify_response(operation(attempt), success_codes, attempt)
+        except Exception as e:
+            result = classify_exception(e, attempt)
+
+        if result.ok:
+            breaker.record_success()
+            return result
+
+        if not result.retryable:
+            # The backend answered; a 4xx says nothing about its health
+            breaker.release()
+            return result
+
+        breaker.record_failure()
+        if attempt == policy.max_attempts:
+            break
+        if before_retry is not None and not before_retry():
+            break
+
+        delay = policy.backoff(attempt)
+        logger.info(f"Retrying storage call on '{bucket}' in {delay:.2f}s after: {result.error}")
+        time.sleep(delay)
+
+    return result
+
+
+async def async_call_with_resilience(bucket: str,
+                                     operation: Callable[[int], Awaitable[Any]],
+                                     classify_error: Callable[[Exception, int], StorageResult],
+                                     success_codes: Iterable[int] = (200,),
+                                     policy: RetryPolicy = RetryPolicy(),
+                                     before_retry: Optional[Callable[[], Awaitable[bool]]] = None) -> StorageResult:
+    """
+    Async counterpart of call_with_resilience for non-blocking HTTP clients
+
+    Shares the per-bucket circuit breakers with the blocking client, so both
+    sides stop calling a storage backend that is known to be down.
+    classify_error maps the HTTP library's exceptions to a StorageResult.
+    """
+    breaker = get_circuit_breaker(bucket)
+    success_codes = tuple(success_codes)
+    result = StorageResult(ok=False, error='No attempt made', error_type='client')
+
+    for attempt in range(1, policy.max_attempts + 1):
+        if not breaker.allow_request():
+            return StorageResult(
+                ok=False,
+                error=f"Storage circuit for '{bucket}' is open",
+                error_type='circuit_open',
+                attempts=attempt - 1
+            )
+
+        try:
+            result = classify_response(await operation(attempt), success_codes, attempt)
+        except Exception as e:
+            result = classify_error(e, attempt)
+
+        if result.ok:
+            breaker.record_success()
+            return result
+
+        if not result.retryable:
+            breaker.release()
+            return result
+
+        breaker.record_failure()
+        if attempt == policy.max_attempts:
+            break
+        if before_retry is not None and not await before_retry():
+            break
+
+        delay = policy.backoff(attempt)
+        logger.info(f"Retrying storage call on '{bucket}' in {delay:.2f}s after: {result.error}")
+        await asyncio.sleep(delay)
+
+    return result
+
+
+__all__ = [
+    'StorageResult',
+    'StorageError',
+    'RetryPolicy',
+    'NO_RETRY',
+    'CircuitBreaker',
+    'get_circuit_breaker',
+    'call_with_resilience',
+    'async_call_with_resilience',
+    'classify_response',
+    'classify_exception',
+    'RETRYABLE_STATUS_CODES'
+]
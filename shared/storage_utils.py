@@ -4,15 +4,270 @@ Handles file uploads, downloads, and management
 """
 
 import os
+import base64
+import hashlib
+import logging
+import mmap
+import tempfile
+import threading
+import time
+import queue
 import requests
-from typing import Optional, BinaryIO
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, BinaryIO, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+from datetime import datetime, date
+from urllib.parse import unquote, urlparse
 import uuid
 
+try:
+    from .storage_resilience import (
+        NO_RETRY, RetryPolicy, StorageError, StorageResult, call_with_resilience
+    )
+except ImportError:
+    from storage_resilience import (
+        NO_RETRY, RetryPolicy, StorageError, StorageResult, call_with_resilience
+    )
+
+logger = logging.getLogger(__name__)
+
+
+class StorageDiskCache:
+    """
+    Read-through on-disk LRU cache for objects downloaded from Supabase Storage
+
+    Entries are keyed by bucket/path plus the object's ETag and bounded by total
+    bytes. Files are written atomically (temp file + rename) and cache hits are
+    served as read-only memory maps, so repeated reads never copy the file into
+    Python memory up front.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None,
+                 max_age_seconds: Optional[int] = None):
+        """
+        Args:
+            cache_dir: Directory holding cached objects
+            max_bytes: Upper bound for the total size of cached objects
+            max_age_seconds: How long a cached object is served without
+                revalidating its ETag against storage
+        """
+        self.cache_dir = cache_dir or os.getenv(
+            'SUPABASE_STORAGE_CACHE_DIR',
+            os.path.join(tempfile.gettempdir(), 'cometa-storage-cache')
+        )
+        self.max_bytes = max_bytes if max_bytes is not None else int(
+            os.getenv('SUPABASE_STORAGE_CACHE_MAX_BYTES', str(512 * 1024 * 1024))
+        )
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else int(
+            os.getenv('SUPABASE_STORAGE_CACHE_MAX_AGE', '3600')
+        )
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # file name -> size, oldest first
+        self._by_key: Dict[str, str] = {}  # object key hash -> current file name
+        self._total_bytes = 0
+        self._load_index()
+
+    @staticmethod
+    def _key_hash(bucket: str, file_path: str) -> str:
+        return hashlib.sha256(f"{bucket}/{file_path}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _entry_name(key_hash: str, etag: str) -> str:
+        encoded_etag = base64.urlsafe_b64encode(etag.encode('utf-8')).decode('ascii').rstrip('=')
+        return f"{key_hash}-{encoded_etag}"
+
+    @staticmethod
+    def _entry_etag(entry_name: str) -> str:
+        encoded_etag = entry_name.split('-', 1)[1]
+        padding = '=' * (-len(encoded_etag) % 4)
+        return base64.urlsafe_b64decode(encoded_etag + padding).decode('utf-8')
+
+    def _load_index(self) -> None:
+        """Rebuild the LRU index from the cache directory (least recently used first)"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            full_path = os.path.join(self.cache_dir, name)
+            if name.endswith('.tmp'):
+                # Leftover from an interrupted write
+                try:
+                    os.unlink(full_path)
+                except OSError:
+                    pass
+                continue
+            if '-' not in name:
+                continue
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            found.append((stat.st_atime, name, stat.st_size))
+
+        for _, name, size in sorted(found):
+            key_hash = name.split('-', 1)[0]
+            previous = self._by_key.get(key_hash)
+            if previous:
+                # Older ETag of the same object - superseded by the newer file
+                self._remove_entry(previous)
+            self._by_key[key_hash] = name
+            self._entries[name] = size
+            self._total_bytes += size
+
+        self._evict()
+
+    def _remove_entry(self, name: str) -> None:
+        size = self._entries.pop(name, 0)
+        self._total_bytes -= size
+        key_hash = name.split('-', 1)[0]
+        if self._by_key.get(key_hash) == name:
+            del self._by_key[key_hash]
+        try:
+            os.unlink(os.path.join(self.cache_dir, name))
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._remove_entry(oldest)
+
+    @staticmethod
+    def _map_file(full_path: str) -> Union[bytes, mmap.mmap]:
+        with open(full_path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def lookup(self, bucket: str, file_path: str) -> Optional[Tuple[str, bool]]:
+        """
+        Find the cached version of an object
+
+        Returns:
+            (etag, is_fresh) if the object is cached, None otherwise. Fresh
+            entries can be served without contacting storage.
+        """
+        with self._lock:
+            name = self._by_key.get(self._key_hash(bucket, file_path))
+            if not name:
+                return None
+            try:
+                validated_at = os.stat(os.path.join(self.cache_dir, name)).st_mtime
+            except OSError:
+                self._remove_entry(name)
+                return None
+            return self._entry_etag(name), (time.time() - validated_at) < self.max_age_seconds
+
+    def get(self, bucket: str, file_path: str, etag: Optional[str] = None) -> Optional[Union[bytes, mmap.mmap]]:
+        """
+        Get a cached object as a read-only memory map
+
+        Args:
+            bucket: Storage bucket name
+            file_path: Path within bucket
+            etag: Required ETag; None accepts whichever version is cached
+        """
+        with self._lock:
+            key_hash = self._key_hash(bucket, file_path)
+            name = self._by_key.get(key_hash)
+            if not name or (etag is not None and name != self._entry_name(key_hash, etag)):
+                return None
+
+            full_path = os.path.join(self.cache_dir, name)
+            try:
+                data = self._map_file(full_path)
+                # Record the access in atime so LRU order survives restarts
+                os.utime(full_path, (time.time(), os.stat(full_path).st_mtime))
+            except OSError:
+                self._remove_entry(name)
+                return None
+
+            self._entries.move_to_end(name)
+            return data
+
+    def mark_validated(self, bucket: str, file_path: str) -> None:
+        """Restart the freshness window after storage confirmed the cached ETag (HTTP 304)"""
+        with self._lock:
+            name = self._by_key.get(self._key_hash(bucket, file_path))
+            if name:
+                try:
+                    os.utime(os.path.join(self.cache_dir, name))
+                except OSError:
+                    self._remove_entry(name)
+
+    def put(self, bucket: str, file_path: str, etag: str, content: bytes) -> Union[bytes, mmap.mmap]:
+        """
+        Store an object atomically and return it as served from the cache
+
+        Objects larger than the whole cache are returned without being stored.
+        """
+        if len(content) > self.max_bytes:
+            return content
+
+        key_hash = self._key_hash(bucket, file_path)
+        name = self._entry_name(key_hash, etag)
+        full_path = os.path.join(self.cache_dir, name)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, full_path)
+        except OSError as e:
+            logger.warning(f"Storage cache write failed for {bucket}/{file_path}: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return content
+
+        with self._lock:
+            previous = self._by_key.get(key_hash)
+            if previous and previous != name:
+                self._remove_entry(previous)
+            self._total_bytes -= self._entries.pop(name, 0)
+            self._by_key[key_hash] = name
+            self._entries[name] = len(content)
+            self._total_bytes += len(content)
+            self._evict()
+
+        return self.get(bucket, file_path, etag) or content
+
+    def invalidate(self, bucket: str, file_path: str) -> None:
+        """Drop an object from the cache (e.g. after delete or overwrite)"""
+        with self._lock:
+            name = self._by_key.get(self._key_hash(bucket, file_path))
+            if name:
+                self._remove_entry(name)
+
+
+_storage_cache: Optional[StorageDiskCache] = None
+_storage_cache_lock = threading.Lock()
+
+
+def get_storage_cache() -> StorageDiskCache:
+    """Get the process-wide storage download cache"""
+    global _storage_cache
+    if _storage_cache is None:
+        with _storage_cache_lock:
+            if _storage_cache is None:
+                _storage_cache = StorageDiskCache()
+    return _storage_cache
+
+
 class SupabaseStorageClient:
     """Client for Supabase Storage operations"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[StorageDiskCache] = None,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 timeout: Optional[Tuple[float, float]] = None):
+        self._cache = cache
+        self.retry_policy = retry_policy or RetryPolicy()
+        # (connect, read) seconds - without them a hung backend blocks until the OS gives up
+        self.timeout = timeout or (
+            float(os.getenv('SUPABASE_STORAGE_CONNECT_TIMEOUT', '3.05')),
+            float(os.getenv('SUPABASE_STORAGE_READ_TIMEOUT', '30'))
+        )
         self.base_url = os.getenv('NEXT_PUBLIC_SUPABASE_URL')
         self.anon_key = os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY')
         
@@ -24,7 +279,68 @@ class SupabaseStorageClient:
             'Authorization': f'Bearer {self.anon_key}',
             'apikey': self.anon_key
         }
-    
+
+    def _request(self, method: str, bucket: str, url: str, success_codes: Iterable[int] = (200,),
+                 idempotent: bool = True, before_retry: Optional[Callable[[], bool]] = None,
+                 **kwargs) -> StorageResult:
+        """Send one storage request through the bucket's circuit breaker and retry policy"""
+        kwargs.setdefault('timeout', self.timeout)
+
+        def operation(attempt: int) -> requests.Response:
+            return requests.request(method, url, **kwargs)
+
+        return call_with_resilience(
+            bucket,
+            operation,
+            success_codes=success_codes,
+            policy=self.retry_policy if idempotent else NO_RETRY,
+            before_retry=before_retry
+        )
+
+    def upload_file_result(self, bucket: str, file_path: str, file_data: BinaryIO,
+                           content_type: str = 'application/octet-stream') -> StorageResult:
+        """
+        Upload file to Supabase Storage, returning a structured result
+
+        Seekable streams are rewound and retried on transient failures; retries
+        send x-upsert so an upload whose response was lost does not fail as a
+        duplicate. Non-seekable streams are attempted once.
+
+        Returns:
+            StorageResult with the public URL as value
+        """
+        url = f"{self.storage_url}/object/{bucket}/{file_path}"
+        headers = {**self.headers, 'Content-Type': content_type}
+
+        start_position = None
+        if hasattr(file_data, 'seek') and hasattr(file_data, 'tell'):
+            try:
+                start_position = file_data.tell()
+            except (OSError, ValueError):
+                start_position = None
+
+        def rewind() -> bool:
+            if start_position is None:
+                return False
+            file_data.seek(start_position)
+            return True
+
+        def operation(attempt: int) -> requests.Response:
+            attempt_headers = {**headers, 'x-upsert': 'true'} if attempt > 1 else headers
+            return requests.post(url, headers=attempt_headers, data=file_data, timeout=self.timeout)
+
+        result = call_with_resilience(
+            bucket,
+            operation,
+            success_codes=(200, 201),
+            policy=self.retry_policy if start_position is not None else NO_RETRY,
+            before_retry=rewind
+        )
+        if result.ok:
+            self._invalidate_cached(bucket, file_path)
+            result.value = self.get_public_url(bucket, file_path)
+        return result
+
     def upload_file(self, bucket: str, file_path: str, file_data: BinaryIO, 
                    content_type: str = 'application/octet-stream') -> Optional[str]:
         """
@@ -39,51 +355,293 @@ class SupabaseStorageClient:
         Returns:
             Public URL if successful, None if failed
         """
-        try:
-            url = f"{self.storage_url}/object/{bucket}/{file_path}"
-            headers = {**self.headers, 'Content-Type': content_type}
-            
-            response = requests.post(url, headers=headers, data=file_data)
-            
-            if response.status_code in [200, 201]:
-                return self.get_public_url(bucket, file_path)
-            else:
-                print(f"Upload failed: {response.status_code} - {response.text}")
-                return None
-                
-        except Exception as e:
-            print(f"Upload error: {str(e)}")
+        result = self.upload_file_result(bucket, file_path, file_data, content_type)
+        if not result.ok:
+            logger.warning(f"Upload of {bucket}/{file_path} failed after {result.attempts} attempt(s): {result.error}")
             return None
+        return result.value
     
     def get_public_url(self, bucket: str, file_path: str) -> str:
         """Get public URL for a file"""
         return f"{self.storage_url}/object/public/{bucket}/{file_path}"
     
+    @property
+    def cache(self) -> StorageDiskCache:
+        """Download cache (shared across clients unless one was passed in)"""
+        if self._cache is None:
+            self._cache = get_storage_cache()
+        return self._cache
+
+    def _invalidate_cached(self, bucket: str, file_path: str) -> None:
+        cache = self._cache or _storage_cache
+        if cache is not None:
+            cache.invalidate(bucket, file_path)
+
+    def download_file(self, bucket: str, file_path: str,
+                      use_cache: bool = True) -> Optional[Union[bytes, mmap.mmap]]:
+        """
+        Download file from Supabase Storage through the local disk cache
+
+        Cached objects are served straight from disk while fresh; stale ones are
+        revalidated with If-None-Match so unchanged files are not transferred again.
+
+        Args:
+            bucket: Storage bucket name
+            file_path: Path within bucket
+            use_cache: Set to False to bypass the cache entirely
+
+        Returns:
+            File contents (read-only memory map on cache hits), None if failed
+        """
+        cached = self.cache.lookup(bucket, file_path) if use_cache else None
+        if cached:
+            etag, is_fresh = cached
+            if is_fresh:
+                data = self.cache.get(bucket, file_path, etag)
+                if data is not None:
+                    return data
+
+        url = f"{self.storage_url}/object/{bucket}/{file_path}"
+        headers = dict(self.headers)
+        if cached:
+            headers['If-None-Match'] = cached[0]
+
+        result = self._request('GET', bucket, url, success_codes=(200, 304), headers=headers)
+        if not result.ok:
+            if cached and result.error_type == 'circuit_open':
+                # Storage is known to be down - a stale copy beats no copy
+                return self.cache.get(bucket, file_path, cached[0])
+            logger.warning(f"Download of {bucket}/{file_path} failed: {result.error}")
+            return None
+
+        response = result.value
+        if response.status_code == 304:
+            if cached:
+                self.cache.mark_validated(bucket, file_path)
+                data = self.cache.get(bucket, file_path, cached[0])
+                if data is not None:
+                    return data
+            # Entry vanished between lookup and read - fetch unconditionally
+            return self.download_file(bucket, file_path, use_cache=False)
+
+        etag = response.headers.get('ETag')
+        if use_cache and etag:
+            return self.cache.put(bucket, file_path, etag, response.content)
+        return response.content
+
+    def download_from_url(self, url: str, use_cache: bool = True) -> Optional[Union[bytes, mmap.mmap]]:
+        """Download file referenced by a stored public URL (e.g. Photo.url)"""
+        location = parse_storage_url(url)
+        if not location:
+            return None
+        return self.download_file(*location, use_cache=use_cache)
+
+    def delete_file_result(self, bucket: str, file_path: str) -> StorageResult:
+        """Delete file from storage, returning a structured result"""
+        url = f"{self.storage_url}/object/{bucket}/{file_path}"
+        result = self._request('DELETE', bucket, url, headers=self.headers)
+        if result.ok:
+            self._invalidate_cached(bucket, file_path)
+        return result
+
     def delete_file(self, bucket: str, file_path: str) -> bool:
         """Delete file from storage"""
-        try:
-            url = f"{self.storage_url}/object/{bucket}/{file_path}"
-            response = requests.delete(url, headers=self.headers)
-            return response.status_code == 200
-        except Exception as e:
-            print(f"Delete error: {str(e)}")
-            return False
-    
+        result = self.delete_file_result(bucket, file_path)
+        if not result.ok:
+            logger.warning(f"Delete of {bucket}/{file_path} failed: {result.error}")
+        return result.ok
+
+    def list_files_result(self, bucket: str, folder: str = "") -> StorageResult:
+        """List files in bucket/folder, returning a structured result with the entries as value"""
+        url = f"{self.storage_url}/object/list/{bucket}"
+        data = {"prefix": folder} if folder else {}
+
+        result = self._request('POST', bucket, url, headers=self.headers, json=data)
+        if result.ok:
+            result.value = result.value.json()
+        return result
+
     def list_files(self, bucket: str, folder: str = "") -> list:
         """List files in bucket/folder"""
-        try:
-            url = f"{self.storage_url}/object/list/{bucket}"
-            data = {"prefix": folder} if folder else {}
-            
-            response = requests.post(url, headers=self.headers, json=data)
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return []
-        except Exception as e:
-            print(f"List files error: {str(e)}")
+        result = self.list_files_result(bucket, folder)
+        if not result.ok:
+            logger.warning(f"Listing {bucket}/{folder} failed: {result.error}")
             return []
+        return result.value
+
+    def delete_files_result(self, bucket: str, file_paths: List[str]) -> StorageResult:
+        """Delete several files from a bucket in one request, returning a structured result"""
+        if not file_paths:
+            return StorageResult(ok=True, value=[])
+
+        url = f"{self.storage_url}/object/{bucket}"
+        result = self._request('DELETE', bucket, url, headers=self.headers, json={"prefixes": file_paths})
+        if result.ok:
+            for file_path in file_paths:
+                self._invalidate_cached(bucket, file_path)
+            result.value = file_paths
+        return result
+
+    def delete_files(self, bucket: str, file_paths: List[str]) -> bool:
+        """Delete several files from a bucket in one request"""
+        result = self.delete_files_result(bucket, file_paths)
+        if not result.ok:
+            logger.warning(f"Bulk delete of {len(file_paths)} files from {bucket} failed: {result.error}")
+        return result.ok
+
+    def _list_page(self, bucket: str, prefix: str, limit: int, offset: int) -> list:
+        url = f"{self.storage_url}/object/list/{bucket}"
+        data = {
+            "prefix": prefix,
+            "limit": limit,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"}
+        }
+        result = self._request('POST', bucket, url, headers=self.headers, json=data)
+        if not result.ok:
+            raise StorageError(result)
+        return result.value.json()
+
+    def iter_files(self, bucket: str, prefix: str = "", page_size: int = 100,
+                   recursive: bool = False) -> Iterator[dict]:
+        """
+        Lazily iterate files in bucket/prefix, one page at a time
+
+        Unlike list_files, listing errors raise StorageError instead of being
+        swallowed, so audits never mistake a failed listing for an empty folder.
+
+        Args:
+            bucket: Storage bucket name
+            prefix: Folder to list (e.g. 'projects/123/photos/2024/01')
+            page_size: Entries requested per list call
+            recursive: Descend into sub-folders; entries are then yielded in
+                depth-first name order
+
+        Yields:
+            Storage entries with an added 'path' key (full path within bucket)
+        """
+        folder = prefix.strip('/')
+        offset = 0
+        while True:
+            page = self._list_page(bucket, folder, page_size, offset)
+            for entry in page:
+                path = f"{folder}/{entry['name']}" if folder else entry['name']
+                if entry.get('id') is None:
+                    # Folders are returned as placeholder entries without an id
+                    if recursive:
+                        yield from self.iter_files(bucket, path, page_size, recursive=True)
+                    continue
+                yield {**entry, 'path': path}
+
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    def iter_folders(self, bucket: str, prefix: str = "", page_size: int = 100) -> Iterator[str]:
+        """Lazily iterate the immediate sub-folders of bucket/prefix (full paths, name order)"""
+        folder = prefix.strip('/')
+        offset = 0
+        while True:
+            page = self._list_page(bucket, folder, page_size, offset)
+            for entry in page:
+                if entry.get('id') is None:
+                    yield f"{folder}/{entry['name']}" if folder else entry['name']
+
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    def iter_files_concurrent(self, bucket: str, prefixes: Iterable[str], page_size: int = 100,
+                              max_workers: int = 4, recursive: bool = False) -> Iterator[dict]:
+        """
+        Iterate several prefixes in parallel (e.g. one per month folder)
+
+        Entries are handed over through a bounded queue, so memory stays at a few
+        pages regardless of bucket size. Ordering across prefixes is not defined.
+        """
+        prefixes = list(prefixes)
+        if not prefixes:
+            return
+
+        entries: "queue.Queue" = queue.Queue(maxsize=page_size * max_workers)
+        stop = threading.Event()
+        done = object()
+
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    entries.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(folder: str) -> None:
+            try:
+                for entry in self.iter_files(bucket, folder, page_size, recursive):
+                    if not put(entry):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for folder in prefixes:
+                executor.submit(worker, folder)
+
+            remaining = len(prefixes)
+            try:
+                while remaining:
+                    item = entries.get()
+                    if item is done:
+                        remaining -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+            finally:
+                # Unblock workers if the consumer stopped early or a worker failed
+                stop.set()
+
+def month_prefixes(base_prefix: str, start: date, end: Optional[date] = None) -> List[str]:
+    """
+    Month folders under a prefix as laid out by generate_file_path
+
+    Example: month_prefixes('projects/abc/photos', date(2024, 11, 1), date(2025, 1, 1))
+    -> ['projects/abc/photos/2024/11', 'projects/abc/photos/2024/12', 'projects/abc/photos/2025/01']
+    """
+    end = end or datetime.now().date()
+    base_prefix = base_prefix.strip('/')
+    year, month = start.year, start.month
+    prefixes = []
+    while (year, month) <= (end.year, end.month):
+        prefixes.append(f"{base_prefix}/{year:04d}/{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return prefixes
+
+def parse_storage_url(url: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a Supabase Storage object URL into (bucket, path)
+
+    Accepts public, authenticated and signed object URLs as produced by
+    SupabaseStorageClient.get_public_url.
+    """
+    if not url:
+        return None
+
+    path = unquote(urlparse(url).path)
+    marker = '/storage/v1/object/'
+    if marker not in path:
+        return None
+
+    parts = path.split(marker, 1)[1].split('/')
+    if parts and parts[0] in ('public', 'authenticated', 'sign'):
+        parts = parts[1:]
+    if len(parts) < 2 or not parts[0]:
+        return None
+
+    return parts[0], '/'.join(parts[1:])
 
 def generate_file_path(project_id: str, file_type: str, filename: str) -> str:
     """
@@ -200,5 +758,5 @@ def save_uploaded_file(uploaded_file, project_id: str = None) -> Optional[str]:
             return upload_project_document(project_id or 'general', uploaded_file.name, uploaded_file)
             
     except Exception as e:
-        print(f"File upload error: {str(e)}")
+        logger.error(f"File upload error: {str(e)}")
         return None
\ No newline at end of file
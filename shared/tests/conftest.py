@@ -0,0 +1,24 @@
+"""
+Test setup for the shared modules
+Modules are imported the way the apps import them, with shared/ on sys.path.
+The database module is replaced by one without an engine so unit tests can
+never reach a real database; tests that need a session monkeypatch one in.
+"""
+
+import os
+import sys
+import types
+
+SHARED_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+
+def _no_database(*args, **kwargs):
+    raise RuntimeError("Unit tests must not open a database connection")
+
+
+_database = types.ModuleType('database')
+_database.get_database_engine = _no_database
+_database.get_session = _no_database
+sys.modules['database'] = _database
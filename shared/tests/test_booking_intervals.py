@@ -0,0 +1,60 @@
+import random
+from datetime import datetime, timedelta
+
+from booking_intervals import OPEN_END, Booking, IntervalTree, find_conflicts
+
+T0 = datetime(2025, 11, 1)
+
+
+def at(hours):
+    return T0 + timedelta(hours=hours)
+
+
+def test_overlapping_matches_brute_force():
+    rng = random.Random(7)
+    bookings = []
+    for i in range(300):
+        start = rng.randrange(0, 500)
+        bookings.append(Booking(rng.randrange(20), at(start), at(start + rng.randrange(1, 48)), ref=i))
+    bookings.append(Booking('open', at(250), OPEN_END, ref='open'))
+    tree = IntervalTree(bookings)
+
+    for _ in range(300):
+        start = rng.randrange(-10, 560)
+        end = start + rng.randrange(1, 60)
+        found = sorted(b.ref for b in tree.overlapping(at(start), at(end)) if b.ref != 'open')
+        expected = sorted(b.ref for b in bookings if b.overlaps(at(start), at(end)) and b.ref != 'open')
+        assert found == expected
+        assert ('open' in tree.busy_assets(at(start), at(end))) == (end > 250)
+
+
+def test_windows_are_half_open():
+    tree = IntervalTree([Booking('excavator', at(8), at(16))])
+    assert tree.overlapping(at(16), at(20)) == []
+    assert tree.overlapping(at(0), at(8)) == []
+    assert len(tree.overlapping(at(15), at(17))) == 1
+
+
+def test_empty_and_inverted_windows_are_ignored():
+    tree = IntervalTree([Booking('a', at(5), at(5)), Booking('b', at(6), at(4)), Booking('c', at(1), at(2))])
+    assert len(tree) == 1
+    assert tree.busy_assets(at(0), at(10)) == {'c'}
+
+
+def test_free_assets_keeps_the_requested_order():
+    tree = IntervalTree([Booking('van-2', at(0), at(10)), Booking('van-3', at(20), at(30))])
+    assert tree.free_assets(['van-3', 'van-2', 'van-1'], at(5), at(15)) == ['van-3', 'van-1']
+
+
+def test_find_conflicts_checks_existing_and_proposed_bookings():
+    existing = IntervalTree([Booking('roller', at(0), at(10), ref='existing')])
+    proposed = [
+        Booking('roller', at(9), at(12), ref='late'),
+        Booking('roller', at(11), at(14), ref='next'),
+        Booking('roller', at(14), at(16), ref='adjacent'),
+        Booking('digger', at(0), at(10), ref='other asset'),
+    ]
+
+    pairs = {(a.ref, b.ref) for a, b in find_conflicts(existing, proposed)}
+
+    assert pairs == {('late', 'existing'), ('next', 'late')}
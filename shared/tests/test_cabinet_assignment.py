@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+import cabinet_assignment
+from cabinet_assignment import greedy_assign, k_nearest
+
+
+@pytest.fixture(params=['numpy', 'scipy'])
+def search(request, monkeypatch):
+    if request.param == 'scipy':
+        pytest.importorskip('scipy')
+        monkeypatch.setattr(cabinet_assignment, 'HAS_SCIPY', True)
+    else:
+        monkeypatch.setattr(cabinet_assignment, 'HAS_SCIPY', False)
+        # Several blocks, the last one partial
+        monkeypatch.setattr(cabinet_assignment, 'NUMPY_CHUNK_SIZE', 16)
+    return request.param
+
+
+def test_k_nearest_matches_brute_force(search):
+    rng = np.random.default_rng(11)
+    cabinets = rng.uniform(0, 1000, (30, 2))
+    houses = rng.uniform(0, 1000, (50, 2))
+
+    distances, indices = k_nearest(cabinets, houses, 4)
+
+    matrix = np.linalg.norm(houses[:, None, :] - cabinets[None, :, :], axis=2)
+    assert indices.shape == distances.shape == (50, 4)
+    np.testing.assert_array_equal(indices, np.argsort(matrix, axis=1)[:, :4])
+    np.testing.assert_allclose(distances, np.sort(matrix, axis=1)[:, :4])
+
+
+def test_k_nearest_with_fewer_cabinets_than_k(search):
+    cabinets = np.array([[0.0, 0.0], [10.0, 0.0]])
+    distances, indices = k_nearest(cabinets, np.array([[9.0, 0.0]]), 8)
+    assert indices.tolist() == [[1, 0]]
+    assert distances.tolist() == [[1.0, 9.0]]
+
+
+def test_greedy_assign_gives_the_closest_pairs_first():
+    # Both houses prefer cabinet 0, which has room for one
+    distances = np.array([[5.0, 50.0], [1.0, 20.0]])
+    indices = np.array([[0, 1], [0, 1]])
+    remaining = np.array([1, 5])
+
+    assigned = greedy_assign(distances, indices, remaining)
+
+    assert assigned.tolist() == [1, 0]
+    assert remaining.tolist() == [0, 4]
+
+
+def test_greedy_assign_leaves_houses_without_room_or_in_range_unassigned():
+    distances = np.array([[1.0, np.inf], [2.0, np.inf], [np.inf, np.inf]])
+    indices = np.array([[0, 1], [0, 1], [1, 0]])
+    remaining = np.array([1, 3])
+
+    assert greedy_assign(distances, indices, remaining).tolist() == [0, -1, -1]
+    assert remaining.tolist() == [0, 3]
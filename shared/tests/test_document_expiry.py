@@ -0,0 +1,46 @@
+from datetime import date
+
+import pandas as pd
+
+from document_expiry import DOCUMENT_COLUMNS, EVENT_COLUMNS, _message, milestone_events
+
+
+def documents(*rows):
+    return pd.DataFrame.from_records(rows, columns=DOCUMENT_COLUMNS)
+
+
+def test_milestones_per_document_without_duplicates():
+    events = milestone_events(documents(
+        ('d1', 'u1', 'A-1', date(2025, 12, 31), 30, 'Work permit'),
+        ('d2', 'u2', None, date(2025, 12, 10), 7, 'Driving licence'),
+    ))
+
+    assert list(events.columns) == EVENT_COLUMNS
+    by_document = events.groupby('document_id')['reminder_date'].apply(sorted).to_dict()
+    assert by_document == {
+        'd1': [date(2025, 12, 1), date(2025, 12, 24), date(2025, 12, 31)],
+        # The 7-day notice period coincides with the fixed 7-day milestone
+        'd2': [date(2025, 12, 3), date(2025, 12, 10)],
+    }
+
+
+def test_no_documents_gives_empty_events_with_columns():
+    events = milestone_events(documents())
+    assert events.empty and list(events.columns) == EVENT_COLUMNS
+
+
+def event(expiry_date, category='Work permit', document_number='A-1'):
+    row = documents(('d1', 'u1', document_number, expiry_date, 30, category))
+    return next(milestone_events(row).itertuples(index=False))
+
+
+def test_message_counts_days_left_from_today():
+    # A catch-up reminder for the 30-day milestone sent 10 days late
+    message = _message(event(date(2025, 12, 31)), today=date(2025, 12, 11))
+    assert message == {'title': 'Document expires soon',
+                       'message': 'Work permit A-1 expires on 2025-12-31 (20 days).'}
+
+
+def test_message_for_expired_documents_and_missing_labels():
+    message = _message(event(date(2025, 12, 31), category=None, document_number=None), today=date(2026, 1, 2))
+    assert message == {'title': 'Document expired', 'message': 'Document expired on 2025-12-31.'}
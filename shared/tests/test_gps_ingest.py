@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import gps_ingest
+from gps_ingest import clean_gps_batch, copy_to_staging, parse_timestamps, read_gps_batch
+from gps_validation import validate_gps_coordinates_bulk
+
+NOW = datetime(2025, 11, 10, 12, 0)
+VEHICLE = '0b3c5d7e-1111-4222-8333-944455556666'
+
+
+def test_bulk_coordinate_validation():
+    mask = validate_gps_coordinates_bulk([52.5, 91, 'x', None, -90], [13.4, 0, 0, 0, 180])
+    assert mask.tolist() == [True, False, False, False, True]
+
+
+def test_read_gps_batch_detects_csv_and_ndjson():
+    csv = f"vehicle_id,timestamp,lat,lon,speed\n{VEHICLE},2025-11-10T11:00:00Z,52.5,13.4,30\n"
+    ndjson = f'{{"vehicle_id": "{VEHICLE}", "timestamp": 1762772400, "lat": 52.5, "lon": 13.4}}\n'
+    assert list(read_gps_batch(csv).columns) == gps_ingest.GPS_COLUMNS
+    assert read_gps_batch(ndjson.encode())['timestamp'].tolist() == [1762772400]
+    with pytest.raises(ValueError):
+        read_gps_batch("vehicle_id,lat\nx,1\n")
+
+
+def test_parse_timestamps_accepts_iso_and_epoch_seconds_or_millis():
+    parsed = parse_timestamps(pd.Series(['2025-11-10T12:00:00+01:00', 1762772400, 1762772400000, 'soon']))
+    assert parsed[:3].tolist() == [pd.Timestamp('2025-11-10 11:00:00')] * 3
+    assert pd.isna(parsed[3])
+
+
+def test_clean_gps_batch_normalizes_ids_and_drops_invalid_fixes():
+    frame = pd.DataFrame({
+        'vehicle_id': [VEHICLE, VEHICLE.upper().replace('-', ''), 'not-a-uuid', VEHICLE, VEHICLE, VEHICLE],
+        'timestamp': ['2025-11-10T11:00:00Z', '2025-11-10T11:00:00Z', '2025-11-10T11:00:00Z',
+                      '1970-01-01T00:00:00Z', '2025-11-10T13:00:00Z', '2025-11-10T11:01:00Z'],
+        'lat': [52.5, 52.6, 52.5, 52.5, 52.5, 95],
+        'lon': [13.4, 13.5, 13.4, 13.4, 13.4, 13.4],
+    })
+
+    clean, rejected = clean_gps_batch(frame, now=NOW)
+
+    # Bad id, epoch 0, an hour in the future, latitude out of range
+    assert rejected == 4
+    # The same vehicle spelled two ways dedupes on (vehicle_id, timestamp), last wins
+    assert clean.to_dict('records') == [
+        {'vehicle_id': VEHICLE, 'timestamp': pd.Timestamp('2025-11-10 11:00:00'), 'lat': 52.6, 'lon': 13.5}
+    ]
+
+
+def test_clock_skew_and_age_limits():
+    frame = pd.DataFrame({
+        'vehicle_id': [VEHICLE] * 2,
+        'timestamp': [(NOW + timedelta(minutes=4)).isoformat(), (NOW - timedelta(days=89)).isoformat()],
+        'lat': [52.5, 52.5],
+        'lon': [13.4, 13.4],
+    })
+    clean, rejected = clean_gps_batch(frame, now=NOW)
+    assert (len(clean), rejected) == (2, 0)
+
+
+class FakeCopy:
+    def __init__(self, sink):
+        self.sink = sink
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def write(self, data):
+        self.sink.append(data)
+
+
+class FakeCursor:
+    def __init__(self):
+        self.written = []
+        self.closed = False
+
+    def copy_expert(self, sql, buffer):
+        self.written.append(buffer.read())
+
+    def copy(self, sql):
+        return FakeCopy(self.written)
+
+    def close(self):
+        self.closed = True
+
+
+def fake_connection(driver):
+    cursor = FakeCursor()
+    conn = SimpleNamespace(dialect=SimpleNamespace(driver=driver),
+                           connection=SimpleNamespace(cursor=lambda: cursor))
+    return conn, cursor
+
+
+@pytest.mark.parametrize('driver', ['psycopg2', 'psycopg'])
+def test_copy_to_staging_supports_both_psycopg_drivers(driver, monkeypatch):
+    monkeypatch.setattr(gps_ingest, '_COPY_CHUNK_SIZE', 16)
+    frame = pd.DataFrame({'vehicle_id': [VEHICLE], 'timestamp': [pd.Timestamp('2025-11-10 11:00:00')],
+                          'lat': [52.5], 'lon': [13.4]})
+    conn, cursor = fake_connection(driver)
+
+    copy_to_staging(conn, frame)
+
+    assert ''.join(cursor.written) == f"{VEHICLE},2025-11-10 11:00:00.000000,52.5,13.4\n"
+    assert cursor.closed
+
+
+def test_copy_to_staging_rejects_drivers_without_copy():
+    conn, _ = fake_connection('asyncpg')
+    frame = pd.DataFrame(columns=gps_ingest.GPS_COLUMNS)
+    with pytest.raises(RuntimeError, match='psycopg'):
+        copy_to_staging(conn, frame)
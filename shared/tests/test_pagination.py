@@ -0,0 +1,96 @@
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert, select
+
+from pagination import KeysetPaginator, PageCursorStack, SortKey, state_signature
+
+metadata = MetaData()
+items = Table(
+    'items', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String, nullable=False),
+    Column('rank', Integer, nullable=True),
+)
+
+ROWS = [
+    {'id': i, 'name': f"item {i % 4}", 'rank': None if i % 3 == 0 else i % 5}
+    for i in range(1, 24)
+]
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(items), ROWS)
+    return engine
+
+
+def walk(engine, sort_keys, page_size=4):
+    paginator = KeysetPaginator(lambda: select(items.c.id), sort_keys, page_size=page_size, engine=engine)
+    ids, cursor = [], None
+    while True:
+        page = paginator.fetch_page(cursor)
+        ids.extend(page.rows['id'].tolist())
+        if not page.has_next:
+            return ids
+        cursor = page.next_cursor
+
+
+def expected(key, reverse=False):
+    """Python order with NULLs last in either direction, ties broken by id"""
+    present = sorted((row for row in ROWS if row[key] is not None),
+                     key=lambda row: (row[key], row['id']), reverse=reverse)
+    missing = sorted((row for row in ROWS if row[key] is None), key=lambda row: row['id'], reverse=reverse)
+    return [row['id'] for row in present + missing]
+
+
+@pytest.mark.parametrize('descending', [False, True])
+def test_keyset_walk_visits_every_row_once_with_nulls_last(engine, descending):
+    sort_keys = [SortKey(items.c.rank, descending), SortKey(items.c.id, descending)]
+    assert sort_keys[0].nullable and not sort_keys[1].nullable
+    assert walk(engine, sort_keys) == expected('rank', reverse=descending)
+
+
+def test_keyset_walk_with_mixed_directions(engine):
+    sort_keys = [SortKey(items.c.name, descending=True), SortKey(items.c.id)]
+    # Stable sorts: id ascending within each name, names descending
+    want = [row['id'] for row in sorted(ROWS, key=lambda row: row['name'], reverse=True)]
+    assert walk(engine, sort_keys, page_size=5) == want
+
+
+def test_cursor_stack_steps_back_and_forth(engine):
+    paginator = KeysetPaginator(lambda: select(items.c.id), [SortKey(items.c.id)], page_size=10, engine=engine)
+    stack = PageCursorStack()
+    first = stack.current(paginator).rows['id'].tolist()
+    stack.move(1)
+    second = stack.current(paginator).rows['id'].tolist()
+    stack.move(-1)
+    assert stack.current(paginator).rows['id'].tolist() == first
+    assert first == list(range(1, 11)) and second == list(range(11, 21))
+    # Pages that were never reached cannot be jumped to
+    stack.move(5)
+    assert stack.page_number == 0
+
+
+class Project:
+    def __init__(self, id):
+        self.id = id
+
+
+def test_state_signature_ignores_object_identity():
+    project_id = uuid.uuid4()
+    first = state_signature('Date', True, {'project': Project(project_id), 'status': ['active']}, 20)
+    rerun = state_signature('Date', True, {'status': ['active'], 'project': Project(project_id)}, 20)
+    assert first == rerun
+    assert first != state_signature('Date', True, {'project': Project(uuid.uuid4()), 'status': ['active']}, 20)
+
+
+def test_state_signature_serializes_dates_decimals_and_sets():
+    signature = state_signature({'from': date(2025, 11, 1), 'rate': Decimal('1.50'), 'roles': {'b', 'a'}})
+    assert '2025-11-01' in signature and '1.50' in signature
+    assert signature == state_signature({'roles': {'a', 'b'}, 'rate': Decimal('1.50'), 'from': date(2025, 11, 1)})
@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from photo_location import evaluate_photos
+
+HOUSE = {'lat': 52.5, 'lng': 13.4}
+SEGMENT = {'type': 'LineString', 'coordinates': [[13.40, 52.51], [13.42, 52.51]]}
+CABINET = {'type': 'Point', 'coordinates': [13.5, 52.6]}
+
+
+def photo(photo_id, lat, lon, house=None, segment=None, cabinet=None):
+    return {
+        'photo_id': photo_id, 'gps_lat': lat, 'gps_lon': lon,
+        'house_id': house and 'h1', 'house_geom': house if house is not None else None,
+        'segment_id': segment and 's1', 'segment_geom': segment,
+        'cabinet_id': cabinet and 'c1', 'cabinet_geom': cabinet,
+    }
+
+
+def verdicts(rows, **kwargs):
+    return evaluate_photos(pd.DataFrame(rows), **kwargs).set_index('photo_id')
+
+
+def test_photos_are_checked_against_the_most_specific_reference():
+    result = verdicts([
+        photo('near house', 52.5002, 13.4, house=HOUSE, segment=SEGMENT),
+        photo('far from house', 52.502, 13.4, house=HOUSE),
+        photo('on segment', 52.5101, 13.41, segment=SEGMENT, cabinet=CABINET),
+        photo('at cabinet', 52.6, 13.5, cabinet=CABINET),
+    ])
+
+    assert result.loc['near house', ['status', 'reference_type', 'reference_id']].tolist() == ['ok', 'house', 'h1']
+    assert result.loc['near house', 'distance_m'] == pytest.approx(22.2, abs=0.5)
+    assert result.loc['far from house', 'status'] == 'outlier'
+    assert result.loc['on segment', ['status', 'reference_type']].tolist() == ['ok', 'segment']
+    assert result.loc['on segment', 'distance_m'] == pytest.approx(11.1, abs=0.5)
+    assert result.loc['at cabinet', ['status', 'reference_type', 'distance_m']].tolist() == ['ok', 'cabinet', 0.0]
+
+
+def test_unparseable_geometry_falls_through_to_the_next_reference():
+    result = verdicts([photo('p', 52.5101, 13.41, house={'address': 'no coordinates'}, segment=SEGMENT)])
+    assert result.loc['p', 'reference_type'] == 'segment'
+
+
+def test_photos_without_gps_or_reference():
+    result = verdicts([
+        photo('no gps', None, 'x', house=HOUSE),
+        photo('no reference', 52.5, 13.4),
+    ])
+    assert result.loc['no gps', 'status'] == 'no_gps'
+    assert result.loc['no gps', 'reference_type'] == 'house'
+    assert pd.isna(result.loc['no gps', 'distance_m'])
+    assert result.loc['no reference', 'status'] == 'no_reference'
+
+
+def test_threshold_is_configurable():
+    rows = [photo('p', 52.502, 13.4, house=HOUSE)]
+    assert verdicts(rows).loc['p', 'status'] == 'outlier'
+    assert verdicts(rows, threshold_m=500).loc['p', 'status'] == 'ok'
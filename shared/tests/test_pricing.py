@@ -0,0 +1,72 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pricing import (DEPTH_BANDS, SURFACES, PriceTable, classify_depth_bands, price_extras,
+                     price_work_entries, surface_indices)
+
+
+def make_table(rules=None, base_rate=10.0, extras=None):
+    rates = np.full((len(SURFACES), len(DEPTH_BANDS)), np.nan)
+    for (surface, band), rate in (rules or {}).items():
+        rates[SURFACES.index(surface), DEPTH_BANDS.index(band)] = rate
+    return PriceTable(price_list_id='pl-1', rates=rates, base_rate=base_rate, extras=extras or [])
+
+
+def test_depth_on_a_band_limit_belongs_to_the_lower_band():
+    bands = classify_depth_bands([0.3, 0.5, 0.51, 0.8, 1.2, 1.21, None])
+    assert bands.tolist() == [0, 0, 1, 1, 2, 3, -1]
+
+
+def test_segment_surfaces_map_to_price_rule_surfaces():
+    assert surface_indices(['asphalt', 'pavers', 'green', 'gravel', None]).tolist() == [
+        SURFACES.index('asphalt'), SURFACES.index('paving'), SURFACES.index('grass'), -1, -1
+    ]
+
+
+def test_entries_use_their_rule_or_fall_back_to_the_base_rate():
+    table = make_table({('asphalt', '50-80cm'): 30.0, ('paving', '0-50cm'): 20.0})
+    entries = pd.DataFrame({
+        'meters_done_m': [2.0, 3.0, 4.0, None, 1.0],
+        'depth_m': [0.6, 0.4, 0.6, 0.6, None],
+        'surface': ['asphalt', 'pavers', 'dirt', 'asphalt', 'asphalt'],
+    })
+
+    priced = price_work_entries(table, entries)
+
+    assert priced['depth_band'][:4].tolist() == ['50-80cm', '0-50cm', '50-80cm', '50-80cm']
+    assert pd.isna(priced['depth_band'][4])
+    assert priced['rate_per_m'].tolist() == [30.0, 20.0, 10.0, 30.0, 10.0]
+    assert priced['amount_eur'].tolist() == [60.0, 60.0, 40.0, 0.0, 10.0]
+    assert 'amount_eur' not in entries
+
+
+@pytest.mark.parametrize('unit, quantity', [('per_m', 5.0), ('per_day', 1.0), ('per_piece', 2.0), ('lump_sum', 1.0)])
+def test_weekend_surcharge_is_derived_from_weekend_entries(unit, quantity):
+    table = make_table(extras=[{'type': 'weekend_surcharge', 'description': 'Weekend', 'unit': unit, 'rate': 2.0}])
+    # 2025-11-08 is a Saturday, 2025-11-10 a Monday
+    entries = pd.DataFrame({
+        'date': [date(2025, 11, 8), date(2025, 11, 8), date(2025, 11, 10)],
+        'meters_done_m': [2.0, 3.0, 7.0],
+    })
+
+    lines = price_extras(table, entries)
+
+    assert lines['quantity'].tolist() == [quantity]
+    assert lines['amount_eur'].tolist() == [quantity * 2.0]
+
+
+def test_other_extras_are_billed_for_given_quantities_only():
+    table = make_table(extras=[
+        {'type': 'core_drilling', 'description': 'Core drilling', 'unit': 'per_piece', 'rate': 50.0},
+        {'type': 'traffic_plan', 'description': 'Traffic plan', 'unit': 'lump_sum', 'rate': 300.0},
+        {'type': 'unused', 'description': 'Unused', 'unit': 'per_m', 'rate': 1.0},
+    ])
+    entries = pd.DataFrame({'date': [], 'meters_done_m': []})
+
+    lines = price_extras(table, entries, {'core_drilling': 3, 'traffic_plan': 2})
+
+    assert lines['type'].tolist() == ['core_drilling', 'traffic_plan']
+    assert lines['amount_eur'].tolist() == [150.0, 300.0]
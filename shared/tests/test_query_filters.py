@@ -0,0 +1,51 @@
+from datetime import date
+from types import SimpleNamespace
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from models import Project, WorkEntry
+from query_filters import FILTER_COLUMNS, apply_filters, compile_filters, work_entry_status_clause
+
+
+def sql(clause) -> str:
+    return str(clause.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+
+
+def test_pending_matches_the_partial_index_predicate():
+    # 20251104 indexes work_entries WHERE approved IS NOT TRUE
+    assert sql(work_entry_status_clause(['pending'])) == 'work_entries.approved IS NOT true'
+    assert sql(work_entry_status_clause(['approved'])) == 'work_entries.approved IS true'
+
+
+def test_empty_status_selection_matches_nothing():
+    assert sql(work_entry_status_clause([])) == 'false'
+    [clause] = compile_filters({'status': []}, FILTER_COLUMNS['projects'])
+    assert sql(clause) == 'false'
+
+
+def test_unset_filters_add_no_clauses():
+    assert compile_filters({'project': None, 'user_role': None}, FILTER_COLUMNS['work_entries']) == []
+
+
+def test_project_filter_accepts_orm_objects_and_dates_become_ranges():
+    project = SimpleNamespace(id='p-1')
+    clauses = compile_filters(
+        {'project': project, 'date_range': (date(2025, 11, 1), date(2025, 11, 30))},
+        FILTER_COLUMNS['work_entries']
+    )
+    rendered = [sql(clause) for clause in clauses]
+    assert "work_entries.date BETWEEN '2025-11-01' AND '2025-11-30'" in rendered
+    assert "work_entries.project_id = 'p-1'" in rendered
+
+
+def test_role_filter_joins_users():
+    stmt = apply_filters(select(WorkEntry.id), {'user_role': 'worker'}, 'work_entries')
+    rendered = sql(stmt)
+    assert 'JOIN users ON work_entries.user_id = users.id' in rendered
+    assert "users.role = 'worker'" in rendered
+
+
+def test_no_filter_values_leave_the_statement_unchanged():
+    stmt = select(Project.id)
+    assert apply_filters(stmt, {}, 'projects') is stmt
@@ -0,0 +1,39 @@
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('streamlit')
+pytest.importorskip('PIL')
+
+from utils import safe_dataframe
+
+
+def test_object_columns_get_arrow_friendly_dtypes():
+    first, second = uuid.uuid4(), uuid.uuid4()
+    df = safe_dataframe([
+        {'id': first, 'name': 'Trench A', 'rate': Decimal('12.50'), 'day': date(2025, 11, 1), 'done': True, 'm': 3},
+        {'id': second, 'name': None, 'rate': Decimal('7'), 'day': date(2025, 11, 2), 'done': False, 'm': 4},
+    ])
+
+    assert df['id'].tolist() == [str(first), str(second)]
+    assert df['name'].tolist() == ['Trench A', 'N/A']
+    assert df['rate'].dtype == 'float64' and df['rate'].tolist() == [12.5, 7.0]
+    assert pd.api.types.is_datetime64_any_dtype(df['day'])
+    assert df['done'].dtype == 'bool'
+    assert df['m'].dtype == 'int64'
+
+
+def test_mixed_columns_become_text_with_missing_as_na():
+    df = safe_dataframe([{'value': 1}, {'value': 'two'}, {'value': None}])
+    assert df['value'].tolist() == ['1', 'two', 'N/A']
+
+
+def test_dataframe_input_is_copied_and_empty_input_gives_empty_frame():
+    source = pd.DataFrame({'id': [uuid.uuid4()]})
+    result = safe_dataframe(source)
+    assert isinstance(source['id'][0], uuid.UUID)
+    assert isinstance(result['id'][0], str)
+    assert safe_dataframe([]).empty
@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+import storage_reconciliation as reconciliation
+from storage_reconciliation import (
+    ReconciliationError, StorageReconciler, check_reference_coverage, normalize_reference,
+    unlisted_reference_columns
+)
+
+BUCKET = 'project-documents'
+OLD = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+NEW = datetime.now(timezone.utc).isoformat()
+
+
+class FakeStorageClient:
+    def __init__(self, entries):
+        self.entries = entries
+        self.deleted = []
+
+    def iter_files(self, bucket, prefix, page_size, recursive=False):
+        return iter(self.entries)
+
+    def delete_files(self, bucket, paths):
+        self.deleted.extend(paths)
+        return True
+
+
+def blob(path, created_at=OLD, size=10):
+    return {'path': path, 'created_at': created_at, 'metadata': {'size': size}}
+
+
+@pytest.fixture
+def referenced(monkeypatch):
+    paths = []
+    monkeypatch.setattr(reconciliation, 'iter_referenced_paths', lambda bucket, prefix: iter(paths))
+    return paths
+
+
+def test_every_reference_column_is_reconciled():
+    assert unlisted_reference_columns() == []
+
+
+def test_delete_refuses_when_a_reference_column_is_not_listed(monkeypatch, referenced):
+    monkeypatch.setattr(reconciliation, 'REFERENCE_COLUMNS', reconciliation.REFERENCE_COLUMNS[1:])
+    assert 'photos.url' in unlisted_reference_columns()
+    with pytest.raises(ReconciliationError):
+        check_reference_coverage()
+
+    client = FakeStorageClient([blob('projects/p1/a.jpg')])
+    with pytest.raises(ReconciliationError):
+        StorageReconciler(client=client).reconcile_prefix(BUCKET, 'projects/p1', delete=True)
+    assert client.deleted == []
+
+
+def test_normalize_reference_decodes_urls_and_strips_bucket_prefix():
+    url = f"https://x.supabase.co/storage/v1/object/public/{BUCKET}/projects/p1/docs/M%C3%BCll%20plan.pdf"
+    assert normalize_reference(url, 'other') == (BUCKET, 'projects/p1/docs/Müll plan.pdf')
+    assert normalize_reference(f"/{BUCKET}/projects/p1/a.pdf", BUCKET) == (BUCKET, 'projects/p1/a.pdf')
+    assert normalize_reference('', BUCKET) is None
+
+
+def test_like_prefix_keeps_only_encoding_stable_segments():
+    assert reconciliation._like_prefix('projects/abc-1/docs/Bau plan/') == 'projects/abc-1/docs'
+    assert reconciliation._like_prefix('Müll/x') == ''
+
+
+def test_reconcile_prefix_merges_listing_with_references(referenced):
+    referenced.extend(['projects/p1/b.pdf', 'projects/p1/a.pdf', 'projects/p1/gone.pdf'])
+    client = FakeStorageClient([
+        blob('projects/p1/a.pdf'),
+        blob('projects/p1/b.pdf'),
+        blob('projects/p1/fresh.pdf', created_at=NEW),
+        blob('projects/p1/orphan.pdf', size=42),
+    ])
+
+    report = StorageReconciler(client=client).reconcile_prefix(BUCKET, 'projects/p1', delete=True)
+
+    assert report.scanned_blobs == 4
+    assert report.referenced_blobs == 2
+    assert report.skipped_recent == 1
+    assert (report.orphan_count, report.orphan_bytes) == (1, 42)
+    assert report.missing_sample == ['projects/p1/gone.pdf']
+    assert client.deleted == ['projects/p1/orphan.pdf']
+    assert report.deleted_count == 1
+
+
+def test_reconcile_prefix_orders_nested_folders_like_the_listing(referenced):
+    # 'a/b' sorts before 'a-b' by segment, although '/' > '-' as characters
+    referenced.extend(['projects/p1/a-b.pdf', 'projects/p1/a/b.pdf'])
+    client = FakeStorageClient([blob('projects/p1/a/b.pdf'), blob('projects/p1/a-b.pdf')])
+
+    report = StorageReconciler(client=client).reconcile_prefix(BUCKET, 'projects/p1', delete=True)
+
+    assert report.referenced_blobs == 2
+    assert report.orphan_count == 0
+    assert client.deleted == []
+
+
+def test_reconcile_prefix_without_delete_only_reports(referenced):
+    client = FakeStorageClient([blob('projects/p1/orphan.pdf')])
+    report = StorageReconciler(client=client).reconcile_prefix(BUCKET, 'projects/p1')
+    assert report.orphan_sample == ['projects/p1/orphan.pdf']
+    assert client.deleted == []
+
+
+def test_unordered_listing_aborts_before_deleting(referenced):
+    client = FakeStorageClient([blob('projects/p1/b.pdf'), blob('projects/p1/a.pdf')])
+    with pytest.raises(ReconciliationError):
+        StorageReconciler(client=client).reconcile_prefix(BUCKET, 'projects/p1', delete=True)
+    assert client.deleted == []
+
+
+class FakeQuery:
+    def __init__(self, values, filters):
+        self.values = values
+        self.filters = filters
+
+    def filter(self, clause):
+        self.filters.append(str(clause.compile(dialect=postgresql.dialect(),
+                                               compile_kwargs={'literal_binds': True})))
+        return self
+
+    def yield_per(self, count):
+        return self
+
+    def __iter__(self):
+        return iter([(value,) for value in self.values])
+
+
+class FakeSession:
+    def __init__(self, values):
+        self.values = values
+        self.filters = []
+
+    def query(self, column):
+        return FakeQuery(self.values, self.filters)
+
+    def close(self):
+        pass
+
+
+def test_referenced_paths_match_percent_encoded_urls(monkeypatch):
+    url = f"https://x.supabase.co/storage/v1/object/public/{BUCKET}/projects/p1/M%C3%BCll%20plan/a.pdf"
+    session = FakeSession([url, None, 'projects/p2/other.pdf'])
+    monkeypatch.setattr(reconciliation, 'get_session', lambda: session)
+
+    paths = set(reconciliation.iter_referenced_paths(BUCKET, 'projects/p1/Müll plan'))
+
+    assert paths == {'projects/p1/Müll plan/a.pdf'}
+    # The server-side prefilter never contains the decoded folder name
+    like_filters = [clause for clause in session.filters if 'LIKE' in clause]
+    assert like_filters
+    assert all('projects/p1' in clause and 'Müll' not in clause for clause in like_filters)
@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trajectories import (TRIP_GAP_SECONDS, build_trips, douglas_peucker, drop_glitches, haversine_km,
+                          segment_trips, simplify_track)
+
+T0 = datetime(2025, 11, 3, 7, 0)
+STEP_DEG = 0.001  # about 111 m of latitude
+
+
+def drive(start, count, lat0=52.5, lon0=13.4, seconds=30):
+    """Fixes of a vehicle heading north at about 13 km/h"""
+    return pd.DataFrame({
+        'timestamp': [start + timedelta(seconds=seconds * i) for i in range(count)],
+        'lat': [lat0 + STEP_DEG * i for i in range(count)],
+        'lon': [lon0] * count,
+    })
+
+
+def test_haversine_one_degree_of_latitude():
+    assert haversine_km(0, 0, 1, 0) == pytest.approx(111.195, abs=0.01)
+    assert haversine_km([52.5, 52.5], [13.4, 13.4], [52.5, 52.5], [13.4, 13.4]).tolist() == [0.0, 0.0]
+
+
+def test_segment_trips_splits_on_silence_and_jumps():
+    first = drive(T0, 5)
+    silent = drive(T0 + timedelta(seconds=TRIP_GAP_SECONDS + 200), 5)
+    jumped = drive(silent['timestamp'].iloc[-1] + timedelta(seconds=30), 5, lat0=52.6)
+    segmented = segment_trips(pd.concat([first, silent, jumped]))
+
+    assert segmented['trip'].tolist() == [0] * 5 + [1] * 5 + [2] * 5
+    assert segmented.groupby('trip')['step_km'].first().tolist() == [0.0, 0.0, 0.0]
+    assert segmented['step_km'].iloc[1] == pytest.approx(0.111, abs=0.001)
+
+
+def test_drop_glitches_removes_a_spike_but_keeps_a_single_jump():
+    fixes = drive(T0, 6)
+    fixes.loc[2, 'lat'] = 53.5  # there and back within a minute
+    assert drop_glitches(fixes)['timestamp'].tolist() == [t for i, t in enumerate(fixes['timestamp']) if i != 2]
+
+    jump = drive(T0, 6)
+    jump.loc[3:, 'lat'] += 1.0  # one implausible step, then plausible again
+    assert len(drop_glitches(jump)) == 6
+
+
+def test_douglas_peucker_keeps_endpoints_of_a_straight_line():
+    lat = np.linspace(52.5, 52.6, 50)
+    keep = douglas_peucker(lat, np.full(50, 13.4), tolerance_m=1.0)
+    assert np.flatnonzero(keep).tolist() == [0, 49]
+
+
+def test_douglas_peucker_keeps_a_corner():
+    lat = [52.5, 52.505, 52.51, 52.51, 52.51]
+    lon = [13.4, 13.4, 13.4, 13.41, 13.42]
+    assert np.flatnonzero(douglas_peucker(lat, lon, tolerance_m=5.0)).tolist() == [0, 2, 4]
+
+
+def test_simplify_track_coarsens_to_the_point_budget():
+    rng = np.random.default_rng(3)
+    lat = 52.5 + np.cumsum(rng.normal(0, 0.0005, 2000))
+    lon = 13.4 + np.cumsum(rng.normal(0, 0.0005, 2000))
+    assert 2 <= simplify_track(lat, lon, tolerance_m=1.0, max_points=100).sum() <= 100
+
+
+def test_build_trips_skips_the_running_trip_and_parking_jitter():
+    morning = drive(T0, 20)
+    afternoon = drive(T0 + timedelta(hours=6), 20)
+    jitter = drive(T0 + timedelta(hours=3), 3, seconds=30).assign(lat=52.5)
+    fixes = pd.concat([morning, jitter, afternoon]).sort_values('timestamp').reset_index(drop=True)
+
+    still_driving = afternoon['timestamp'].iloc[-1] + timedelta(minutes=1)
+    trips = build_trips(fixes, now=still_driving)
+    assert [trip['started_at'] for trip in trips] == [T0]
+
+    trips = build_trips(fixes, now=still_driving + timedelta(hours=1))
+    assert [trip['started_at'] for trip in trips] == [T0, T0 + timedelta(hours=6)]
+    assert trips[0]['distance_km'] == pytest.approx(19 * 0.1112, abs=0.01)
+    assert trips[0]['fix_count'] == 20
+    # A straight drive simplifies to its two ends
+    assert trips[0]['polyline'] == [[52.5, 13.4], [round(52.5 + 19 * STEP_DEG, 6), 13.4]]
@@ -0,0 +1,411 @@
+"""
+Trajectory processing for COMETA
+Segments raw vehicle_tracking fixes into trips at time and distance gaps,
+measures them with a vectorized haversine and stores a Douglas-Peucker
+simplified polyline per trip in vehicle_trips. Vehicle.mileage is advanced by
+the distance of newly stored trips. Fixes that arrive after their trip was
+stored (buffered trackers) are found by ingestion time, and the trips they
+can change are rebuilt with the mileage corrected.
+"""
+
+import uuid
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, exists, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+try:
+    from .database import get_database_engine
+    from .models import Vehicle, VehiclePosition, VehicleTracking, VehicleTrip, VehicleTripScan
+except ImportError:
+    from database import get_database_engine
+    from models import Vehicle, VehiclePosition, VehicleTracking, VehicleTrip, VehicleTripScan
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+# A new trip starts after this much silence or a jump this far between fixes
+TRIP_GAP_SECONDS = 600
+MAX_STEP_KM = 2.0
+# Fixes implying a higher speed than this from the previous fix are GPS glitches
+MAX_SPEED_KMH = 200.0
+# Shorter "trips" are parking jitter and are neither stored nor counted
+MIN_TRIP_KM = 0.2
+
+SIMPLIFY_TOLERANCE_M = 10.0
+
+# Ingestion batches committing out of created_at order are re-read this far
+# back; re-reading an already processed fix at worst rebuilds the same trips
+INGEST_LAG = timedelta(minutes=5)
+MAX_POLYLINE_POINTS = 500
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km, element-wise over arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype='float64')) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def drop_glitches(fixes: pd.DataFrame, max_speed_kmh: float = MAX_SPEED_KMH) -> pd.DataFrame:
+    """
+    Drop GPS spikes: fixes reached and left at an implausible speed. A single
+    implausible step (e.g. after a signal loss) is kept and splits the trip.
+    """
+    if len(fixes) < 2:
+        return fixes
+    lat = fixes['lat'].to_numpy()
+    lon = fixes['lon'].to_numpy()
+    step_km = haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    hours = np.diff(fixes['timestamp'].to_numpy()).astype('timedelta64[ms]').astype('float64') / 3.6e6
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(hours > 0, step_km / hours, np.where(step_km > 0, np.inf, 0))
+    implausible = speed > max_speed_kmh
+    spike = np.concatenate([[False], implausible[:-1] & implausible[1:], [False]])
+    keep = ~spike
+    return fixes[keep].reset_index(drop=True)
+
+
+def segment_trips(fixes: pd.DataFrame, gap_seconds: float = TRIP_GAP_SECONDS,
+                  max_step_km: float = MAX_STEP_KM) -> pd.DataFrame:
+    """
+    Label time-ordered fixes with a trip number
+
+    Returns:
+        Copy of fixes with `trip` (0-based) and `step_km` (distance from the
+        previous fix of the same trip; 0 at a trip start) columns
+    """
+    segmented = fixes.reset_index(drop=True).copy()
+    if segmented.empty:
+        return segmented.assign(trip=pd.Series(dtype='int64'), step_km=pd.Series(dtype='float64'))
+
+    lat = segmented['lat'].to_numpy(dtype='float64')
+    lon = segmented['lon'].to_numpy(dtype='float64')
+    step_km = np.concatenate([[0.0], haversine_km(lat[:-1], lon[:-1], lat[1:], lon[1:])])
+    gap = np.concatenate([[0.0], np.diff(segmented['timestamp'].to_numpy()).astype('timedelta64[s]').astype('float64')])
+
+    new_trip = (gap > gap_seconds) | (step_km > max_step_km)
+    new_trip[0] = True
+    segmented['trip'] = np.cumsum(new_trip) - 1
+    segmented['step_km'] = np.where(new_trip, 0.0, step_km)
+    return segmented
+
+
+def douglas_peucker(lat, lon, tolerance_m: float) -> np.ndarray:
+    """
+    Douglas-Peucker simplification
+
+    Returns a boolean mask of the points to keep (first and last always kept).
+    Distances are measured on a local equirectangular projection, which is
+    accurate to well under a meter at trip scale.
+    """
+    lat = np.asarray(lat, dtype='float64')
+    lon = np.asarray(lon, dtype='float64')
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[[0, -1]] = True
+
+    radius_m = EARTH_RADIUS_KM * 1000
+    x = np.radians(lon) * np.cos(np.radians(lat.mean())) * radius_m
+    y = np.radians(lat) * radius_m
+
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distance = np.hypot(px, py)
+        else:
+            distance = np.abs(dx * py - dy * px) / length
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def simplify_track(lat, lon, tolerance_m: float = SIMPLIFY_TOLERANCE_M,
+                   max_points: int = MAX_POLYLINE_POINTS) -> np.ndarray:
+    """Douglas-Peucker mask, coarsening the tolerance until at most max_points remain"""
+    keep = douglas_peucker(lat, lon, tolerance_m)
+    while keep.sum() > max_points:
+        tolerance_m *= 2
+        keep = douglas_peucker(lat, lon, tolerance_m)
+    return keep
+
+
+def build_trips(fixes: pd.DataFrame, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """
+    Trips from time-ordered fixes (timestamp, lat, lon) of one vehicle
+
+    The last trip is left out while it may still be running (its last fix is
+    less than TRIP_GAP_SECONDS before `now`); a later run picks it up whole.
+    """
+    now = now or datetime.utcnow()
+    segmented = segment_trips(drop_glitches(fixes))
+    trips = []
+    for trip_no, trip in segmented.groupby('trip', sort=True):
+        ended_at = trip['timestamp'].iloc[-1].to_pydatetime()
+        if trip_no == segmented['trip'].iloc[-1] and (now - ended_at).total_seconds() < TRIP_GAP_SECONDS:
+            continue
+        distance_km = float(trip['step_km'].sum())
+        if len(trip) < 2 or distance_km < MIN_TRIP_KM:
+            continue
+
+        lat = trip['lat'].to_numpy(dtype='float64')
+        lon = trip['lon'].to_numpy(dtype='float64')
+        keep = simplify_track(lat, lon)
+        trips.append({
+            'started_at': trip['timestamp'].iloc[0].to_pydatetime(),
+            'ended_at': ended_at,
+            'distance_km': round(distance_km, 3),
+            'fix_count': len(trip),
+            'polyline': np.round(np.column_stack([lat[keep], lon[keep]]), 6).tolist()
+        })
+    return trips
+
+
+def trip_watermark(conn: Connection, vehicle_id) -> Optional[datetime]:
+    """End of the vehicle's last stored trip"""
+    return conn.execute(
+        select(func.max(VehicleTrip.ended_at)).where(VehicleTrip.vehicle_id == vehicle_id)
+    ).scalar()
+
+
+def load_fixes(conn: Connection, vehicle_id, since: Optional[datetime] = None) -> pd.DataFrame:
+    """Fixes of one vehicle after `since`, oldest first"""
+    stmt = select(VehicleTracking.timestamp, VehicleTracking.lat, VehicleTracking.lon).where(
+        VehicleTracking.vehicle_id == vehicle_id,
+        VehicleTracking.lat.isnot(None),
+        VehicleTracking.lon.isnot(None)
+    ).order_by(VehicleTracking.timestamp)
+    if since is not None:
+        stmt = stmt.where(VehicleTracking.timestamp > since)
+
+    fixes = pd.DataFrame.from_records(conn.execute(stmt).all(), columns=['timestamp', 'lat', 'lon'])
+    fixes['timestamp'] = pd.to_datetime(fixes['timestamp'])
+    fixes[['lat', 'lon']] = fixes[['lat', 'lon']].astype('float64')
+    return fixes
+
+
+def vehicles_with_new_fixes(conn: Connection) -> List[Any]:
+    """
+    Vehicles whose latest position is newer than their last stored trip, or
+    with fixes ingested since their last run (late fixes included)
+    """
+    last_trip_end = select(func.max(VehicleTrip.ended_at)).where(
+        VehicleTrip.vehicle_id == VehiclePosition.vehicle_id
+    ).scalar_subquery()
+    newer = conn.execute(
+        select(VehiclePosition.vehicle_id).where(
+            or_(last_trip_end.is_(None), VehiclePosition.timestamp > last_trip_end)
+        )
+    ).scalars()
+    ingested = conn.execute(
+        select(VehicleTripScan.vehicle_id).where(
+            VehicleTripScan.ingested_through.isnot(None),
+            exists().where(
+                VehicleTracking.vehicle_id == VehicleTripScan.vehicle_id,
+                VehicleTracking.created_at > VehicleTripScan.ingested_through - INGEST_LAG
+            )
+        )
+    ).scalars()
+    return list(dict.fromkeys([*newer, *ingested]))
+
+
+def ingested_fixes(conn: Connection, vehicle_id, ingested_through: Optional[datetime]):
+    """(earliest fix time, latest ingestion time) of fixes ingested since `ingested_through`"""
+    stmt = select(func.min(VehicleTracking.timestamp), func.max(VehicleTracking.created_at)).where(
+        VehicleTracking.vehicle_id == vehicle_id
+    )
+    if ingested_through is not None:
+        stmt = stmt.where(VehicleTracking.created_at > ingested_through - INGEST_LAG)
+    return conn.execute(stmt).one()
+
+
+def rebuild_boundary(conn: Connection, vehicle_id, earliest: datetime) -> Optional[datetime]:
+    """
+    End of the last stored trip that fixes from `earliest` on cannot change
+    (it ends more than a trip gap before them)
+    """
+    return conn.execute(
+        select(func.max(VehicleTrip.ended_at)).where(
+            VehicleTrip.vehicle_id == vehicle_id,
+            VehicleTrip.ended_at <= earliest - timedelta(seconds=TRIP_GAP_SECONDS)
+        )
+    ).scalar()
+
+
+def delete_trips_after(conn: Connection, vehicle_id, after: Optional[datetime]) -> float:
+    """Remove the vehicle's trips starting after `after` and take their distance off Vehicle.mileage"""
+    stmt = delete(VehicleTrip).where(VehicleTrip.vehicle_id == vehicle_id)
+    if after is not None:
+        stmt = stmt.where(VehicleTrip.started_at > after)
+    removed_km = float(sum(conn.execute(stmt.returning(VehicleTrip.distance_km)).scalars()))
+
+    if removed_km:
+        conn.execute(
+            update(Vehicle)
+            .where(Vehicle.id == vehicle_id)
+            .values(mileage=func.greatest(func.coalesce(Vehicle.mileage, 0) - round(removed_km, 2), 0))
+        )
+    return removed_km
+
+
+def store_trips(conn: Connection, vehicle_id, trips: List[Dict[str, Any]]) -> float:
+    """
+    Insert trips and add their distance to Vehicle.mileage
+
+    Trips already stored (same vehicle and start) are skipped and not counted
+    again. Returns the distance added in km.
+    """
+    if not trips:
+        return 0.0
+    stmt = insert(VehicleTrip).values([
+        {'id': uuid.uuid4(), 'vehicle_id': vehicle_id, **trip} for trip in trips
+    ]).on_conflict_do_nothing(
+        constraint='uq_vehicle_trips_vehicle_started_at'
+    ).returning(VehicleTrip.distance_km)
+    added_km = float(sum(conn.execute(stmt).scalars()))
+
+    if added_km:
+        conn.execute(
+            update(Vehicle)
+            .where(Vehicle.id == vehicle_id)
+            .values(mileage=func.coalesce(Vehicle.mileage, 0) + round(added_km, 2))
+        )
+    return added_km
+
+
+def process_vehicle_trips(vehicle_id, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Segment and store the new trips of one vehicle in one transaction
+
+    Fixes after the last stored trip are segmented as before. When fixes were
+    ingested with earlier timestamps (within a trip gap of stored trips or
+    before them), the stored trips from that point on are deleted and rebuilt
+    from all their fixes. The vehicle's scan row is locked, so concurrent runs
+    wait. The returned distance_km is the net mileage change.
+    """
+    with get_database_engine().begin() as conn:
+        conn.execute(
+            insert(VehicleTripScan).values(vehicle_id=vehicle_id, ingested_through=None)
+            .on_conflict_do_nothing(index_elements=['vehicle_id'])
+        )
+        ingested_through = conn.execute(
+            select(VehicleTripScan.ingested_through)
+            .where(VehicleTripScan.vehicle_id == vehicle_id)
+            .with_for_update()
+        ).scalar()
+
+        earliest, last_ingested = ingested_fixes(conn, vehicle_id, ingested_through)
+        since = trip_watermark(conn, vehicle_id)
+        removed_km = 0.0
+        late = earliest is not None and since is not None
+        if late and earliest <= since + timedelta(seconds=TRIP_GAP_SECONDS):
+            since = rebuild_boundary(conn, vehicle_id, earliest)
+            removed_km = delete_trips_after(conn, vehicle_id, since)
+            logger.info(f"Rebuilding trips of vehicle {vehicle_id} after {since} for late fixes")
+
+        fixes = load_fixes(conn, vehicle_id, since)
+        trips = build_trips(fixes, now)
+        added_km = store_trips(conn, vehicle_id, trips)
+
+        if last_ingested is not None:
+            conn.execute(
+                update(VehicleTripScan)
+                .where(VehicleTripScan.vehicle_id == vehicle_id)
+                .values(ingested_through=func.greatest(
+                    func.coalesce(VehicleTripScan.ingested_through, last_ingested), last_ingested
+                ))
+            )
+    return {'fixes': len(fixes), 'trips': len(trips), 'distance_km': round(added_km - removed_km, 3)}
+
+
+def process_trips(vehicle_ids: Optional[Iterable] = None, now: Optional[datetime] = None) -> Dict[Any, Dict[str, Any]]:
+    """
+    Incrementally process trips for the given vehicles (default: every vehicle
+    with fixes newer than its last trip)
+    """
+    if vehicle_ids is None:
+        with get_database_engine().connect() as conn:
+            vehicle_ids = vehicles_with_new_fixes(conn)
+
+    results = {}
+    for vehicle_id in vehicle_ids:
+        try:
+            results[vehicle_id] = process_vehicle_trips(vehicle_id, now)
+        except Exception as e:
+            logger.error(f"Trip processing failed for vehicle {vehicle_id}: {e}")
+    logger.info(f"Trip processing: {len(results)} vehicles, "
+                f"{sum(r['trips'] for r in results.values())} trips")
+    return results
+
+
+def get_vehicle_trips(session: Session, vehicle_id, day: date) -> List[Dict[str, Any]]:
+    """Trips of a vehicle started on a day, with their simplified polylines"""
+    start = datetime.combine(day, datetime.min.time())
+    rows = session.execute(
+        select(
+            VehicleTrip.started_at,
+            VehicleTrip.ended_at,
+            VehicleTrip.distance_km,
+            VehicleTrip.polyline
+        ).where(
+            VehicleTrip.vehicle_id == vehicle_id,
+            VehicleTrip.started_at >= start,
+            VehicleTrip.started_at < start + timedelta(days=1)
+        ).order_by(VehicleTrip.started_at)
+    ).all()
+    return [
+        {'started_at': started_at, 'ended_at': ended_at, 'distance_km': float(distance_km), 'polyline': polyline}
+        for started_at, ended_at, distance_km, polyline in rows
+    ]
+
+
+def mileage_report(session: Session, start: date, end: date) -> pd.DataFrame:
+    """Driven km and trip count per vehicle for trips started in [start, end]"""
+    rows = session.execute(
+        select(
+            Vehicle.plate_number,
+            func.count(VehicleTrip.id),
+            func.coalesce(func.sum(VehicleTrip.distance_km), 0)
+        ).join(VehicleTrip, VehicleTrip.vehicle_id == Vehicle.id).where(
+            VehicleTrip.started_at >= datetime.combine(start, datetime.min.time()),
+            VehicleTrip.started_at < datetime.combine(end + timedelta(days=1), datetime.min.time())
+        ).group_by(Vehicle.plate_number).order_by(Vehicle.plate_number)
+    ).all()
+    report = pd.DataFrame.from_records(rows, columns=['Vehicle', 'Trips', 'Distance (km)'])
+    report['Distance (km)'] = report['Distance (km)'].astype('float64')
+    return report
+
+
+__all__ = [
+    'haversine_km',
+    'drop_glitches',
+    'segment_trips',
+    'douglas_peucker',
+    'simplify_track',
+    'build_trips',
+    'store_trips',
+    'delete_trips_after',
+    'process_vehicle_trips',
+    'process_trips',
+    'get_vehicle_trips',
+    'mileage_report'
+]
@@ -15,10 +15,16 @@ import json
 try:
     from .translations import get_text
     from .models import Project, User, MaterialAllocation, WorkEntry
+    from .export_utils import export_download_button
+    from .pagination import DEFAULT_PAGE_SIZE, KeysetPaginator, PageCursorStack, SortKey, state_signature
+    from .dashboard_snapshot import get_dashboard_snapshot, dashboard_snapshot_metrics
 except ImportError:
     # Fallback for absolute imports in Docker environment
     from translations import get_text
     from models import Project, User, MaterialAllocation, WorkEntry
+    from export_utils import export_download_button
+    from pagination import DEFAULT_PAGE_SIZE, KeysetPaginator, PageCursorStack, SortKey, state_signature
+    from dashboard_snapshot import get_dashboard_snapshot, dashboard_snapshot_metrics
 
 
 class UIComponents:
@@ -91,8 +97,8 @@ class UIComponents:
             return None
 
         # Extract project ID from selection
-        project_id = int(selected.split("(")[-1].strip(")"))
-        return next((p for p in projects if p.id == project_id), None)
+        project_id = selected.split("(")[-1].strip(")")
+        return next((p for p in projects if str(p.id) == project_id), None)
 
     @staticmethod
     def user_selector(users: List[User],
@@ -162,6 +168,100 @@ class UIComponents:
             key=f"datatable_{key_suffix}" if key_suffix else None
         )
 
+    @staticmethod
+    def paginated_data_table(query_factory: Callable[[], Any],
+                             sort_options: Dict[str, Any],
+                             unique_column: Any,
+                             filter_state: Optional[Dict[str, Any]] = None,
+                             page_size: int = DEFAULT_PAGE_SIZE,
+                             title: Optional[str] = None,
+                             use_container_width: bool = True,
+                             height: Optional[int] = None,
+                             key_suffix: str = "") -> None:
+        """
+        Server-side paginated data table
+
+        Only the visible page is queried (keyset pagination on the chosen sort
+        column plus unique_column), the next page is prefetched, and the total
+        is counted once per filter/sort state - approximately for large results.
+
+        Args:
+            query_factory: Returns a select() with the current filters applied
+            sort_options: Label -> column the user may sort by
+            unique_column: Unique, non-null tie-breaker (usually the primary key)
+            filter_state: Current filter values (e.g. from filter_sidebar); a
+                change resets the table to the first page
+            page_size: Rows per page
+        """
+        if title:
+            st.subheader(title)
+
+        state_key = f"paginated_table_{key_suffix}"
+        sort_col, order_col = st.columns([3, 1])
+        with sort_col:
+            sort_label = st.selectbox("Sort by", list(sort_options), key=f"{state_key}_sort")
+        with order_col:
+            descending = st.selectbox(
+                "Order", ["Descending", "Ascending"], key=f"{state_key}_order"
+            ) == "Descending"
+
+        signature = state_signature(sort_label, descending, filter_state or {}, page_size)
+        state = st.session_state.get(state_key)
+        if state is None or state['signature'] != signature:
+            state = {'signature': signature, 'pages': PageCursorStack()}
+            st.session_state[state_key] = state
+        pages: PageCursorStack = state['pages']
+
+        paginator = KeysetPaginator(
+            query_factory,
+            [SortKey(sort_options[sort_label], descending), SortKey(unique_column, descending)],
+            page_size=page_size
+        )
+
+        try:
+            page = pages.current(paginator)
+        except Exception as e:
+            st.error(f"Error loading data: {str(e)}")
+            return
+
+        if page.rows.empty and pages.page_number == 0:
+            st.info("No data available")
+            return
+
+        st.dataframe(
+            page.rows,
+            use_container_width=use_container_width,
+            height=height,
+            key=f"datatable_{key_suffix}" if key_suffix else None
+        )
+
+        if pages.total is None:
+            try:
+                pages.total = paginator.count()
+            except Exception as e:
+                st.warning(f"Could not count rows: {str(e)}")
+
+        prev_col, info_col, next_col = st.columns([1, 3, 1])
+        with prev_col:
+            st.button("Previous", key=f"{state_key}_prev", disabled=pages.page_number == 0,
+                      on_click=pages.move, args=(-1,))
+        with info_col:
+            first_row = pages.page_number * page_size + 1
+            label = f"Rows {first_row}-{first_row + len(page.rows) - 1}"
+            if pages.total is not None:
+                prefix = "~" if pages.total.approximate else ""
+                label += f" of {prefix}{pages.total.value:,}"
+            st.caption(label)
+        with next_col:
+            st.button("Next", key=f"{state_key}_next", disabled=not page.has_next,
+                      on_click=pages.move, args=(1,))
+
+        if page.has_next:
+            try:
+                pages.prefetch_next(paginator)
+            except Exception as e:
+                st.warning(f"Could not prefetch next page: {str(e)}")
+
     @staticmethod
     def status_badge(status: str,
                     status_colors: Optional[Dict[str, str]] = None) -> None:
@@ -228,7 +328,8 @@ class UIComponents:
             key_prefix: Prefix for widget keys
 
         Returns:
-            Dictionary of selected filter values
+            Dictionary of selected filter values; pass it to
+            query_filters.apply_filters to filter in SQL rather than in pandas
         """
         st.sidebar.header("Filters")
         filter_values = {}
@@ -336,6 +437,20 @@ class UIComponents:
                     key_suffix=f"dashboard_{i}"
                 )
 
+    @staticmethod
+    def snapshot_dashboard_metrics(scope: str = 'portfolio', columns: int = 3) -> None:
+        """
+        Portfolio KPIs from the precomputed dashboard snapshot (one row read)
+        """
+        try:
+            snapshot = get_dashboard_snapshot(scope)
+        except Exception as e:
+            st.error(f"Error loading dashboard metrics: {str(e)}")
+            return
+
+        UIComponents.dashboard_metrics(dashboard_snapshot_metrics(snapshot), columns=columns)
+        st.caption(f"Updated {snapshot['refreshed_at'].strftime('%H:%M:%S')} UTC")
+
     @staticmethod
     def confirmation_dialog(message: str,
                           confirm_label: str = "Confirm",
@@ -374,12 +489,12 @@ class UIComponents:
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            csv = data.to_csv(index=False)
-            st.download_button(
+            # Encoded chunk by chunk into a temp file rather than one big string
+            export_download_button(
+                data,
                 "Download CSV",
-                csv,
                 f"{filename_prefix}_{datetime.now().strftime('%Y%m%d')}.csv",
-                "text/csv",
+                fmt='csv',
                 key=f"export_csv_{key_suffix}"
             )
 
@@ -473,27 +588,35 @@ class ChartComponents:
         st.plotly_chart(fig, use_container_width=True)
 
     @staticmethod
-    def material_usage_chart(materials: List[MaterialAllocation]) -> None:
-        """Standardized material usage chart (found duplicated 6+ times)"""
-        if not materials:
+    def material_usage_chart(materials: Union[pd.DataFrame, List[MaterialAllocation]]) -> None:
+        """
+        Standardized material usage chart (found duplicated 6+ times)
+
+        Prefer passing the aggregate frame from
+        MaterialService.get_material_usage_summary; a list of allocations works
+        too but touches each allocation's material relationship.
+        """
+        if isinstance(materials, pd.DataFrame):
+            df = materials
+        else:
+            usage_data = []
+            for material in materials or []:
+                allocated = float(material.allocated_qty or 0)
+                used = float(material.used_qty or 0)
+                remaining = allocated - used
+
+                usage_data.append({
+                    'Material': material.material.name if hasattr(material, 'material') else f"Material {material.material_id}",
+                    'Used': used,
+                    'Remaining': remaining,
+                    'Usage %': (used / allocated * 100) if allocated > 0 else 0
+                })
+            df = pd.DataFrame(usage_data)
+
+        if df.empty:
             st.info("No material data to display")
             return
 
-        usage_data = []
-        for material in materials:
-            allocated = float(material.allocated_qty or 0)
-            used = float(material.used_qty or 0)
-            remaining = allocated - used
-
-            usage_data.append({
-                'Material': material.material.name if hasattr(material, 'material') else f"Material {material.material_id}",
-                'Used': used,
-                'Remaining': remaining,
-                'Usage %': (used / allocated * 100) if allocated > 0 else 0
-            })
-
-        df = pd.DataFrame(usage_data)
-
         fig = px.pie(
             df,
             values='Used',
@@ -3,9 +3,18 @@ import os
 from datetime import datetime, date
 import uuid
 import json
+import hashlib
 from PIL import Image
 import io
 
+try:
+    from .gps_validation import validate_gps_coordinates_bulk
+except ImportError:
+    from gps_validation import validate_gps_coordinates_bulk
+
+# Chunk size for streaming uploads to disk; large enough to keep syscalls rare
+UPLOAD_COPY_BUFFER_SIZE = 1024 * 1024
+
 def setup_page_config():
     """Setup Streamlit page configuration"""
     st.set_page_config(
@@ -62,10 +71,70 @@ def validate_required_fields(fields: dict) -> tuple[bool, list]:
     
     return len(errors) == 0, errors
 
-def handle_file_upload(uploaded_file, upload_type: str = "photo") -> str:
-    """Handle file upload and return file path - simplified version"""
+def stream_upload_to_file(uploaded_file, file_path: str,
+                          buffer_size: int = UPLOAD_COPY_BUFFER_SIZE) -> tuple[int, str]:
+    """
+    Copy an uploaded file to disk in chunks, hashing it on the way
+
+    In-memory uploads (Streamlit's UploadedFile) are written straight from their
+    buffer without an intermediate bytes copy; other file objects are read into a
+    reused buffer. Data lands in a temp file next to file_path and is renamed into
+    place, so concurrent readers never see a partial file.
+
+    Returns:
+        (size in bytes, SHA256 hex digest)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = os.path.join(os.path.dirname(file_path) or '.', f".{uuid.uuid4().hex}.part")
+    # Mode 0666 lets the kernel apply the umask, as open() would for file_path
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if hasattr(uploaded_file, 'getbuffer'):
+                with uploaded_file.getbuffer() as view:
+                    for start in range(0, len(view), buffer_size):
+                        with view[start:start + buffer_size] as chunk:
+                            digest.update(chunk)
+                            f.write(chunk)
+                    size = len(view)
+            elif hasattr(uploaded_file, 'readinto'):
+                buffer = bytearray(buffer_size)
+                with memoryview(buffer) as view:
+                    while True:
+                        read = uploaded_file.readinto(view)
+                        if not read:
+                            break
+                        digest.update(view[:read])
+                        f.write(view[:read])
+                        size += read
+            else:
+                while True:
+                    chunk = uploaded_file.read(buffer_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return size, digest.hexdigest()
+
+def save_uploaded_file_locally(uploaded_file, upload_type: str = "photo") -> dict:
+    """
+    Save an upload under uploads/ and return its metadata
+
+    Returns:
+        {'file_path', 'file_size', 'file_hash'} or {} if the upload could not be saved
+    """
     if uploaded_file is None:
-        return None
+        return {}
     
     try:
         # Create uploads directory if it doesn't exist
@@ -77,24 +146,28 @@ def handle_file_upload(uploaded_file, upload_type: str = "photo") -> str:
         unique_filename = f"{uuid.uuid4()}.{file_extension}"
         file_path = os.path.join(upload_dir, unique_filename)
         
-        # Save file with proper error handling
-        with open(file_path, "wb") as f:
-            if hasattr(uploaded_file, 'getbuffer'):
-                f.write(uploaded_file.getbuffer())
-            elif hasattr(uploaded_file, 'read'):
-                f.write(uploaded_file.read())
-            else:
-                st.error("File format not supported")
-                return None
-        
-        return file_path
+        if not (hasattr(uploaded_file, 'getbuffer') or hasattr(uploaded_file, 'read')):
+            st.error("File format not supported")
+            return {}
+
+        file_size, file_hash = stream_upload_to_file(uploaded_file, file_path)
+
+        return {
+            'file_path': file_path,
+            'file_size': file_size,
+            'file_hash': file_hash
+        }
         
     except PermissionError:
         st.error("Permission denied: Cannot save file to uploads directory")
-        return None
+        return {}
     except Exception as e:
         st.error(f"File upload failed: {str(e)}")
-        return None
+        return {}
+
+def handle_file_upload(uploaded_file, upload_type: str = "photo") -> str:
+    """Handle file upload and return file path - simplified version"""
+    return save_uploaded_file_locally(uploaded_file, upload_type).get('file_path')
 
 def improved_file_uploader(label, file_types=['jpg', 'jpeg', 'png'], accept_multiple_files=False, 
                           key_prefix="upload", clear_after_submit=True, **kwargs):
@@ -173,19 +246,25 @@ def get_status_color(status: str) -> str:
     }
     return status_colors.get(status, '#000000')
 
-def export_to_csv(data, filename: str = None):
-    """Export data to CSV"""
+def export_to_csv(data, filename: str = None, compress: bool = False):
+    """
+    Export data to CSV
+
+    Args:
+        data: DataFrame or SQLAlchemy select(); statements are streamed from a
+            server-side cursor instead of being loaded first
+        filename: Download file name
+        compress: Offer a gzip-compressed CSV instead
+    """
+    from export_utils import export_download_button
+
+    fmt = 'csv.gz' if compress else 'csv'
     if filename is None:
-        filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        filename = f"export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
     
     try:
-        csv_data = data.to_csv(index=False)
-        st.download_button(
-            label="Download CSV",
-            data=csv_data,
-            file_name=filename,
-            mime="text/csv"
-        )
+        # Label and extension follow the chosen compression
+        export_download_button(data, None, filename, fmt=fmt)
     except Exception as e:
         st.error(f"Export failed: {str(e)}")
 
@@ -214,9 +293,16 @@ def create_sidebar_navigation():
     return current_page
 
 def calculate_project_progress(project_id: str) -> dict:
-    """Calculate project progress metrics"""
+    """
+    Calculate project progress metrics
+
+    Revenue is priced per entry against the project's active price list
+    (surface/depth band rates plus derivable extras), falling back to
+    base_rate_per_m where no rule applies.
+    """
     from database import get_session
-    from models import WorkEntry, Cut, Project
+    from models import Project
+    from pricing import price_project
     
     session = get_session()
     try:
@@ -225,23 +311,21 @@ def calculate_project_progress(project_id: str) -> dict:
         if not project:
             return {}
         
-        # Get approved work entries
-        approved_work = session.query(WorkEntry).filter(
-            WorkEntry.project_id == project_id,
-            WorkEntry.approved_by.isnot(None)
-        ).all()
+        # Approved work entries, priced in one vectorized pass
+        pricing = price_project(session, project_id, approved_only=True)
+        approved_work = pricing['entries']
         
-        completed_length = sum(w.meters_done_m or 0 for w in approved_work)
-        progress_percentage = (completed_length / project.total_length_m * 100) if project.total_length_m > 0 else 0
-        
-        # Calculate estimated revenue
-        estimated_revenue = completed_length * (project.base_rate_per_m or 0)
+        completed_length = float(approved_work['meters_done_m'].astype('float64').sum())
+        total_length = float(project.total_length_m or 0)
+        progress_percentage = (completed_length / total_length * 100) if total_length > 0 else 0
         
         return {
             'completed_length': completed_length,
             'total_length': project.total_length_m,
             'progress_percentage': progress_percentage,
-            'estimated_revenue': estimated_revenue,
+            'estimated_revenue': pricing['total_amount'],
+            'work_revenue': pricing['work_amount'],
+            'extras_revenue': pricing['extras_amount'],
             'work_entries_count': len(approved_work)
         }
         
@@ -280,7 +364,7 @@ def get_work_entry_summary(work_entry_id: str) -> dict:
             'photos_count': len(photos),
             'user_name': f"{user.first_name} {user.last_name}" if user else "Unknown",
             'project_name': project.name if project else "Unknown",
-            'is_approved': work_entry.approved_by is not None
+            'is_approved': work_entry.approved is True
         }
         
     except Exception as e:
@@ -290,34 +374,53 @@ def get_work_entry_summary(work_entry_id: str) -> dict:
         session.close()
 
 def safe_dataframe(data):
-    """Create DataFrame safely converting UUID objects to strings to avoid PyArrow errors"""
+    """
+    Create DataFrame safely converting UUID objects to strings to avoid PyArrow errors
+
+    Conversion is column-oriented: every object column is classified once with
+    pandas' type inference and converted in a single vectorized step. UUID and
+    mixed columns become strings, Decimals float64, dates datetime64, and missing
+    text shows as 'N/A'. Numeric, boolean and datetime columns keep their dtype.
+    """
     import pandas as pd
     
-    if not data:
+    if isinstance(data, pd.DataFrame):
+        df = data.copy()
+    elif not data:
         return pd.DataFrame()
-    
-    # Convert UUID objects to strings in the data
-    safe_data = []
-    for row in data:
-        safe_row = {}
-        for key, value in row.items():
-            if isinstance(value, uuid.UUID):
-                safe_row[key] = str(value)
-            elif value is None:
-                safe_row[key] = 'N/A'
-            else:
-                safe_row[key] = value
-        safe_data.append(safe_row)
-    
-    df = pd.DataFrame(safe_data)
-    
-    # Additional safety check for object columns that might contain UUIDs
+    else:
+        df = pd.DataFrame.from_records(data)
+
     for col in df.columns:
-        if df[col].dtype == 'object':
-            df[col] = df[col].apply(lambda x: str(x) if x is not None else 'N/A')
-    
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            df[col] = _safe_object_column(df[col])
+
     return df
 
+def _safe_object_column(series):
+    """Convert one object column to an Arrow-friendly dtype"""
+    import pandas as pd
+
+    kind = pd.api.types.infer_dtype(series, skipna=True)
+    try:
+        if kind in ('string', 'empty'):
+            return series.fillna('N/A')
+        if kind in ('integer', 'floating', 'mixed-integer-float', 'decimal'):
+            return pd.to_numeric(series).astype('float64') if kind == 'decimal' else pd.to_numeric(series)
+        if kind == 'boolean':
+            return series.astype('boolean')
+        if kind in ('date', 'datetime', 'datetime64'):
+            return pd.to_datetime(series)
+    except (ValueError, TypeError, OverflowError, pd.errors.OutOfBoundsDatetime):
+        # Out-of-range dates, mixed time zones etc. - fall back to text
+        pass
+
+    # UUIDs and genuinely mixed columns: stringify everything in one pass
+    missing = series.isna()
+    result = series.astype(str)
+    result[missing] = 'N/A'
+    return result
+
 def log_activity(activity_type, object_type, object_id, action, description=None, project_id=None, extra_data=None):
     """Log user activity to activity_log table"""
     try:
@@ -351,114 +454,28 @@ def log_activity(activity_type, object_type, object_id, action, description=None
         print(f"Activity logging error: {str(e)}")
 
 def get_suggested_materials_for_stage(stage_name):
-    """Get suggested materials for a work stage with typical quantities"""
+    """
+    Get suggested materials for a work stage with typical quantities
+
+    Served from the cached stage catalog; current_stock is the available
+    warehouse quantity (total - reserved).
+    """
     try:
-        from models import MaterialStageMapping, Material
-        from database import get_session
-        session = get_session()
-        
-        suggestions = session.query(
-            MaterialStageMapping, Material
-        ).join(
-            Material, MaterialStageMapping.material_id == Material.id
-        ).filter(
-            MaterialStageMapping.stage_name == stage_name
-        ).order_by(
-            MaterialStageMapping.is_required.desc(),
-            Material.name
-        ).all()
-        
-        result = []
-        for mapping, material in suggestions:
-            result.append({
-                'material_id': material.id,
-                'material_name': material.name,
-                'unit': material.unit,
-                'typical_quantity': float(mapping.typical_quantity) if mapping.typical_quantity else 0,
-                'is_required': mapping.is_required,
-                'notes': mapping.notes,
-                'current_stock': 100  # Default stock for demo - would come from stock locations in real system
-            })
-        
-        return result
-        
+        from material_catalog import suggested_materials
+        return suggested_materials(stage_name)
     except Exception as e:
         st.error(f"Error getting material suggestions: {str(e)}")
         return []
-    finally:
-        session.close()
 
 def populate_default_material_mappings():
-    """Populate default material mappings for work stages"""
+    """Populate default material mappings for work stages (idempotent)"""
     try:
-        from models import MaterialStageMapping, Material
-        from database import get_session
-        session = get_session()
-        
-        # Check if already populated
-        existing = session.query(MaterialStageMapping).first()
-        if existing:
-            return
-        
-        # Default mappings based on typical fiber construction stages
-        default_mappings = {
-            'stage_1_plan': [],  # Planning - no materials needed
-            'stage_2_excavation': [
-                ('Fiber Cable - Single Mode', 100, True, 'Typical cable per 100m segment'),
-                ('Conduit Pipe', 105, True, 'Extra 5% for curves and connections'),
-            ],
-            'stage_3_conduit': [
-                ('Conduit Pipe', 100, True, 'Main conduit installation'),
-                ('Conduit Connectors', 5, True, 'For joining sections'),
-                ('Warning Tape', 100, True, 'Buried cable warning'),
-            ],
-            'stage_4_cable': [
-                ('Fiber Cable - Single Mode', 100, True, 'Main fiber cable'),
-                ('Cable Lubricant', 1, True, 'For easier pulling'),
-                ('Cable Markers', 10, False, 'Distance markers'),
-            ],
-            'stage_5_splice': [
-                ('Splice Closure', 2, True, 'Connection points'),
-                ('Fiber Splice Sleeves', 12, True, 'Individual fiber splicing'),
-                ('Cleaning Supplies', 1, True, 'Fiber cleaning kit'),
-            ],
-            'stage_6_test': [
-                ('Testing Equipment', 1, False, 'OTDR testing'),
-                ('Test Cables', 2, True, 'Reference cables'),
-            ],
-            'stage_7_connect': [
-                ('Fiber Connectors', 4, True, 'End connections'),
-                ('Connector Boots', 4, True, 'Protection'),
-                ('Adapter Plates', 2, True, 'Wall/cabinet mounting'),
-            ],
-            'stage_8_final': [
-                ('Documentation Supplies', 1, True, 'Labels and documentation'),
-                ('Protective Covers', 2, True, 'Final protection'),
-            ],
-            'stage_9_cleanup': [
-                ('Cleanup Supplies', 1, True, 'Site restoration materials'),
-            ],
-            'stage_10_inspect': []  # Inspection - no materials needed
-        }
-        
-        for stage_name, materials in default_mappings.items():
-            for material_name, quantity, required, notes in materials:
-                # Try to find material by name
-                material = session.query(Material).filter(Material.name == material_name).first()
-                if material:
-                    mapping = MaterialStageMapping(
-                        stage_name=stage_name,
-                        material_id=material.id,
-                        typical_quantity=quantity,
-                        is_required=required,
-                        notes=notes
-                    )
-                    session.add(mapping)
-        
-        session.commit()
-        
+        from database import get_database_engine
+        from seeds import seed_material_stage_mappings
+        from material_catalog import invalidate_stage_catalog
+        with get_database_engine().begin() as conn:
+            inserted = seed_material_stage_mappings(conn)
+        if inserted:
+            invalidate_stage_catalog()
     except Exception as e:
-        session.rollback()
         st.error(f"Error populating material mappings: {str(e)}")
-    finally:
-        session.close()
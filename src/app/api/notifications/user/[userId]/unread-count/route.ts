@@ -20,11 +20,13 @@ export async function GET(
       );
     }
 
-    const { count, error } = await supabase
-      .from('in_app_notifications')
-      .select('*', { count: 'exact', head: true })
+    // Counter kept current by triggers on in_app_notifications; a user
+    // without notifications has no row yet
+    const { data, error } = await supabase
+      .from('notification_unread_counts')
+      .select('unread_count')
       .eq('user_id', userId)
-      .eq('is_read', false);
+      .maybeSingle();
 
     if (error) {
       console.error('Supabase unread count error:', error);
@@ -34,7 +36,7 @@ export async function GET(
       );
     }
 
-    return NextResponse.json({ count: count || 0 });
+    return NextResponse.json({ count: data?.unread_count ?? 0 });
   } catch (error) {
     console.error('Unread count API error:', error);
     return NextResponse.json(
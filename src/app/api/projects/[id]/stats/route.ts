@@ -49,7 +49,7 @@ export async function GET(
       // Work entries statistics
       supabase
         .from('work_entries')
-        .select('id, approved_by, meters_done_m')
+        .select('id, approved, meters_done_m')
         .eq('project_id', projectId),
 
       // Team members count (using crews table)
@@ -80,7 +80,7 @@ export async function GET(
 
     if (workEntriesResult.data) {
       workEntries = workEntriesResult.data.length;
-      pendingApprovals = workEntriesResult.data.filter(entry => !entry.approved_by).length;
+      pendingApprovals = workEntriesResult.data.filter(entry => entry.approved !== true).length;
       completedLength = workEntriesResult.data.reduce(
         (sum, entry) => sum + (entry.meters_done_m || 0),
         0